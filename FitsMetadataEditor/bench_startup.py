@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Startup Benchmark
+Measure cold and warm startup time of the FITS CLIs and track it over time.
+
+Cold runs use an empty bytecode cache (-X pycache_prefix pointing at a fresh
+directory), warm runs reuse a populated one. One extra run per command with
+-X importtime attributes the time to top-level imports.
+"""
+
+import sys
+import json
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Tuple
+import click
+
+HERE = Path(__file__).resolve().parent
+
+
+def default_commands(sample: Path, scratch: Path) -> List[Tuple[str, List[str]]]:
+    """Commands to benchmark; edits go to a scratch copy of the sample."""
+    edit_copy = scratch / 'edit.fits'
+    shutil.copy2(sample, edit_copy)
+    viewer = str(HERE / 'fits_metadata_viewer.py')
+    editor = str(HERE / 'fits_metadata_editor.py')
+    return [
+        ('viewer --help', [viewer, '--help']),
+        ('viewer ndjson', [viewer, str(sample), '--all-hdus', '--format', 'ndjson']),
+        ('viewer table', [viewer, str(sample), '--all-hdus']),
+        ('editor --help', [editor, '--help']),
+        ('editor update', [editor, '--no-backup', 'update', str(edit_copy), '-k', 'OBSERVER', '-v', 'bench']),
+    ]
+
+
+def run_once(argv: List[str], pycache: str, importtime: bool = False) -> Tuple[float, str]:
+    """
+    Run a command in a fresh interpreter.
+
+    Args:
+        argv: Script and arguments
+        pycache: Bytecode cache directory
+        importtime: Whether to collect -X importtime output
+
+    Returns:
+        Tuple (wall time in ms, stderr)
+    """
+    cmd = [sys.executable, '-X', f'pycache_prefix={pycache}']
+    if importtime:
+        cmd += ['-X', 'importtime']
+    t0 = time.perf_counter()
+    proc = subprocess.run(cmd + argv, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                          text=True, cwd=HERE)
+    elapsed = (time.perf_counter() - t0) * 1000
+    if proc.returncode != 0:
+        raise RuntimeError(f"{' '.join(argv)} failed: {proc.stderr.strip()[-500:]}")
+    return elapsed, proc.stderr
+
+
+def top_imports(importtime_output: str, limit: int = 5) -> List[Tuple[str, float]]:
+    """
+    Extract the slowest top-level imports from -X importtime output.
+
+    Returns:
+        List of (module, cumulative ms), slowest first
+    """
+    imports = []
+    for line in importtime_output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if not name.startswith('  '):  # Top level: one leading space only
+            imports.append((name.strip(), int(cumulative) / 1000))
+    return sorted(imports, key=lambda item: item[1], reverse=True)[:limit]
+
+
+def benchmark(commands: List[Tuple[str, List[str]]], runs: int) -> Dict[str, Dict]:
+    """Run cold, warm and importtime measurements for each command."""
+    results = {}
+    warm_cache = tempfile.mkdtemp(prefix='bench_pycache_')
+    try:
+        for name, argv in commands:
+            cold = []
+            for _ in range(runs):
+                cold_cache = tempfile.mkdtemp(prefix='bench_pycache_')
+                try:
+                    cold.append(run_once(argv, cold_cache)[0])
+                finally:
+                    shutil.rmtree(cold_cache, ignore_errors=True)
+            run_once(argv, warm_cache)  # Populate the bytecode cache
+            warm = [run_once(argv, warm_cache)[0] for _ in range(runs)]
+            _, stderr = run_once(argv, warm_cache, importtime=True)
+            results[name] = {
+                'cold_ms': round(statistics.median(cold), 1),
+                'warm_ms': round(statistics.median(warm), 1),
+                'top_imports': [[module, round(ms, 1)] for module, ms in top_imports(stderr)],
+            }
+    finally:
+        shutil.rmtree(warm_cache, ignore_errors=True)
+    return results
+
+
+def load_previous(history: Path) -> Dict[str, Dict]:
+    """Return the results of the last recorded run, if any."""
+    if not history.exists():
+        return {}
+    lines = [line for line in history.read_text().splitlines() if line.strip()]
+    return json.loads(lines[-1])['results'] if lines else {}
+
+
+@click.command()
+@click.option('--runs', '-n', default=5, type=int, help='Runs per command and mode (median is reported)')
+@click.option('--sample', default=str(HERE / 'sample.fits'), type=click.Path(exists=True),
+              help='FITS file used by the commands')
+@click.option('--history', default=str(HERE / 'startup_history.jsonl'), type=click.Path(),
+              help='JSON lines file the results are appended to')
+@click.option('--no-record', is_flag=True, help='Do not append to the history file')
+def main(runs: int, sample: str, history: str, no_record: bool):
+    """
+    Benchmark CLI startup (cold/warm) and compare with the previous run.
+
+    Examples:
+        bench_startup.py
+        bench_startup.py --runs 10 --no-record
+    """
+    from tabulate import tabulate
+
+    history_path = Path(history)
+    previous = load_previous(history_path)
+    with tempfile.TemporaryDirectory(prefix='bench_startup_') as scratch:
+        results = benchmark(default_commands(Path(sample).resolve(), Path(scratch)), runs)
+
+    table = []
+    for name, r in results.items():
+        before = previous.get(name, {}).get('warm_ms')
+        delta = f"{r['warm_ms'] - before:+.1f}" if before is not None else ''
+        slowest = ', '.join(f"{m} {ms:.0f}" for m, ms in r['top_imports'][:3])
+        table.append([name, r['cold_ms'], r['warm_ms'], delta, slowest])
+    click.echo(tabulate(table, headers=['Command', 'Cold ms', 'Warm ms', 'Δ warm', 'Slowest imports (ms)'],
+                        tablefmt='simple'))
+
+    if not no_record:
+        record = {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': sys.version.split()[0],
+            'runs': runs,
+            'results': results,
+        }
+        with open(history_path, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+        click.echo(f"\nRecorded in {history_path}")
+
+
+if __name__ == '__main__':
+    main()
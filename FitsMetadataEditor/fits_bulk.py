@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+FITS Bulk Editing API
+Header edits on many files from Python, with structured results and no console I/O.
+
+    from fits_bulk import BulkEditor
+
+    jobs = [
+        ('obs1.fits', 0, [{'action': 'set', 'keyword': 'OBSERVER', 'value': 'Yamada'}]),
+        ('obs2.fits', 'SCI', [{'action': 'set', 'keyword': 'MJD-OBS', 'expr': 'mjd(DATE_OBS)'},
+                              {'action': 'delete', 'keyword': 'TMPKEY'}]),
+    ]
+    with BulkEditor(workers=4, backup=False) as bulk:
+        for result in bulk.run(jobs):
+            if not result['ok']:
+                log.warning("%s: %s", result['file'], result['error'] or result['results'])
+
+A job is (file, hdu, ops), or a dict with those keys. hdu is an index, an
+EXTNAME or (EXTNAME, EXTVER); ops are batch operations as in the batch/rules
+JSON files (literal "value" or computed "expr", optional "when"; see
+fits_rules). All jobs for one file are applied in a single open/save pass, in
+the order given; different files are processed in parallel over threads or
+processes.
+
+Nothing is printed. Every outcome is in the result dicts, one per job in job
+order, and a failing job or file never stops the others:
+
+    {'file': 'obs2.fits', 'hdu': 1, 'ok': True, 'saved': True,
+     'backup': 'obs2_backup_20250101_120000.fits', 'backup_error': None,
+     'results': [{'keyword': 'MJD-OBS', 'action': 'set', 'status': 'apply', 'value': 60310.5, ...}],
+     'error': None, 'error_type': None, 'warnings': [], 'elapsed_s': 0.004}
+
+'results' holds one entry per op in the format of the rules command (status
+'apply', 'unchanged', 'skipped' or 'error'). 'error' and 'error_type' are set
+when the whole job failed, e.g. HDUError for an unknown EXTNAME or SaveError;
+'ok' is true only if neither the job nor any op failed. 'saved', 'backup',
+'warnings' and 'elapsed_s' describe the file's pass and are shared by its jobs.
+
+Warnings are reported for every file in serial and process mode. Warning
+filters are process-wide, so thread mode leaves the caller's filters alone; a
+warning Python shows only once by default is then reported for only one of the
+files that raised it.
+"""
+
+import os
+import time
+import threading
+import warnings
+from concurrent.futures import Executor, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Mapping, NamedTuple, Optional, Sequence, Tuple, Union
+
+from fits_metadata_editor import FITSMetadataEditor, HDUSpec
+from fits_profile import Hook
+from fits_headers import header_values
+from fits_pool import chunksize, process_pool
+from fits_rules import apply_rules, compile_rules, plan_header
+
+PARALLEL_MODES = ['thread', 'process']
+
+_local = threading.local()
+_hook_lock = threading.Lock()
+_hook_installed = False
+
+
+class EditJob(NamedTuple):
+    """Edits for one HDU of one file."""
+    file: str
+    hdu: HDUSpec = 0
+    ops: Sequence[Dict[str, Any]] = ()
+
+
+def as_job(job: Union[EditJob, Mapping[str, Any], Sequence[Any]]) -> EditJob:
+    """Normalize a (file, hdu, ops) tuple or a {'file', 'hdu', 'ops'} dict to an EditJob."""
+    if isinstance(job, EditJob):
+        return job
+    if isinstance(job, Mapping):
+        return EditJob(str(job['file']), job.get('hdu', 0), job.get('ops', ()))
+    return EditJob(str(job[0]), *job[1:])
+
+
+def _install_warning_hook() -> None:
+    """
+    Route Python warnings raised inside edit_file() to its results.
+
+    Installed once per process and never removed: warnings raised while no
+    file pass runs in the current thread go to the previous showwarning.
+    """
+    global _hook_installed
+    with _hook_lock:
+        if _hook_installed:
+            return
+        shown = warnings.showwarning
+
+        def showwarning(message, category, filename, lineno, file=None, line=None):
+            captured = getattr(_local, 'warnings', None)
+            if captured is None:
+                shown(message, category, filename, lineno, file, line)
+            else:
+                captured.append(f"{category.__name__}: {message}")
+
+        warnings.showwarning = showwarning
+        _hook_installed = True
+
+
+def _report_every_warning() -> None:
+    """Report repeated warnings for every file, not once; ignored warnings stay ignored."""
+    warnings.filterwarnings('always', append=True)
+
+
+def _init_worker() -> None:
+    # The worker process is ours: its filters can be changed for its whole life
+    _install_warning_hook()
+    _report_every_warning()
+
+
+def _new_result(job: EditJob) -> Dict[str, Any]:
+    return {'file': job.file, 'hdu': None, 'ok': False, 'saved': False, 'backup': None,
+            'backup_error': None, 'results': [], 'error': None, 'error_type': None,
+            'warnings': [], 'elapsed_s': 0.0}
+
+
+def _fail(result: Dict[str, Any], error: Exception) -> None:
+    result['error'] = str(error)
+    result['error_type'] = type(error).__name__
+
+
+def edit_file(path: str, jobs: Sequence[EditJob], backup: bool = True, dry_run: bool = False,
+              hooks: Optional[List[Hook]] = None) -> List[Dict[str, Any]]:
+    """
+    Apply the jobs of one file in a single open/save pass.
+
+    Args:
+        path: FITS file (the jobs' own file names are only reported)
+        jobs: Jobs for this file, applied in order
+        backup: Back up the file before saving (only if something changes)
+        dry_run: Evaluate the ops without modifying the file
+        hooks: Profiling hooks for the editor (see fits_profile)
+
+    Returns:
+        One result per job, in order (see the module docstring)
+    """
+    start = time.perf_counter()
+    results = [_new_result(job) for job in jobs]
+    captured: List[str] = []
+    _local.warnings = captured
+    editor = None
+    try:
+        editor = FITSMetadataEditor(path, backup=backup, hooks=hooks)
+        editor.load_file()
+        planned: Dict[int, Dict[str, Any]] = {}  # Dry run: values as edited by earlier jobs
+        for job, result in zip(jobs, results):
+            try:
+                rules = compile_rules(list(job.ops))
+                index = result['hdu'] = editor.resolve_hdu(job.hdu)
+                with editor.phase('rules'):
+                    if dry_run:
+                        if index not in planned:
+                            planned[index] = header_values(editor.hdulist[index].header)
+                        result['results'] = plan_header(rules, planned[index])
+                    else:
+                        result['results'] = apply_rules(editor, index, rules)
+            except Exception as e:
+                _fail(result, e)
+        if editor.modified and not dry_run:
+            backup_path = editor.create_backup(quiet=True)
+            saved = editor.save(quiet=True)
+            for result in results:
+                result['saved'] = saved
+                result['backup'] = str(backup_path) if backup_path else None
+                result['backup_error'] = editor.backup_error
+    except Exception as e:
+        # Opening or saving failed: no job of this file took effect
+        for result in results:
+            _fail(result, e)
+            result['saved'] = False
+    finally:
+        try:
+            if editor is not None and editor.hdulist is not None:
+                editor.close()
+        finally:
+            _local.warnings = None
+    elapsed = time.perf_counter() - start
+    for result in results:
+        result['ok'] = result['error'] is None and all(r['status'] != 'error' for r in result['results'])
+        result['warnings'] = list(captured)
+        result['elapsed_s'] = elapsed
+    return results
+
+
+def _edit_group(group: Tuple[str, List[EditJob]], backup: bool, dry_run: bool,
+                hooks: Optional[List[Hook]] = None) -> List[Dict[str, Any]]:
+    path, jobs = group
+    return edit_file(path, jobs, backup, dry_run, hooks)
+
+
+class BulkEditor:
+    """
+    Context manager applying (file, hdu, ops) jobs, optionally in parallel.
+
+    The worker pool is started on first use and kept until the context exits,
+    so one BulkEditor can run many batches.
+    """
+
+    def __init__(self, workers: Optional[int] = 1, parallel: str = 'thread', backup: bool = True,
+                 dry_run: bool = False, hooks: Optional[List[Hook]] = None):
+        """
+        Initialize the bulk editor.
+
+        Args:
+            workers: Files processed at once (1: in the calling thread,
+                None: CPU count)
+            parallel: 'thread' or 'process'. Threads start instantly and share
+                the hooks; processes scale past the GIL for CPU-heavy ops
+                (checksums, .fits.gz rewrites) but need picklable ops
+            backup: Back up each file before its first change
+            dry_run: Evaluate ops without modifying any file
+            hooks: Profiling hooks (see fits_profile); serial and thread mode only
+
+        Raises:
+            ValueError: For an unknown parallel mode, or hooks with processes
+        """
+        if parallel not in PARALLEL_MODES:
+            raise ValueError(f"Unknown parallel mode '{parallel}' (expected one of {PARALLEL_MODES})")
+        self.workers = workers or os.cpu_count() or 1
+        self.parallel = parallel
+        if hooks and self.workers > 1 and parallel == 'process':
+            raise ValueError("Profiling hooks cannot be used with process workers")
+        self.backup = backup
+        self.dry_run = dry_run
+        self.hooks = list(hooks or [])
+        self.pool: Optional[Executor] = None
+
+    def __enter__(self) -> 'BulkEditor':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Shut down the worker pool (waits for running files)."""
+        if self.pool is not None:
+            self.pool.shutdown(wait=True)
+            self.pool = None
+
+    def _pool(self) -> Executor:
+        if self.pool is None:
+            if self.parallel == 'process':
+                self.pool = process_pool(self.workers, _init_worker)
+            else:
+                self.pool = ThreadPoolExecutor(self.workers, thread_name_prefix='fits-bulk')
+        return self.pool
+
+    def run(self, jobs: Iterable[Union[EditJob, Mapping[str, Any], Sequence[Any]]]) -> List[Dict[str, Any]]:
+        """
+        Apply jobs and wait for all of them.
+
+        Args:
+            jobs: (file, hdu, ops) tuples, {'file', 'hdu', 'ops'} dicts or EditJobs
+
+        Returns:
+            One result dict per job, in job order
+        """
+        jobs = [as_job(job) for job in jobs]
+        # Group by file so each is opened and saved once, by one worker
+        groups: Dict[str, Tuple[List[int], List[EditJob]]] = {}
+        for position, job in enumerate(jobs):
+            positions, file_jobs = groups.setdefault(str(Path(job.file).resolve()), ([], []))
+            positions.append(position)
+            file_jobs.append(job)
+        work = [(path, file_jobs) for path, (_, file_jobs) in groups.items()]
+
+        _install_warning_hook()
+        if self.workers == 1 or len(work) < 2:
+            with warnings.catch_warnings():
+                _report_every_warning()
+                ordered = [_edit_group(group, self.backup, self.dry_run, self.hooks) for group in work]
+        elif self.parallel == 'process':
+            ordered = list(self._pool().map(_edit_group, work, [self.backup] * len(work), [self.dry_run] * len(work),
+                                            chunksize=chunksize(len(work), self.workers)))
+        else:
+            # Filters are process-wide and shared with the caller's threads, so they
+            # are left alone: a warning Python already showed once may not be reported again
+            ordered = list(self._pool().map(_edit_group, work, [self.backup] * len(work),
+                                            [self.dry_run] * len(work), [self.hooks] * len(work)))
+
+        results: List[Optional[Dict[str, Any]]] = [None] * len(jobs)
+        for (positions, _), file_results in zip(groups.values(), ordered):
+            for position, result in zip(positions, file_results):
+                results[position] = result
+        return results
+
+    def edit(self, file: str, hdu: HDUSpec, ops: Sequence[Dict[str, Any]]) -> Dict[str, Any]:
+        """Apply one job (see run()) and return its result."""
+        return self.run([EditJob(str(file), hdu, ops)])[0]
@@ -0,0 +1,453 @@
+#!/usr/bin/env python3
+"""
+FITS Header Reader
+Low-level helpers for locating and reading FITS header blocks without astropy.
+
+This module only uses the standard library; it is the fast path for read-only
+header access and is safe to import from CLI entry points.
+
+Headers are read block by block and data units are skipped using their size
+computed from BITPIX/NAXISn/PCOUNT/GCOUNT, so reading the first header of a
+gzip-compressed file only inflates the first few blocks.
+"""
+
+import array
+import gzip
+import re
+import sys
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+BLOCK_SIZE = 2880
+CARD_SIZE = 80
+FITS_SUFFIXES = ['.fits', '.fit', '.fts']
+GZIP_SUFFIX = '.gz'
+TILE_SUFFIX = '.fz'
+QUOTED_STRING = re.compile(r"'((?:[^']|'')*)'")
+
+# Keywords the primary header must carry; the editor refuses to delete them
+MANDATORY_KEYWORDS = ('SIMPLE', 'BITPIX', 'NAXIS', 'EXTEND')
+
+# Cards that carry text rather than a keyword value
+COMMENTARY_KEYWORDS = ('', 'COMMENT', 'HISTORY')
+
+# Keywords of a tile-compressed HDU's binary table that describe the table
+# layout or the compression itself; changing them would corrupt the image
+TILE_RESERVED_KEYWORDS = re.compile(
+    r'^(XTENSION|BITPIX|NAXIS\d*|PCOUNT|GCOUNT|TFIELDS|THEAP|'
+    r'T(TYPE|FORM|UNIT|NULL|SCAL|ZERO|DISP|DIM)\d+|'
+    r'ZIMAGE|ZCMPTYPE|ZBITPIX|ZNAXIS\d*|ZTILE\d+|ZNAME\d+|ZVAL\d+|ZMASKCMP|ZQUANTIZ|'
+    r'ZDITHER0|ZSIMPLE|ZTENSION|ZEXTEND|ZBLOCKED|ZPCOUNT|ZGCOUNT|ZHECKSUM|ZDATASUM|'
+    r'ZBLANK|ZSCALE|ZZERO|ZTHEAP)$'
+)
+
+
+def import_fits():
+    """
+    Import astropy.io.fits on first use.
+
+    The astropy import dominates CLI startup time, so the tools only load it
+    for commands that need it. FITS verification warnings are suppressed for
+    better output.
+
+    Returns:
+        The astropy.io.fits module
+    """
+    import warnings
+    from astropy.io import fits
+    warnings.filterwarnings('ignore', category=fits.verify.VerifyWarning)
+    return fits
+
+
+def split_fits_name(path: Path) -> Tuple[str, str]:
+    """
+    Split a FITS file name into stem and full FITS suffix.
+
+    Args:
+        path: File path
+
+    Returns:
+        Tuple (stem, suffix), e.g. ('obs', '.fits.gz') for obs.fits.gz
+    """
+    name = path.name
+    lower = name.lower()
+    for suffix in FITS_SUFFIXES:
+        for full in (suffix + GZIP_SUFFIX, suffix + TILE_SUFFIX, suffix):
+            if lower.endswith(full):
+                return name[:-len(full)], name[-len(full):]
+    if lower.endswith(TILE_SUFFIX):
+        return name[:-len(TILE_SUFFIX)], name[-len(TILE_SUFFIX):]
+    raise ValueError(f"File does not appear to be a FITS file: {path}")
+
+
+def compression_of(path: Path) -> Optional[str]:
+    """
+    Determine how a FITS file is compressed from its name.
+
+    Args:
+        path: File path
+
+    Returns:
+        'gzip' for .fits.gz, 'tile' for .fz, None for plain FITS
+
+    Raises:
+        ValueError: If the name does not look like a FITS file
+    """
+    suffix = split_fits_name(path)[1].lower()
+    if suffix.endswith(GZIP_SUFFIX):
+        return 'gzip'
+    if suffix.endswith(TILE_SUFFIX):
+        return 'tile'
+    return None
+
+
+def open_raw(path: Path) -> BinaryIO:
+    """Open a FITS file as an uncompressed byte stream (gzip is inflated on the fly)."""
+    if compression_of(path) == 'gzip':
+        return gzip.open(path, 'rb')
+    return open(path, 'rb')
+
+
+def parse_card(card: bytes) -> Tuple[str, Optional[Any]]:
+    """
+    Parse the keyword and value of a single 80-byte card.
+
+    Only the value forms needed for structural keywords are decoded
+    (integers, floats, logicals and quoted strings).
+
+    Args:
+        card: Raw card bytes
+
+    Returns:
+        Tuple (keyword, value); value is None for cards without a value
+    """
+    keyword = card[:8].decode('ascii', 'replace').strip()
+    if card[8:10] != b'= ':
+        return keyword, None
+    text = card[10:].decode('ascii', 'replace').strip()
+    if text.startswith("'"):
+        # Quoted string, '' is an escaped quote
+        match = QUOTED_STRING.match(text)
+        return keyword, (match.group(1) if match else text[1:]).replace("''", "'").rstrip()
+    text = text.split('/', 1)[0].strip()
+    if text in ('T', 'F'):
+        return keyword, text == 'T'
+    try:
+        return keyword, int(text)
+    except ValueError:
+        pass
+    try:
+        return keyword, float(text.replace('D', 'E'))
+    except ValueError:
+        return keyword, text or None
+
+
+class Card(NamedTuple):
+    """A parsed header card, with the same fields as astropy's Card."""
+    keyword: str
+    value: Any
+    comment: str
+
+
+def _split_value_comment(text: str) -> Tuple[Any, str]:
+    """Parse the value/comment field (columns 11-80) of a card."""
+    stripped = text.lstrip()
+    if stripped.startswith("'"):
+        match = QUOTED_STRING.match(stripped)
+        if match:
+            rest = stripped[match.end():]
+            comment = rest.split('/', 1)[1].strip() if '/' in rest else ''
+            return match.group(1).replace("''", "'").rstrip(), comment
+    value_text, _, comment = text.partition('/')
+    value_text = value_text.strip()
+    comment = comment.strip()
+    if not value_text:
+        return None, comment
+    if value_text in ('T', 'F'):
+        return value_text == 'T', comment
+    if value_text.startswith('('):
+        parts = value_text.strip('()').split(',')
+        if len(parts) == 2:
+            try:
+                return complex(float(parts[0].replace('D', 'E')), float(parts[1].replace('D', 'E'))), comment
+            except ValueError:
+                pass
+    try:
+        return int(value_text), comment
+    except ValueError:
+        pass
+    try:
+        return float(value_text.replace('D', 'E')), comment
+    except ValueError:
+        return value_text, comment
+
+
+def parse_header_cards(header_bytes: bytes) -> List[Card]:
+    """
+    Parse all cards of a header without astropy.
+
+    Handles commentary cards, HIERARCH keywords and CONTINUE long strings the
+    way astropy presents them (keyword without HIERARCH, concatenated values).
+
+    Args:
+        header_bytes: Raw header bytes up to the END card
+
+    Returns:
+        List of cards in header order (END excluded)
+    """
+    cards: List[Card] = []
+    text = header_bytes.decode('ascii', 'replace')
+    for i in range(0, len(text), CARD_SIZE):
+        image = text[i:i + CARD_SIZE]
+        keyword = image[:8].rstrip()
+        if keyword == 'END':
+            break
+        if keyword == 'CONTINUE' and cards and isinstance(cards[-1].value, str) \
+                and cards[-1].value.endswith('&'):
+            value, comment = _split_value_comment(image[8:])
+            previous = cards[-1]
+            value = value if isinstance(value, str) else ''
+            comments = ' '.join(c for c in (previous.comment, comment) if c)
+            cards[-1] = Card(previous.keyword, previous.value[:-1] + value, comments)
+            continue
+        if keyword == 'HIERARCH' and '=' in image:
+            name, _, rest = image[9:].partition('=')
+            value, comment = _split_value_comment(rest)
+            cards.append(Card(name.strip(), value, comment))
+        elif image[8:10] == '= ':
+            value, comment = _split_value_comment(image[10:])
+            cards.append(Card(keyword.strip(), value, comment))
+        else:
+            # Commentary card (COMMENT, HISTORY, blank keyword, ...)
+            cards.append(Card(keyword.strip(), image[8:].rstrip(), ''))
+    return cards
+
+
+class RawHeader:
+    """
+    Read-only header parsed without astropy.
+
+    Offers the subset of astropy's Header interface the viewer uses:
+    cards, get(), len() and keyword membership.
+    """
+
+    def __init__(self, cards: List[Card]):
+        self.cards = cards
+        self._index: Dict[str, Any] = {}
+        for card in cards:
+            self._index.setdefault(card.keyword.upper(), card.value)
+
+    @classmethod
+    def fromstring(cls, header_bytes: bytes) -> 'RawHeader':
+        """Parse raw header bytes."""
+        return cls(parse_header_cards(header_bytes))
+
+    def get(self, keyword: str, default: Any = None) -> Any:
+        return self._index.get(keyword.upper(), default)
+
+    def __contains__(self, keyword: str) -> bool:
+        return keyword.upper() in self._index
+
+    def __len__(self) -> int:
+        return len(self.cards)
+
+
+def header_values(header: Any) -> Dict[str, Any]:
+    """
+    Keyword values of a header, without commentary cards (first occurrence wins).
+
+    Args:
+        header: RawHeader or astropy Header
+
+    Returns:
+        Dict of keyword to value
+    """
+    values: Dict[str, Any] = {}
+    for card in header.cards:
+        if card.keyword not in COMMENTARY_KEYWORDS:
+            values.setdefault(card.keyword, card.value)
+    return values
+
+
+def checksum32(data: bytes, sum32: int = 0) -> int:
+    """
+    Compute the 32-bit ones'-complement sum used by CHECKSUM/DATASUM.
+
+    Ones'-complement addition is associative, so sums of separate regions
+    (e.g. header and data unit) can be combined by passing one as sum32.
+
+    Args:
+        data: Bytes to sum as big-endian 32-bit words (zero-padded)
+        sum32: Sum of preceding regions
+
+    Returns:
+        Ones'-complement sum
+    """
+    if len(data) % 4:
+        data = bytes(data) + b'\0' * (4 - len(data) % 4)
+    words = array.array('I', data)
+    if sys.byteorder == 'little':
+        words.byteswap()
+    total = sum(words) + sum32
+    while total >> 32:
+        total = (total & 0xFFFFFFFF) + (total >> 32)
+    return total
+
+
+_CHECKSUM_EXCLUDE = (0x3A, 0x3B, 0x3C, 0x3D, 0x3E, 0x3F, 0x40,
+                     0x5B, 0x5C, 0x5D, 0x5E, 0x5F, 0x60)
+
+
+def encode_checksum(value: int) -> str:
+    """
+    Encode a 32-bit checksum as the 16 ASCII characters of a CHECKSUM card.
+
+    Implements the encoding of the FITS checksum convention: every byte is
+    spread over four alphanumeric characters and the result rotated by one.
+
+    Args:
+        value: Complemented ones'-complement sum
+
+    Returns:
+        16-character string
+    """
+    asc = [0] * 16
+    for i in range(4):
+        byte = (value >> (24 - 8 * i)) & 0xFF
+        quotient = byte // 4 + ord('0')
+        ch = [quotient + byte % 4, quotient, quotient, quotient]
+        check = True
+        while check:
+            check = False
+            for j in (0, 2):
+                if ch[j] in _CHECKSUM_EXCLUDE or ch[j + 1] in _CHECKSUM_EXCLUDE:
+                    ch[j] += 1
+                    ch[j + 1] -= 1
+                    check = True
+        for j in range(4):
+            asc[4 * j + i] = ch[j]
+    return ''.join(chr(asc[(i + 15) % 16]) for i in range(16))
+
+
+def header_checksum(header_bytes: bytes, datasum: int) -> str:
+    """
+    Compute the CHECKSUM value of an HDU from its header and stored DATASUM.
+
+    The data unit enters only through its sum, so the cost is O(header).
+
+    Args:
+        header_bytes: Padded header bytes with the CHECKSUM value set to
+            '0000000000000000'
+        datasum: DATASUM of the data unit
+
+    Returns:
+        16-character CHECKSUM value
+    """
+    return encode_checksum(~checksum32(header_bytes, datasum) & 0xFFFFFFFF)
+
+
+def read_header_bytes(f: BinaryIO) -> Optional[bytes]:
+    """
+    Read header blocks up to and including the one holding the END card.
+
+    Args:
+        f: Byte stream positioned at the start of a header
+
+    Returns:
+        Raw header bytes, or None at end of file
+
+    Raises:
+        ValueError: If the stream ends inside a header
+    """
+    blocks = []
+    while True:
+        block = f.read(BLOCK_SIZE)
+        if not block:
+            if blocks:
+                raise ValueError("Truncated FITS header (no END card)")
+            return None
+        if len(block) < BLOCK_SIZE:
+            raise ValueError("Truncated FITS header block")
+        blocks.append(block)
+        for i in range(0, BLOCK_SIZE, CARD_SIZE):
+            if block[i:i + 8] == b'END     ':
+                return b''.join(blocks)
+
+
+def structural_values(header_bytes: bytes) -> Dict[str, Any]:
+    """Collect the keywords that determine HDU type and data size."""
+    wanted = ('SIMPLE', 'XTENSION', 'BITPIX', 'NAXIS', 'PCOUNT', 'GCOUNT', 'GROUPS', 'ZIMAGE')
+    values = {}
+    for i in range(0, len(header_bytes), CARD_SIZE):
+        card = header_bytes[i:i + CARD_SIZE]
+        if card[:5] == b'NAXIS' or card[:8].rstrip().decode('ascii', 'replace') in wanted:
+            keyword, value = parse_card(card)
+            values[keyword] = value
+        elif card[:8] == b'END     ':
+            break
+    return values
+
+
+def data_unit_size(values: Dict[str, Any]) -> int:
+    """
+    Compute the size of the data unit including padding to a full block.
+
+    Args:
+        values: Structural keyword values from structural_values
+
+    Returns:
+        Size in bytes
+    """
+    naxis = values.get('NAXIS') or 0
+    if naxis == 0:
+        return 0
+    axes = [values.get(f'NAXIS{i}') or 0 for i in range(1, naxis + 1)]
+    if values.get('GROUPS') and axes[0] == 0:
+        axes = axes[1:]  # Random groups: NAXIS1 = 0 is not a real axis
+    count = 1
+    for n in axes:
+        count *= n
+    size = abs(values.get('BITPIX') or 8) // 8 * (values.get('GCOUNT') or 1) * ((values.get('PCOUNT') or 0) + count)
+    return (size + BLOCK_SIZE - 1) // BLOCK_SIZE * BLOCK_SIZE
+
+
+def hdu_type_name(index: int, values: Dict[str, Any]) -> str:
+    """Name the HDU type the way astropy's classes are named."""
+    xtension = (values.get('XTENSION') or '').strip()
+    if index == 0:
+        return 'GroupsHDU' if values.get('GROUPS') else 'PrimaryHDU'
+    if xtension == 'BINTABLE':
+        return 'CompImageHDU' if values.get('ZIMAGE') else 'BinTableHDU'
+    return {'IMAGE': 'ImageHDU', 'TABLE': 'TableHDU'}.get(xtension, 'NonstandardExtHDU')
+
+
+def iter_raw_headers(f: BinaryIO,
+                     max_hdus: Optional[int] = None) -> Iterator[Tuple[int, bytes, Dict[str, Any], int]]:
+    """
+    Iterate over the headers of a FITS byte stream, skipping data units.
+
+    On gzip streams skipping inflates and discards the data, so memory stays
+    constant; with max_hdus the stream is not read past the last needed header.
+
+    Args:
+        f: Byte stream positioned at the start of the file
+        max_hdus: Stop after this many HDUs
+
+    Yields:
+        Tuples (index, header_bytes, structural_values, header_offset)
+    """
+    index = 0
+    offset = 0
+    while max_hdus is None or index < max_hdus:
+        header_bytes = read_header_bytes(f)
+        if header_bytes is None:
+            return
+        values = structural_values(header_bytes)
+        yield index, header_bytes, values, offset
+        if max_hdus is not None and index + 1 >= max_hdus:
+            return
+        size = data_unit_size(values)
+        if size:
+            f.seek(size, 1)
+        offset += len(header_bytes) + size
+        index += 1
@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+"""
+FITS Header Index
+A columnar index of header values across many files, one row per (file, HDU).
+
+Each keyword becomes a typed NumPy column with a presence mask, so rules and
+statistics can be evaluated over a whole archive without reopening the FITS
+files. Headers are read with fits_headers (no astropy).
+
+The index is stored as an .npz archive with these arrays:
+    __path__, __hdu__, __size__, __mtime__   Row identity and file signature
+    col:<KEYWORD>                            Values (bool, int64, float64 or str)
+    mask:<KEYWORD>                           True where the keyword is present
+
+For analytics the same table can be exported as Parquet or Arrow (Feather)
+when pyarrow is installed: columns path, hdu, file_size and mtime_ns, then one
+nullable column per keyword (see export_headers).
+"""
+
+import os
+import sys
+import time
+import importlib.util
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import click
+import numpy as np
+
+from fits_headers import RawHeader, header_values, iter_raw_headers, open_raw
+from fits_pool import chunksize
+
+EXPORT_FORMATS = ['parquet', 'arrow', 'npz']
+EXPORT_SUFFIXES = {'.parquet': 'parquet', '.arrow': 'arrow', '.feather': 'arrow', '.npz': 'npz'}
+ROW_COLUMNS = ('path', 'hdu', 'file_size', 'mtime_ns')  # Lower case: never a FITS keyword
+
+
+def column_array(values: List[Any]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Build a typed column from Python values (None = missing).
+
+    bool columns stay bool, integers become int64, any mix of numbers becomes
+    float64, and everything else is stored as strings.
+
+    Args:
+        values: One value per row
+
+    Returns:
+        Tuple (values array, presence mask)
+    """
+    present = np.array([v is not None for v in values], dtype=bool)
+    kinds = {type(v) for v in values if v is not None}
+    if kinds == {bool}:
+        return np.array([bool(v) for v in values], dtype=bool), present
+    if kinds == {int}:
+        return np.array([v if v is not None else 0 for v in values], dtype=np.int64), present
+    if kinds and kinds <= {int, float}:
+        return np.array([v if v is not None else np.nan for v in values], dtype=np.float64), present
+    return np.array(['' if v is None else str(v) for v in values], dtype=str), present
+
+
+class HeaderIndex:
+    """Header values of many (file, HDU) rows as typed columns."""
+
+    def __init__(self, paths: np.ndarray, hdus: np.ndarray, sizes: np.ndarray, mtimes: np.ndarray,
+                 columns: Dict[str, np.ndarray], masks: Dict[str, np.ndarray]):
+        self.paths = paths
+        self.hdus = hdus
+        self.sizes = sizes
+        self.mtimes = mtimes
+        self.columns = columns
+        self.masks = masks
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    @classmethod
+    def from_rows(cls, rows: List[Tuple[str, int, List[int], Dict[str, Any]]]) -> 'HeaderIndex':
+        """
+        Build an index from (path, hdu, [size, mtime_ns], {keyword: value}) rows.
+        """
+        keywords: Dict[str, None] = {}
+        for _, _, _, values in rows:
+            keywords.update(dict.fromkeys(values))
+        columns, masks = {}, {}
+        for keyword in keywords:
+            columns[keyword], masks[keyword] = column_array([values.get(keyword) for *_, values in rows])
+        return cls(np.array([r[0] for r in rows], dtype=str),
+                   np.array([r[1] for r in rows], dtype=np.int64),
+                   np.array([r[2][0] for r in rows], dtype=np.int64),
+                   np.array([r[2][1] for r in rows], dtype=np.int64),
+                   columns, masks)
+
+    def select(self, rows: np.ndarray) -> 'HeaderIndex':
+        """Return the subset of rows given by a boolean mask or index array."""
+        return HeaderIndex(self.paths[rows], self.hdus[rows], self.sizes[rows], self.mtimes[rows],
+                           {k: v[rows] for k, v in self.columns.items()},
+                           {k: v[rows] for k, v in self.masks.items()})
+
+    def merge(self, other: 'HeaderIndex') -> 'HeaderIndex':
+        """
+        Return this index with the files of another one added or replaced.
+
+        Rows of files present in both are taken from other. Columns missing on
+        one side are masked there; columns whose types differ are re-typed as
+        in column_array (e.g. int and float become float).
+        """
+        base = self.select(~np.isin(self.paths, other.paths))
+        columns, masks = {}, {}
+        for keyword in dict.fromkeys([*base.columns, *other.columns]):
+            if keyword in base.columns and keyword in other.columns and \
+                    base.columns[keyword].dtype.kind == other.columns[keyword].dtype.kind:
+                columns[keyword] = np.concatenate([base.columns[keyword], other.columns[keyword]])
+                masks[keyword] = np.concatenate([base.masks[keyword], other.masks[keyword]])
+            else:
+                columns[keyword], masks[keyword] = column_array(
+                    base.column_values(keyword) + other.column_values(keyword))
+        return HeaderIndex(np.concatenate([base.paths, other.paths]),
+                           np.concatenate([base.hdus, other.hdus]),
+                           np.concatenate([base.sizes, other.sizes]),
+                           np.concatenate([base.mtimes, other.mtimes]),
+                           columns, masks)
+
+    def sort(self) -> 'HeaderIndex':
+        """Return the rows ordered by (path, HDU)."""
+        return self.select(np.lexsort((self.hdus, self.paths)))
+
+    def to_arrow(self):
+        """Convert to a pyarrow Table (missing keywords become nulls)."""
+        import pyarrow as pa
+
+        arrays = {'path': pa.array(self.paths, pa.string()), 'hdu': pa.array(self.hdus),
+                  'file_size': pa.array(self.sizes), 'mtime_ns': pa.array(self.mtimes)}
+        for keyword, values in self.columns.items():
+            arrays[keyword] = pa.array(values, mask=~self.masks[keyword])
+        return pa.table(arrays)
+
+    @classmethod
+    def from_arrow(cls, table) -> 'HeaderIndex':
+        """Build an index from a Table written by to_arrow()."""
+        import pyarrow as pa
+
+        columns, masks = {}, {}
+        for name in table.column_names:
+            if name in ROW_COLUMNS:
+                continue
+            column = table.column(name)
+            kind = column.type
+            if pa.types.is_boolean(kind) or pa.types.is_integer(kind) or pa.types.is_floating(kind):
+                fill = False if pa.types.is_boolean(kind) else 0 if pa.types.is_integer(kind) else np.nan
+                masks[name] = ~column.is_null().to_numpy()
+                values = column.fill_null(fill).to_numpy()
+                columns[name] = values if pa.types.is_boolean(kind) else \
+                    values.astype(np.int64 if pa.types.is_integer(kind) else np.float64)
+            else:
+                columns[name], masks[name] = column_array(column.to_pylist())
+        return cls(np.array(table.column('path').to_pylist(), dtype=str),
+                   table.column('hdu').to_numpy().astype(np.int64),
+                   table.column('file_size').to_numpy().astype(np.int64),
+                   table.column('mtime_ns').to_numpy().astype(np.int64),
+                   columns, masks)
+
+    def column_values(self, keyword: str) -> List[Any]:
+        """Values of a column as Python objects (None where missing or absent)."""
+        if keyword not in self.columns:
+            return [None] * len(self)
+        return [v if present else None
+                for v, present in zip(self.columns[keyword].tolist(), self.masks[keyword].tolist())]
+
+    def is_current(self, row: int) -> bool:
+        """Whether the file of a row is unchanged since it was indexed."""
+        try:
+            stat = os.stat(self.paths[row])
+        except OSError:
+            return False
+        return stat.st_size == self.sizes[row] and stat.st_mtime_ns == self.mtimes[row]
+
+    def save(self, path: str) -> None:
+        """Write the index as an .npz archive."""
+        arrays = {'__path__': self.paths, '__hdu__': self.hdus,
+                  '__size__': self.sizes, '__mtime__': self.mtimes}
+        for keyword, values in self.columns.items():
+            arrays[f'col:{keyword}'] = values
+            arrays[f'mask:{keyword}'] = self.masks[keyword]
+        with open(path, 'wb') as f:
+            np.savez(f, **arrays)
+
+    @classmethod
+    def load(cls, path: str) -> 'HeaderIndex':
+        """Read an index written by save()."""
+        with np.load(path, allow_pickle=False) as data:
+            columns = {name[4:]: data[name] for name in data.files if name.startswith('col:')}
+            masks = {name[5:]: data[name] for name in data.files if name.startswith('mask:')}
+            return cls(data['__path__'], data['__hdu__'], data['__size__'], data['__mtime__'],
+                       columns, masks)
+
+
+def build_index(files: Iterable[str], hdus: Optional[List[int]] = None) -> HeaderIndex:
+    """
+    Read the headers of many files into an index.
+
+    Args:
+        files: FITS file paths
+        hdus: HDU indices to include (default: all)
+
+    Returns:
+        HeaderIndex with one row per (file, HDU)
+    """
+    rows = []
+    for path in files:
+        rows.extend(index_rows(path, hdus))
+    return HeaderIndex.from_rows(rows)
+
+
+def index_rows(path: str, hdus: Optional[List[int]] = None) -> List[Tuple[str, int, List[int], Dict[str, Any]]]:
+    """
+    Read the index rows of one file, in the form HeaderIndex.from_rows takes.
+
+    Args:
+        path: FITS file path
+        hdus: HDU indices to include (default: all)
+    """
+    path = str(Path(path).resolve())
+    stat = os.stat(path)
+    max_hdus = max(hdus) + 1 if hdus else None
+    rows = []
+    with open_raw(Path(path)) as f:
+        for index, header_bytes, _, _ in iter_raw_headers(f, max_hdus):
+            if hdus is None or index in hdus:
+                rows.append((path, index, [stat.st_size, stat.st_mtime_ns],
+                             header_values(RawHeader.fromstring(header_bytes))))
+    return rows
+
+
+def _scan_file(path: str, hdus: Optional[List[int]]) -> Tuple[str, List[Any], Optional[str]]:
+    try:
+        return path, index_rows(path, hdus), None
+    except Exception as e:
+        return path, [], str(e)
+
+
+def scan_files(files: List[str], hdus: Optional[List[int]] = None,
+               workers: Optional[int] = None) -> Tuple[List[Any], Dict[str, str]]:
+    """
+    Read the index rows of many files over a process pool.
+
+    Args:
+        files: FITS file paths
+        hdus: HDU indices to include (default: all)
+        workers: Worker processes (default: CPU count)
+
+    Returns:
+        Tuple (rows for HeaderIndex.from_rows, {path: error} of unreadable files)
+    """
+    workers = workers or os.cpu_count() or 1
+    rows, errors = [], {}
+    if workers == 1 or len(files) < 2:
+        results = (_scan_file(path, hdus) for path in files)
+        return _gather(results, rows, errors)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return _gather(pool.map(_scan_file, files, [hdus] * len(files), chunksize=chunksize(len(files), workers)),
+                       rows, errors)
+
+
+def _gather(results, rows: List[Any], errors: Dict[str, str]) -> Tuple[List[Any], Dict[str, str]]:
+    for path, file_rows, error in results:
+        rows.extend(file_rows)
+        if error is not None:
+            errors[path] = error
+    return rows, errors
+
+
+def have_pyarrow() -> bool:
+    """Whether pyarrow can be imported (needed for Parquet and Arrow output)."""
+    return importlib.util.find_spec('pyarrow') is not None
+
+
+def export_format(path: str, output_format: Optional[str] = None) -> str:
+    """
+    Decide the export format: explicit, else from the suffix, else Parquet
+    when pyarrow is installed and .npz otherwise.
+
+    Raises:
+        ValueError: If Parquet/Arrow is requested without pyarrow
+    """
+    output_format = output_format or EXPORT_SUFFIXES.get(Path(path).suffix.lower())
+    if output_format is None:
+        output_format = 'parquet' if have_pyarrow() else 'npz'
+    if output_format != 'npz' and not have_pyarrow():
+        raise ValueError(f"{output_format} output needs pyarrow (pip install pyarrow); use a .npz file instead")
+    return output_format
+
+
+def load_export(path: str, output_format: str) -> HeaderIndex:
+    """Read an export written by save_export()."""
+    if output_format == 'npz':
+        return HeaderIndex.load(path)
+    if output_format == 'parquet':
+        import pyarrow.parquet as pq
+        return HeaderIndex.from_arrow(pq.read_table(path))
+    import pyarrow.feather as feather
+    return HeaderIndex.from_arrow(feather.read_table(path))
+
+
+def save_export(index: HeaderIndex, path: str, output_format: str) -> None:
+    """Write an index as Parquet, Arrow (Feather v2) or .npz, replacing the file atomically."""
+    tmp_path = f"{path}.tmp"
+    try:
+        if output_format == 'npz':
+            index.save(tmp_path)
+        elif output_format == 'parquet':
+            import pyarrow.parquet as pq
+            pq.write_table(index.to_arrow(), tmp_path)
+        else:
+            import pyarrow.feather as feather
+            feather.write_feather(index.to_arrow(), tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def export_headers(paths: Iterable[str], output: str, output_format: Optional[str] = None,
+                   hdus: Optional[List[int]] = None, workers: Optional[int] = None,
+                   append: bool = False) -> Dict[str, Any]:
+    """
+    Export the headers of files and directories as one row per (file, HDU).
+
+    Keyword types are unified across files as in column_array, so a keyword
+    that is an integer in some files and a float in others becomes a float
+    column, and keywords missing from a file are nulls. With append, an
+    existing export is read back, only new or changed files (by size and
+    mtime) are scanned, and their rows replace the old ones.
+
+    Args:
+        paths: Files or directories (searched recursively)
+        output: Output file
+        output_format: 'parquet', 'arrow' or 'npz' (default: see export_format)
+        hdus: HDU indices to include (default: all)
+        workers: Worker processes (default: CPU count)
+        append: Update an existing export instead of replacing it
+
+    Returns:
+        Summary with file, row and column counts and per-file errors
+    """
+    from fits_verify import collect_files
+
+    t0 = time.perf_counter()
+    output_format = export_format(output, output_format)
+    files = collect_files(paths)
+    existing = None
+    todo = files
+    if append and os.path.exists(output):
+        existing = load_export(output, output_format)
+        indexed = dict(zip(existing.paths.tolist(), zip(existing.sizes.tolist(), existing.mtimes.tolist())))
+        todo = []
+        for path in files:
+            stat = os.stat(path)
+            if indexed.get(path) != (stat.st_size, stat.st_mtime_ns):
+                todo.append(path)
+
+    rows, errors = scan_files(todo, hdus, workers)
+    index = HeaderIndex.from_rows(rows)
+    if existing is not None:
+        index = existing.merge(index)
+    index = index.sort()
+    save_export(index, output, output_format)
+    return {
+        'output': output,
+        'format': output_format,
+        'files': len(files),
+        'scanned': len(todo),
+        'unchanged': len(files) - len(todo),
+        'rows': len(index),
+        'columns': len(index.columns),
+        'errors': errors,
+        'elapsed_s': round(time.perf_counter() - t0, 3),
+    }
+
+
+@click.command()
+@click.argument('fits_files', nargs=-1, required=True, type=click.Path(exists=True))
+@click.option('--output', '-o', required=True, type=click.Path(), help='Index file to write (.npz)')
+@click.option('--hdu', '-h', 'hdus', multiple=True, type=int, help='HDU index to include (repeatable, default: all)')
+def main(fits_files, output, hdus):
+    """
+    Build a header index of FITS files for vectorized rules and statistics.
+
+    Examples:
+        fits_index.py data/*.fits -o headers.npz
+        fits_index.py data/*.fits -o headers.npz --hdu 0
+    """
+    try:
+        index = build_index(fits_files, list(hdus) or None)
+        index.save(output)
+        click.echo(f"Indexed {len(index)} HDUs, {len(index.columns)} keywords -> {output}")
+    except Exception as e:
+        click.echo(f"Error: {e}", err=True)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -8,62 +8,173 @@ import os
 import sys
 import shutil
 from pathlib import Path
-from typing import Dict, List, Tuple, Any, Optional, Union
+from typing import TYPE_CHECKING, Callable, Dict, List, Tuple, Any, Optional, Union
 from datetime import datetime
 import click
-from astropy.io import fits
-from astropy.io.fits.header import Header
-from tabulate import tabulate
-import warnings
 import json
 
-# Suppress FITS verification warnings for better output
-warnings.filterwarnings('ignore', category=fits.verify.VerifyWarning)
+from fits_headers import (compression_of, split_fits_name, import_fits, header_checksum, header_values,
+                          MANDATORY_KEYWORDS, TILE_RESERVED_KEYWORDS)
+from fits_rules import apply_plan, apply_rules, compile_rules, plan_header, plan_index
+from fits_profile import PROFILE_FORMATS, PhaseProfile, phase_context, profiled
+
+if TYPE_CHECKING:
+    from astropy.io.fits.header import Header
+
+# astropy is imported by load_file and tabulate by the interactive listing,
+# so --help and argument errors don't pay for them
+
+# An HDU given by index, EXTNAME or (EXTNAME, EXTVER)
+HDUSpec = Union[int, str, Tuple[str, int]]
+
+
+class EditorError(Exception):
+    """Base class of the errors raised by FITSMetadataEditor."""
+
+
+class HDUError(EditorError, ValueError):
+    """The requested HDU does not exist."""
+
+
+class KeywordError(EditorError, ValueError):
+    """A keyword is invalid, missing, already present or protected."""
+
+
+class LoadError(EditorError, RuntimeError):
+    """The file could not be opened as FITS."""
+
+
+class EditError(EditorError, RuntimeError):
+    """astropy rejected an edit (e.g. a value that cannot be written to a card)."""
+
+
+class SaveError(EditorError, RuntimeError):
+    """The changes could not be written to the file."""
 
 
 class FITSMetadataEditor:
     """Class to handle FITS file metadata editing operations."""
     
-    def __init__(self, filepath: str, backup: bool = True):
+    def __init__(self, filepath: str, backup: bool = True,
+                 hooks: Optional[List[Callable[[Dict[str, Any]], None]]] = None):
         """
         Initialize the FITS metadata editor.
         
         Args:
             filepath: Path to the FITS file
             backup: Whether to create backup before editing
+            hooks: Callables receiving a record per measured phase (see fits_profile)
         """
         self.filepath = Path(filepath)
         if not self.filepath.exists():
             raise FileNotFoundError(f"FITS file not found: {filepath}")
-        if not self.filepath.suffix.lower() in ['.fits', '.fit', '.fts']:
-            raise ValueError(f"File does not appear to be a FITS file: {filepath}")
+        self.compression = compression_of(self.filepath)
         
         self.backup_enabled = backup
         self.backup_path = None
+        self.backup_error = None
         self.hdulist = None
         self.modified = False
+        self.modified_hdus = set()
+        self.hooks = list(hooks or [])
+    
+    def add_hook(self, hook: Callable[[Dict[str, Any]], None]) -> None:
+        """Register a profiling hook; it is called with the record of every later phase."""
+        self.hooks.append(hook)
+    
+    def phase(self, name: str):
+        """Context manager measuring a phase of work on this file for the hooks."""
+        return phase_context(self.hooks, name, file=str(self.filepath))
     
     def load_file(self) -> None:
-        """Load the FITS file."""
+        """
+        Load the FITS file.
+        
+        Tile-compressed (.fz) files are opened with image compression disabled,
+        so compressed HDUs are edited as their stored binary table headers and
+        saving rewrites the header only, never recompressing the data tiles.
+        .fits.gz files cannot be updated in place; they are opened read-only
+        and rewritten (recompressed) as a whole on save.
+
+        Checksums are never recomputed by astropy (checksum=False); save()
+        maintains CHECKSUM of edited HDUs itself from the stored DATASUM.
+        """
+        with self.phase('import'):
+            fits = import_fits()
         try:
-            self.hdulist = fits.open(self.filepath, mode='update')
+            with self.phase('fits.open'):
+                self.hdulist = fits.open(self.filepath,
+                                         mode='readonly' if self.compression == 'gzip' else 'update',
+                                         disable_image_compression=self.compression == 'tile',
+                                         checksum=False)
+            with self.phase('parse'):
+                # Read all HDU headers now rather than lazily inside the first edit
+                self.hdulist.readall()
         except Exception as e:
-            raise RuntimeError(f"Error loading FITS file: {e}")
+            raise LoadError(f"Error loading FITS file: {e}") from e
+    
+    def resolve_hdu(self, hdu: HDUSpec) -> int:
+        """
+        Index of an HDU given by index, EXTNAME or (EXTNAME, EXTVER).
+        
+        Args:
+            hdu: HDU index (negative counts from the end), EXTNAME
+                (case-insensitive) or (EXTNAME, EXTVER)
+            
+        Returns:
+            Non-negative HDU index
+            
+        Raises:
+            HDUError: If no such HDU exists
+        """
+        count = len(self.hdulist)
+        if isinstance(hdu, int):
+            if not -count <= hdu < count:
+                raise HDUError(f"HDU index {hdu} out of range")
+            return hdu % count
+        try:
+            return self.hdulist.index_of(hdu)
+        except (KeyError, IndexError) as e:
+            raise HDUError(f"HDU {hdu!r} not found") from e
+    
+    def _header(self, hdu: HDUSpec) -> Tuple[int, 'Header']:
+        """Resolved index and header of an HDU."""
+        index = self.resolve_hdu(hdu)
+        return index, self.hdulist[index].header
     
-    def create_backup(self) -> Optional[Path]:
-        """Create a backup of the original file."""
+    def _check_tile_keyword(self, header: 'Header', keyword: str) -> None:
+        """Reject edits to table layout and compression keywords of a compressed HDU."""
+        if header.get('ZIMAGE') and TILE_RESERVED_KEYWORDS.match(keyword):
+            raise KeywordError(f"Cannot modify compression keyword '{keyword}' of a compressed HDU")
+    
+    @profiled('create_backup')
+    def create_backup(self, quiet: bool = False) -> Optional[Path]:
+        """
+        Create a backup of the original file.
+        
+        Args:
+            quiet: Do not print a warning if the copy fails (the error is
+                kept in backup_error either way)
+            
+        Returns:
+            Backup path, or None if backups are disabled or the copy failed
+        """
+        self.backup_error = None
         if not self.backup_enabled:
             return None
         
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        backup_name = f"{self.filepath.stem}_backup_{timestamp}{self.filepath.suffix}"
+        stem, suffix = split_fits_name(self.filepath)
+        backup_name = f"{stem}_backup_{timestamp}{suffix}"
         self.backup_path = self.filepath.parent / backup_name
         
         try:
             shutil.copy2(self.filepath, self.backup_path)
             return self.backup_path
         except Exception as e:
-            click.echo(f"Warning: Could not create backup: {e}", err=True)
+            self.backup_error = str(e)
+            if not quiet:
+                click.echo(f"Warning: Could not create backup: {e}", err=True)
             return None
     
     def get_hdu_info(self) -> List[Dict[str, Any]]:
@@ -78,13 +189,14 @@ class FITSMetadataEditor:
             })
         return info
     
-    def add_keyword(self, hdu_index: int, keyword: str, value: Any, 
+    @profiled('edit')
+    def add_keyword(self, hdu_index: HDUSpec, keyword: str, value: Any, 
                    comment: str = '') -> bool:
         """
         Add a new keyword to the header.
         
         Args:
-            hdu_index: Index of the HDU to modify
+            hdu_index: Index, EXTNAME or (EXTNAME, EXTVER) of the HDU to modify
             keyword: Header keyword (max 8 characters)
             value: Value for the keyword
             comment: Optional comment
@@ -92,34 +204,35 @@ class FITSMetadataEditor:
         Returns:
             True if successful, False otherwise
         """
-        if hdu_index >= len(self.hdulist):
-            raise ValueError(f"HDU index {hdu_index} out of range")
+        index, header = self._header(hdu_index)
         
         # Validate keyword
         keyword = keyword.upper()
         if len(keyword) > 8:
-            raise ValueError(f"Keyword '{keyword}' exceeds 8 characters")
+            raise KeywordError(f"Keyword '{keyword}' exceeds 8 characters")
         
         # Check if keyword already exists
-        header = self.hdulist[hdu_index].header
         if keyword in header:
-            raise ValueError(f"Keyword '{keyword}' already exists. Use update_keyword instead.")
+            raise KeywordError(f"Keyword '{keyword}' already exists. Use update_keyword instead.")
+        self._check_tile_keyword(header, keyword)
         
         # Add the keyword
         try:
             header[keyword] = (value, comment) if comment else value
             self.modified = True
+            self.modified_hdus.add(index)
             return True
         except Exception as e:
-            raise RuntimeError(f"Failed to add keyword: {e}")
+            raise EditError(f"Failed to add keyword: {e}") from e
     
-    def update_keyword(self, hdu_index: int, keyword: str, value: Any, 
+    @profiled('edit')
+    def update_keyword(self, hdu_index: HDUSpec, keyword: str, value: Any, 
                       comment: Optional[str] = None) -> bool:
         """
         Update an existing keyword's value.
         
         Args:
-            hdu_index: Index of the HDU to modify
+            hdu_index: Index, EXTNAME or (EXTNAME, EXTVER) of the HDU to modify
             keyword: Header keyword to update
             value: New value for the keyword
             comment: Optional new comment (None to keep existing)
@@ -127,14 +240,12 @@ class FITSMetadataEditor:
         Returns:
             True if successful, False otherwise
         """
-        if hdu_index >= len(self.hdulist):
-            raise ValueError(f"HDU index {hdu_index} out of range")
-        
+        index, header = self._header(hdu_index)
         keyword = keyword.upper()
-        header = self.hdulist[hdu_index].header
         
         if keyword not in header:
-            raise ValueError(f"Keyword '{keyword}' does not exist. Use add_keyword instead.")
+            raise KeywordError(f"Keyword '{keyword}' does not exist. Use add_keyword instead.")
+        self._check_tile_keyword(header, keyword)
         
         # Update the keyword
         try:
@@ -145,83 +256,130 @@ class FITSMetadataEditor:
                 existing_comment = header.comments[keyword]
                 header[keyword] = (value, existing_comment)
             self.modified = True
+            self.modified_hdus.add(index)
             return True
         except Exception as e:
-            raise RuntimeError(f"Failed to update keyword: {e}")
+            raise EditError(f"Failed to update keyword: {e}") from e
     
-    def delete_keyword(self, hdu_index: int, keyword: str) -> bool:
+    @profiled('edit')
+    def delete_keyword(self, hdu_index: HDUSpec, keyword: str) -> bool:
         """
         Delete a keyword from the header.
         
         Args:
-            hdu_index: Index of the HDU to modify
+            hdu_index: Index, EXTNAME or (EXTNAME, EXTVER) of the HDU to modify
             keyword: Header keyword to delete
             
         Returns:
             True if successful, False otherwise
         """
-        if hdu_index >= len(self.hdulist):
-            raise ValueError(f"HDU index {hdu_index} out of range")
-        
+        index, header = self._header(hdu_index)
         keyword = keyword.upper()
-        header = self.hdulist[hdu_index].header
         
         # Check if keyword exists
         if keyword not in header:
-            raise ValueError(f"Keyword '{keyword}' does not exist")
+            raise KeywordError(f"Keyword '{keyword}' does not exist")
         
         # Protect essential keywords
-        protected = ['SIMPLE', 'BITPIX', 'NAXIS', 'EXTEND']
-        if keyword in protected:
-            raise ValueError(f"Cannot delete protected keyword '{keyword}'")
+        if keyword in MANDATORY_KEYWORDS:
+            raise KeywordError(f"Cannot delete protected keyword '{keyword}'")
+        self._check_tile_keyword(header, keyword)
         
         # Delete the keyword
         try:
             del header[keyword]
             self.modified = True
+            self.modified_hdus.add(index)
             return True
         except Exception as e:
-            raise RuntimeError(f"Failed to delete keyword: {e}")
+            raise EditError(f"Failed to delete keyword: {e}") from e
     
-    def get_keyword_value(self, hdu_index: int, keyword: str) -> Tuple[Any, str]:
+    def get_keyword_value(self, hdu_index: HDUSpec, keyword: str) -> Tuple[Any, str]:
         """Get the value and comment of a keyword."""
-        if hdu_index >= len(self.hdulist):
-            raise ValueError(f"HDU index {hdu_index} out of range")
-        
+        _, header = self._header(hdu_index)
         keyword = keyword.upper()
-        header = self.hdulist[hdu_index].header
         
         if keyword not in header:
-            raise ValueError(f"Keyword '{keyword}' does not exist")
+            raise KeywordError(f"Keyword '{keyword}' does not exist")
         
         value = header[keyword]
         comment = header.comments[keyword]
         return value, comment
     
-    def save(self) -> None:
-        """Save changes to the FITS file."""
+    def save(self, quiet: bool = False) -> bool:
+        """
+        Save changes to the FITS file.
+        
+        Args:
+            quiet: Do not print status messages
+            
+        Returns:
+            True if changes were written, False if there were none
+        """
         if not self.modified:
-            click.echo("No modifications to save.")
-            return
+            if not quiet:
+                click.echo("No modifications to save.")
+            return False
         
         try:
-            self.hdulist.flush()
+            with self.phase('checksum'):
+                self._update_checksums()
+            with self.phase('flush'):
+                if self.compression == 'gzip':
+                    self._rewrite_gzip()
+                else:
+                    self.hdulist.flush()
             self.modified = False
-            click.echo("Changes saved successfully.")
+            self.modified_hdus.clear()
+            if not quiet:
+                click.echo("Changes saved successfully.")
+            return True
         except Exception as e:
-            raise RuntimeError(f"Failed to save changes: {e}")
+            raise SaveError(f"Failed to save changes: {e}") from e
     
+    def _update_checksums(self) -> None:
+        """
+        Bring CHECKSUM up to date in the edited HDUs that carry one.
+
+        Header edits don't change the data unit, so DATASUM is kept and only
+        the header's contribution to CHECKSUM is recomputed (ones'-complement
+        sums add up). Only an HDU with CHECKSUM but no usable DATASUM needs its
+        data read, in which case both are computed by astropy.
+        """
+        for index in sorted(self.modified_hdus):
+            hdu = self.hdulist[index]
+            header = hdu.header
+            if 'CHECKSUM' not in header:
+                continue
+            try:
+                datasum = int(header['DATASUM'])
+            except (KeyError, ValueError):
+                hdu.add_checksum()
+                continue
+            header['CHECKSUM'] = ('0' * 16, f"HDU checksum updated {datetime.now().isoformat()[:19]}")
+            checksum = header_checksum(header.tostring().encode('ascii'), datasum)
+            header['CHECKSUM'] = checksum
+    
+    def _rewrite_gzip(self) -> None:
+        """Write the edited HDUs to a temporary .gz file and swap it in atomically."""
+        stem, suffix = split_fits_name(self.filepath)
+        tmp_path = self.filepath.parent / f".{stem}.saving{suffix}"
+        try:
+            self.hdulist.writeto(tmp_path, overwrite=True)
+            os.replace(tmp_path, self.filepath)
+        finally:
+            if tmp_path.exists():
+                tmp_path.unlink()
+    
+    @profiled('close')
     def close(self) -> None:
         """Close the FITS file."""
         if self.hdulist:
             self.hdulist.close()
     
-    def list_keywords(self, hdu_index: int) -> List[Tuple[str, Any, str]]:
+    def list_keywords(self, hdu_index: HDUSpec) -> List[Tuple[str, Any, str]]:
         """List all keywords in an HDU."""
-        if hdu_index >= len(self.hdulist):
-            raise ValueError(f"HDU index {hdu_index} out of range")
-        
-        header = self.hdulist[hdu_index].header
+        _, header = self._header(hdu_index)
         keywords = []
         
         for card in header.cards:
@@ -257,13 +415,41 @@ def parse_value(value_str: str) -> Any:
     return value_str
 
 
+def echo_rule_result(result: Dict[str, Any], prefix: str = '') -> None:
+    """Print the outcome of one batch operation."""
+    keyword = result['keyword']
+    status = result['status']
+    if status == 'error':
+        click.echo(f"{prefix}✗ Error processing {keyword}: {result['error']}", err=True)
+    elif status == 'skipped':
+        click.echo(f"{prefix}- Skipped {keyword} (condition not met)")
+    elif status == 'unchanged':
+        click.echo(f"{prefix}= {keyword} unchanged ({result['value']})")
+    elif result.get('applied', result['action']) == 'delete':
+        click.echo(f"{prefix}✓ Deleted {keyword}")
+    else:
+        verb = 'Added' if result.get('applied', result['action']) == 'add' else 'Updated'
+        click.echo(f"{prefix}✓ {verb} {keyword} = {result['value']}")
+
+
 @click.group()
 @click.option('--no-backup', is_flag=True, help='Do not create backup file')
+@click.option('--profile', is_flag=True, help='Report time, I/O and peak RSS per phase on stderr')
+@click.option('--profile-format', type=click.Choice(PROFILE_FORMATS), default='table',
+              help='Profile report format (default: table)')
+@click.option('--profile-output', type=click.Path(), default=None,
+              help='Write the profile report to a file instead of stderr')
 @click.pass_context
-def cli(ctx, no_backup):
+def cli(ctx, no_backup, profile, profile_format, profile_output):
     """FITS Metadata Editor - Edit, add, and delete metadata in FITS files."""
     ctx.ensure_object(dict)
     ctx.obj['backup'] = not no_backup
+    ctx.obj['hooks'] = []
+    if profile:
+        # One profile for the whole command, so batch runs are aggregated over files
+        profiler = PhaseProfile()
+        ctx.obj['hooks'].append(profiler)
+        ctx.call_on_close(lambda: profiler.write(profile_format, profile_output))
 
 
 @cli.command()
@@ -276,7 +462,7 @@ def cli(ctx, no_backup):
 def add(ctx, fits_file, hdu, keyword, value, comment):
     """Add a new keyword to FITS header."""
     try:
-        editor = FITSMetadataEditor(fits_file, backup=ctx.obj.get('backup', True))
+        editor = FITSMetadataEditor(fits_file, backup=ctx.obj.get('backup', True), hooks=ctx.obj.get('hooks'))
         editor.load_file()
         
         # Create backup
@@ -312,7 +498,7 @@ def add(ctx, fits_file, hdu, keyword, value, comment):
 def update(ctx, fits_file, hdu, keyword, value, comment):
     """Update an existing keyword in FITS header."""
     try:
-        editor = FITSMetadataEditor(fits_file, backup=ctx.obj.get('backup', True))
+        editor = FITSMetadataEditor(fits_file, backup=ctx.obj.get('backup', True), hooks=ctx.obj.get('hooks'))
         editor.load_file()
         
         # Get current value
@@ -352,7 +538,7 @@ def update(ctx, fits_file, hdu, keyword, value, comment):
 def delete(ctx, fits_file, hdu, keyword):
     """Delete a keyword from FITS header."""
     try:
-        editor = FITSMetadataEditor(fits_file, backup=ctx.obj.get('backup', True))
+        editor = FITSMetadataEditor(fits_file, backup=ctx.obj.get('backup', True), hooks=ctx.obj.get('hooks'))
         editor.load_file()
         
         # Get current value
@@ -392,7 +578,7 @@ def delete(ctx, fits_file, hdu, keyword):
 def interactive(ctx, fits_file, hdu):
     """Interactive mode for editing FITS metadata."""
     try:
-        editor = FITSMetadataEditor(fits_file, backup=ctx.obj.get('backup', True))
+        editor = FITSMetadataEditor(fits_file, backup=ctx.obj.get('backup', True), hooks=ctx.obj.get('hooks'))
         editor.load_file()
         
         click.echo("\n" + "="*60)
@@ -429,6 +615,7 @@ def interactive(ctx, fits_file, hdu):
                 break
             
             elif choice == 'l':
+                from tabulate import tabulate
                 keywords = editor.list_keywords(current_hdu)
                 table_data = []
                 for k, v, c in keywords:
@@ -533,13 +720,18 @@ def interactive(ctx, fits_file, hdu):
 @click.option('--hdu', '-h', default=0, type=int, help='HDU index (default: 0)')
 @click.pass_context
 def batch(ctx, fits_file, json_file, hdu):
-    """Apply batch edits from a JSON file."""
+    """
+    Apply batch edits from a JSON file.
+    
+    Operations take a literal "value" or an "expr" computed from other
+    keywords, optionally guarded by a "when" condition (see fits_rules.py).
+    """
     try:
-        # Load JSON file
+        # Load JSON file and compile expressions up front
         with open(json_file, 'r') as f:
-            operations = json.load(f)
+            rules = compile_rules(json.load(f))
         
-        editor = FITSMetadataEditor(fits_file, backup=ctx.obj.get('backup', True))
+        editor = FITSMetadataEditor(fits_file, backup=ctx.obj.get('backup', True), hooks=ctx.obj.get('hooks'))
         editor.load_file()
         
         # Create backup
@@ -547,27 +739,11 @@ def batch(ctx, fits_file, json_file, hdu):
         if backup_path:
             click.echo(f"Backup created: {backup_path}")
         
-        # Process operations
-        for op in operations:
-            action = op.get('action')
-            keyword = op.get('keyword', '').upper()
-            value = op.get('value')
-            comment = op.get('comment', '')
-            
-            try:
-                if action == 'add':
-                    editor.add_keyword(hdu, keyword, value, comment)
-                    click.echo(f"✓ Added {keyword} = {value}")
-                elif action == 'update':
-                    editor.update_keyword(hdu, keyword, value, comment if comment else None)
-                    click.echo(f"✓ Updated {keyword} = {value}")
-                elif action == 'delete':
-                    editor.delete_keyword(hdu, keyword)
-                    click.echo(f"✓ Deleted {keyword}")
-                else:
-                    click.echo(f"⚠ Unknown action '{action}' for {keyword}", err=True)
-            except Exception as e:
-                click.echo(f"✗ Error processing {keyword}: {e}", err=True)
+        # Process operations (one pass; "expr" values are computed from the header)
+        with editor.phase('rules'):
+            results = apply_rules(editor, hdu, rules)
+        for result in results:
+            echo_rule_result(result)
         
         editor.save()
         editor.close()
@@ -579,5 +755,267 @@ def batch(ctx, fits_file, json_file, hdu):
         sys.exit(1)
 
 
+def run_rules_on_file(fits_file: str, hdu: int, rules, backup: bool, dry_run: bool = False,
+                      plan: Optional[List[Dict[str, Any]]] = None,
+                      hooks: Optional[List[Callable[[Dict[str, Any]], None]]] = None) -> List[Dict[str, Any]]:
+    """
+    Apply compiled rules to one file in a single open/save pass.
+    
+    Args:
+        fits_file: Path to the FITS file
+        hdu: HDU index
+        rules: Rules from fits_rules.compile_rules
+        backup: Whether to back up the file before saving
+        dry_run: Evaluate only, do not modify the file
+        plan: Edits already evaluated from a header index (skips evaluation)
+        hooks: Profiling hooks for the editor
+        
+    Returns:
+        Per-rule results
+    """
+    editor = FITSMetadataEditor(fits_file, backup=backup, hooks=hooks)
+    editor.load_file()
+    try:
+        with editor.phase('rules'):
+            if dry_run:
+                return plan_header(rules, header_values(editor.hdulist[hdu].header))
+            if plan is None:
+                plan = apply_rules(editor, hdu, rules)
+            else:
+                apply_plan(editor, hdu, plan)
+        if editor.modified:
+            editor.create_backup()
+            editor.save(quiet=True)
+        return plan
+    finally:
+        editor.close()
+
+
+@cli.command()
+@click.argument('rules_file', type=click.Path(exists=True))
+@click.argument('fits_files', nargs=-1, type=click.Path(exists=True))
+@click.option('--hdu', '-h', default=0, type=int, help='HDU index (default: 0)')
+@click.option('--index', 'index_file', default=None, type=click.Path(exists=True),
+              help='Header index (.npz from fits_index.py) to evaluate the rules over')
+@click.option('--dry-run', is_flag=True, help='Show the edits without writing any file')
+@click.pass_context
+def rules(ctx, rules_file, fits_files, hdu, index_file, dry_run):
+    """
+    Apply a batch/rules JSON file to many FITS files.
+    
+    Rules are compiled once. Without --index each file is opened, evaluated
+    and saved in one pass. With --index the rules are evaluated vectorized
+    over the indexed headers and only files that actually change are opened
+    (files changed since indexing are re-evaluated from their header).
+    With --index and no FITS_FILES, every indexed file is processed.
+    
+    Examples:
+        fits_metadata_editor.py rules derive.json data/*.fits
+        fits_metadata_editor.py rules derive.json --index headers.npz --dry-run
+    """
+    try:
+        with open(rules_file, 'r') as f:
+            compiled = compile_rules(json.load(f))
+        backup = ctx.obj.get('backup', True)
+        
+        # Plans from the index, keyed by resolved path
+        planned: Dict[str, List[Dict[str, Any]]] = {}
+        if index_file:
+            import numpy as np
+            from fits_index import HeaderIndex
+            index = HeaderIndex.load(index_file)
+            index = index.select(index.hdus == hdu)
+            wanted = {str(Path(p).resolve()) for p in fits_files}
+            if wanted:
+                index = index.select(np.isin(index.paths, sorted(wanted)))
+            for row, plan in enumerate(plan_index(compiled, index)):
+                if index.is_current(row):
+                    planned[str(index.paths[row])] = plan
+            if not fits_files:
+                fits_files = [str(p) for p in index.paths]
+        
+        totals = {'apply': 0, 'unchanged': 0, 'skipped': 0, 'error': 0}
+        opened = 0
+        for fits_file in fits_files:
+            plan = planned.get(str(Path(fits_file).resolve()))
+            if plan is not None and (dry_run or not any(r['status'] == 'apply' for r in plan)):
+                results = plan  # Nothing to write: the file is never opened
+            else:
+                try:
+                    results = run_rules_on_file(fits_file, hdu, compiled, backup, dry_run, plan,
+                                                ctx.obj.get('hooks'))
+                    opened += 1
+                except Exception as e:
+                    click.echo(f"✗ {fits_file}: {e}", err=True)
+                    totals['error'] += 1
+                    continue
+            click.echo(fits_file)
+            for result in results:
+                totals[result['status']] += 1
+                echo_rule_result(result, prefix='  ')
+        
+        click.echo(f"\n{len(fits_files)} files ({opened} opened): {totals['apply']} edits"
+                   f"{' planned' if dry_run else ''}, {totals['unchanged']} unchanged, "
+                   f"{totals['skipped']} skipped, {totals['error']} errors")
+        
+    except Exception as e:
+        click.echo(f"Error: {e}", err=True)
+        sys.exit(1)
+
+
+@cli.command()
+@click.argument('rules_file', type=click.Path(exists=True))
+@click.argument('directories', nargs=-1, required=True, type=click.Path(exists=True, file_okay=False))
+@click.option('--hdu', '-h', default=0, type=int, help='HDU index (default: 0)')
+@click.option('--workers', '-j', default=None, type=int, help='Worker processes (default: CPU count)')
+@click.option('--recursive', '-r', is_flag=True, help='Also watch subdirectories')
+@click.option('--settle', default=2.0, show_default=True, type=float,
+              help='Seconds a file must be quiet before it is processed')
+@click.option('--max-wait', default=300.0, show_default=True, type=float,
+              help='Give up on files that still look incomplete after this many seconds')
+@click.option('--initial-scan', is_flag=True, help='Also process FITS files already in the directories')
+@click.option('--poll', 'poll_interval', default=None, type=float,
+              help='Rescan every N seconds instead of using inotify')
+@click.option('--index', 'index_file', default=None, type=click.Path(),
+              help='Header index (.npz) to keep up to date (created if missing)')
+@click.option('--metrics', 'metrics_file', default=None, type=click.Path(),
+              help='Write throughput and queue-lag metrics as JSON to this file')
+@click.option('--stats-interval', default=10.0, show_default=True, type=float,
+              help='Seconds between metrics reports')
+@click.option('--dry-run', is_flag=True, help='Evaluate the rules without writing any file')
+@click.pass_context
+def watch(ctx, rules_file, directories, hdu, workers, recursive, settle, max_wait, initial_scan,
+          poll_interval, index_file, metrics_file, stats_interval, dry_run):
+    """
+    Watch incoming directories and apply a batch/rules file to new FITS files.
+    
+    New or rewritten files are processed once no write has been seen for
+    --settle seconds and their size is a whole number of FITS blocks. Runs
+    until interrupted (Ctrl-C or SIGTERM); files already being processed are
+    finished first.
+    
+    Examples:
+        fits_metadata_editor.py --no-backup watch derive.json /data/incoming -j 4
+        fits_metadata_editor.py watch derive.json /data/incoming --index headers.npz --metrics metrics.json
+    """
+    from fits_watch import IngestDaemon
+    
+    def on_result(result):
+        if result.get('error'):
+            click.echo(f"✗ {result['path']}: {result['error']}", err=True)
+            return
+        click.echo(result['path'])
+        for rule_result in result['results']:
+            if rule_result['status'] != 'unchanged':
+                echo_rule_result(rule_result, prefix='  ')
+    
+    last = {}
+    
+    def on_stats(snapshot):
+        state = (snapshot['files'], snapshot['queue_depth'], snapshot['in_flight'])
+        if state == last.get('state'):
+            return  # Idle: the metrics file still gets every snapshot
+        last['state'] = state
+        lag = snapshot['queue_lag']
+        click.echo(f"[watch] {snapshot['files']} files ({snapshot['files_per_s']}/s), "
+                   f"{snapshot['edits']} edits, {snapshot['failed']} failed, "
+                   f"queue {snapshot['queue_depth']} (+{snapshot['in_flight']} in progress), "
+                   f"lag p50 {lag.get('p50_s', 0)} s p99 {lag.get('p99_s', 0)} s", err=True)
+    
+    try:
+        with open(rules_file, 'r') as f:
+            operations = json.load(f)
+        daemon = IngestDaemon(operations, list(directories), hdu=hdu, workers=workers,
+                              backup=ctx.obj.get('backup', True), dry_run=dry_run,
+                              settle=settle, max_wait=max_wait, recursive=recursive,
+                              poll_interval=poll_interval, index_path=index_file,
+                              metrics_path=metrics_file, stats_interval=stats_interval,
+                              on_result=on_result, on_stats=on_stats)
+        click.echo(f"Watching {', '.join(directories)} (pid {os.getpid()})", err=True)
+        snapshot = daemon.run(initial_scan=initial_scan)
+    except Exception as e:
+        click.echo(f"Error: {e}", err=True)
+        sys.exit(1)
+    
+    if snapshot['queue_depth']:
+        click.echo(f"{snapshot['queue_depth']} queued files were not processed", err=True)
+
+
+@cli.command()
+@click.argument('paths', nargs=-1, required=True, type=click.Path(exists=True))
+@click.option('--output', '-o', required=True, type=click.Path(),
+              help='Output file (.parquet, .arrow/.feather or .npz)')
+@click.option('--format', 'output_format', type=click.Choice(['parquet', 'arrow', 'npz']), default=None,
+              help='Output format (default: from the suffix; Parquet needs pyarrow)')
+@click.option('--hdu', '-h', 'hdus', multiple=True, type=int, help='HDU index to include (repeatable, default: all)')
+@click.option('--workers', '-j', default=None, type=int, help='Worker processes (default: CPU count)')
+@click.option('--append', is_flag=True, help='Update an existing export, reading only new or changed files')
+def export(paths, output, output_format, hdus, workers, append):
+    """
+    Export headers of FITS files or directories for analytics.
+    
+    Writes one row per (file, HDU) with columns path, hdu, file_size and
+    mtime_ns followed by one typed column per keyword (null where a file
+    lacks it). Without pyarrow, use a .npz output (the fits_index format).
+    
+    Examples:
+        fits_metadata_editor.py export /data/archive -o headers.parquet
+        fits_metadata_editor.py export /data/incoming -o headers.parquet --append
+        fits_metadata_editor.py export data/*.fits -o headers.npz --hdu 0
+    """
+    try:
+        from fits_index import export_headers
+        summary = export_headers(paths, output, output_format, list(hdus) or None, workers, append)
+    except Exception as e:
+        click.echo(f"Error: {e}", err=True)
+        sys.exit(1)
+    
+    for path, error in summary['errors'].items():
+        click.echo(f"✗ {path}: {error}", err=True)
+    click.echo(f"Exported {summary['rows']} HDUs x {summary['columns']} keywords from {summary['files']} files "
+               f"({summary['scanned']} read, {summary['unchanged']} unchanged) -> {output} "
+               f"[{summary['format']}, {summary['elapsed_s']} s]")
+
+
+@cli.command()
+@click.argument('paths', nargs=-1, required=True, type=click.Path(exists=True))
+@click.option('--workers', '-j', default=None, type=int, help='Worker processes (default: CPU count)')
+@click.option('--cache', 'cache_file', default=None, type=click.Path(),
+              help='Result cache file (default: ~/.cache/fits_metadata_editor/verify_cache.json)')
+@click.option('--no-cache', is_flag=True, help='Re-check every file and do not update the cache')
+@click.option('--require-checksums', is_flag=True, help='Fail HDUs without CHECKSUM/DATASUM')
+@click.option('--output', '-o', default=None, type=click.Path(), help='Write the JSON report to a file (default: stdout)')
+def verify(paths, workers, cache_file, no_cache, require_checksums, output):
+    """
+    Verify FITS files or directories (structure, mandatory keywords, CHECKSUM/DATASUM).
+
+    Exits with status 1 if any file fails.
+    """
+    from fits_verify import DEFAULT_CACHE, verify_archive
+
+    cache_path = None if no_cache else Path(cache_file) if cache_file else DEFAULT_CACHE
+    report = verify_archive(paths, workers=workers, cache_path=cache_path,
+                            require_checksums=require_checksums)
+
+    text = json.dumps(report, indent=2)
+    if output:
+        with open(output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        click.echo(text)
+
+    summary = report['summary']
+    for result in report['files']:
+        for error in result['errors']:
+            click.echo(f"✗ {result['path']}: {error}", err=True)
+        if not result['ok'] and not result['errors']:
+            click.echo(f"✗ {result['path']}: HDUs without CHECKSUM/DATASUM", err=True)
+    click.echo(f"Verified {summary['files']} files ({summary['cached']} cached): "
+               f"{summary['ok']} ok, {summary['failed']} failed, "
+               f"{summary['bytes_verified'] / 1e6:.1f} MB read at {summary['mb_per_s']} MB/s", err=True)
+    if summary['failed']:
+        sys.exit(1)
+
+
 if __name__ == '__main__':
     cli()
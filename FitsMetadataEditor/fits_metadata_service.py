@@ -0,0 +1,479 @@
+#!/usr/bin/env python3
+"""
+FITS Metadata Service
+A long-lived daemon that serves metadata view/edit requests over a Unix socket.
+
+The daemon imports astropy once and keeps an LRU of open files, so each request
+costs only the header work itself. Requests and responses are newline-delimited
+JSON objects; one connection can carry any number of requests.
+
+Client-side commands only import the standard library and click, so they start
+without paying for the astropy import.
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import stat
+import threading
+from collections import OrderedDict, defaultdict, deque
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+import click
+
+
+def _default_socket() -> str:
+    """$FITS_SERVICE_SOCKET, else a socket in the per-user $XDG_RUNTIME_DIR (or a per-user name in /tmp)."""
+    if os.environ.get('FITS_SERVICE_SOCKET'):
+        return os.environ['FITS_SERVICE_SOCKET']
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime_dir and os.path.isdir(runtime_dir):
+        return os.path.join(runtime_dir, 'fits_metadata_service.sock')
+    return f'/tmp/fits_metadata_service-{os.getuid()}.sock'
+
+
+DEFAULT_SOCKET = _default_socket()
+DEFAULT_CACHE_SIZE = 64
+LATENCY_SAMPLES = 10000
+OPERATIONS = ['ping', 'view', 'add', 'update', 'delete', 'batch', 'stats']
+
+
+class HandleCache:
+    """LRU of open FITSMetadataEditor instances keyed by resolved path."""
+
+    def __init__(self, capacity: int = DEFAULT_CACHE_SIZE, backup: bool = False):
+        """
+        Initialize the handle cache.
+
+        Args:
+            capacity: Maximum number of files kept open
+            backup: Whether to create a backup before the first edit of each file
+        """
+        self.capacity = capacity
+        self.backup = backup
+        self.entries: 'OrderedDict[str, Tuple[Any, Tuple[int, int, int]]]' = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _signature(path: str) -> Tuple[int, int, int]:
+        stat = os.stat(path)
+        return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+    def get(self, path: str):
+        """
+        Get an open editor for a file, reopening it if it changed on disk.
+
+        Args:
+            path: Path to the FITS file
+
+        Returns:
+            FITSMetadataEditor with the file loaded
+        """
+        from fits_metadata_editor import FITSMetadataEditor
+
+        key = str(Path(path).resolve())
+        entry = self.entries.get(key)
+        if entry is not None:
+            editor, signature = entry
+            if signature == self._signature(key):
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return editor
+            # Modified behind our back: drop the stale handle
+            self.discard(key)
+
+        self.misses += 1
+        editor = FITSMetadataEditor(key, backup=self.backup)
+        editor.load_file()
+        editor.backup_done = False
+        self.entries[key] = (editor, self._signature(key))
+        while len(self.entries) > self.capacity:
+            _, (old, _) = self.entries.popitem(last=False)
+            old.close()
+        return editor
+
+    def saved(self, editor) -> None:
+        """Record the new on-disk signature of a file the service just wrote."""
+        key = str(editor.filepath)
+        if key in self.entries:
+            self.entries[key] = (editor, self._signature(key))
+
+    def discard(self, key: str) -> None:
+        """Close and forget a handle."""
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            entry[0].close()
+
+    def close(self) -> None:
+        """Close all handles."""
+        for key in list(self.entries):
+            self.discard(key)
+
+
+class MetadataService:
+    """Executes JSON requests against cached FITS handles and tracks latency."""
+
+    def __init__(self, cache: HandleCache):
+        """
+        Initialize the service.
+
+        Args:
+            cache: Handle cache to serve files from
+        """
+        # Heavy imports happen once, when the daemon starts
+        from fits_metadata_editor import parse_value
+        from fits_metadata_viewer import iter_cards, json_value
+        self.parse_value = parse_value
+        self.iter_cards = iter_cards
+        self.json_value = json_value
+
+        self.cache = cache
+        self.lock = threading.Lock()
+        self.latencies: Dict[str, deque] = defaultdict(lambda: deque(maxlen=LATENCY_SAMPLES))
+        self.started = time.time()
+
+    def handle(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Execute one request.
+
+        Args:
+            request: Request object with an 'op' field
+
+        Returns:
+            Response object with 'ok', 'elapsed_ms' and op-specific fields
+        """
+        t0 = time.perf_counter()
+        op = request.get('op')
+        try:
+            if op not in OPERATIONS:
+                raise ValueError(f"Unknown op '{op}'")
+            with self.lock:
+                response = getattr(self, f'_op_{op}')(request)
+            response['ok'] = True
+        except Exception as e:
+            response = {'ok': False, 'error': str(e)}
+        elapsed = (time.perf_counter() - t0) * 1000
+        response['elapsed_ms'] = round(elapsed, 3)
+        if op in OPERATIONS:
+            self.latencies[op].append(elapsed)
+        return response
+
+    def _value(self, request: Dict[str, Any]) -> Any:
+        # CLI clients send the raw string and let the service parse it
+        value = request.get('value')
+        return self.parse_value(value) if request.get('parse') and isinstance(value, str) else value
+
+    def _save(self, editor) -> None:
+        if editor.modified:
+            if editor.backup_enabled and not editor.backup_done:
+                editor.create_backup()
+                editor.backup_done = True
+            editor.save(quiet=True)
+            self.cache.saved(editor)
+
+    def _apply(self, editor, hdu: int, op: Dict[str, Any]) -> None:
+        action = op.get('action')
+        keyword = op.get('keyword', '')
+        if action == 'add':
+            editor.add_keyword(hdu, keyword, self._value(op), op.get('comment', ''))
+        elif action == 'update':
+            editor.update_keyword(hdu, keyword, self._value(op), op.get('comment') or None)
+        elif action == 'delete':
+            editor.delete_keyword(hdu, keyword)
+        else:
+            raise ValueError(f"Unknown action '{action}'")
+
+    def _edit(self, request: Dict[str, Any], ops: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        editor = self.cache.get(request['file'])
+        hdu = request.get('hdu', 0)
+        results = []
+        try:
+            for op in ops:
+                try:
+                    self._apply(editor, hdu, op)
+                    results.append({'keyword': op.get('keyword', '').upper(), 'ok': True})
+                except Exception as e:
+                    results.append({'keyword': op.get('keyword', '').upper(), 'ok': False, 'error': str(e)})
+            self._save(editor)
+        except Exception:
+            # Unknown state after a failed save: reopen on next use
+            self.cache.discard(str(editor.filepath))
+            raise
+        return results
+
+    def _op_ping(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        return {'pid': os.getpid()}
+
+    def _op_view(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        editor = self.cache.get(request['file'])
+        hdu = request.get('hdu', 0)
+        if hdu >= len(editor.hdulist):
+            raise ValueError(f"HDU index {hdu} out of range")
+        cards = [[k, self.json_value(v), c]
+                 for k, v, c in self.iter_cards(editor.hdulist[hdu].header, request.get('filter'))]
+        return {'cards': cards}
+
+    def _op_add(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        return self._single_edit(request, 'add')
+
+    def _op_update(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        return self._single_edit(request, 'update')
+
+    def _op_delete(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        return self._single_edit(request, 'delete')
+
+    def _single_edit(self, request: Dict[str, Any], action: str) -> Dict[str, Any]:
+        result = self._edit(request, [dict(request, action=action)])[0]
+        if not result['ok']:
+            raise ValueError(result['error'])
+        return {}
+
+    def _op_batch(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        return {'results': self._edit(request, request.get('operations', []))}
+
+    def _op_stats(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        from fits_profile import percentiles
+        ops = {op: percentiles(samples, 'ms', 3) for op, samples in self.latencies.items()}
+        return {
+            'uptime_s': round(time.time() - self.started, 1),
+            'open_files': len(self.cache.entries),
+            'cache_hits': self.cache.hits,
+            'cache_misses': self.cache.misses,
+            'ops': ops,
+        }
+
+
+def remove_stale_socket(socket_path: str) -> None:
+    """
+    Remove a socket left behind by a daemon that is no longer running.
+
+    Raises:
+        RuntimeError: If a daemon still answers on the socket, or the path is not a socket
+    """
+    try:
+        mode = os.lstat(socket_path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise RuntimeError(f"{socket_path} exists and is not a socket")
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(socket_path)
+    except (ConnectionRefusedError, FileNotFoundError):
+        os.remove(socket_path)
+        return
+    finally:
+        probe.close()
+    raise RuntimeError(f"A FITS metadata service is already listening on {socket_path}")
+
+
+def serve(socket_path: str, cache_size: int, backup: bool) -> None:
+    """Run the daemon until interrupted."""
+    import socketserver
+
+    service = MetadataService(HandleCache(cache_size, backup))
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for line in self.rfile:
+                if not line.strip():
+                    continue
+                try:
+                    response = service.handle(json.loads(line))
+                except json.JSONDecodeError as e:
+                    response = {'ok': False, 'error': f"Invalid JSON: {e}"}
+                self.wfile.write(json.dumps(response).encode() + b'\n')
+
+    remove_stale_socket(socket_path)
+    # Only the owner may connect: the service reads and edits files with the owner's rights
+    umask = os.umask(0o177)
+    try:
+        server = socketserver.ThreadingUnixStreamServer(socket_path, Handler)
+    finally:
+        os.umask(umask)
+    os.chmod(socket_path, 0o600)
+    server.daemon_threads = True
+    click.echo(f"FITS metadata service listening on {socket_path} (pid {os.getpid()})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.cache.close()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+
+
+class ServiceClient:
+    """Minimal client for the metadata service (standard library only)."""
+
+    def __init__(self, socket_path: str = DEFAULT_SOCKET):
+        """
+        Connect to a running service.
+
+        Args:
+            socket_path: Path of the service's Unix socket
+        """
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self.sock.connect(socket_path)
+        except OSError as e:
+            raise RuntimeError(f"Cannot connect to FITS metadata service at {socket_path}: {e}")
+        self.rfile = self.sock.makefile('rb')
+
+    def request(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Send one request and wait for its response."""
+        self.sock.sendall(json.dumps(request).encode() + b'\n')
+        line = self.rfile.readline()
+        if not line:
+            raise RuntimeError("Service closed the connection")
+        return json.loads(line)
+
+    def close(self) -> None:
+        """Close the connection."""
+        self.rfile.close()
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def run_request(ctx, request: Dict[str, Any]) -> Dict[str, Any]:
+    """Send a request from a CLI command, printing errors and latency."""
+    t0 = time.perf_counter()
+    try:
+        with ServiceClient(ctx.obj['socket']) as client:
+            response = client.request(request)
+    except RuntimeError as e:
+        click.echo(f"Error: {e}", err=True)
+        sys.exit(1)
+    if not response['ok']:
+        click.echo(f"Error: {response['error']}", err=True)
+        sys.exit(1)
+    if ctx.obj['timing']:
+        roundtrip = (time.perf_counter() - t0) * 1000
+        click.echo(f"[service {response['elapsed_ms']:.2f} ms, round trip {roundtrip:.2f} ms]", err=True)
+    return response
+
+
+@click.group()
+@click.option('--socket', 'socket_path', default=DEFAULT_SOCKET, show_default=True,
+              help='Unix socket of the service ($FITS_SERVICE_SOCKET)')
+@click.option('--timing', is_flag=True, help='Print service and round-trip latency to stderr')
+@click.pass_context
+def cli(ctx, socket_path, timing):
+    """FITS Metadata Service - keep astropy warm and serve header requests."""
+    ctx.ensure_object(dict)
+    ctx.obj['socket'] = socket_path
+    ctx.obj['timing'] = timing
+
+
+@cli.command('serve')
+@click.option('--cache-size', default=DEFAULT_CACHE_SIZE, show_default=True, type=int,
+              help='Number of files kept open')
+@click.option('--backup', is_flag=True, help='Create a backup before the first edit of each file')
+@click.pass_context
+def serve_command(ctx, cache_size, backup):
+    """Run the service in the foreground."""
+    try:
+        serve(ctx.obj['socket'], cache_size, backup)
+    except RuntimeError as e:
+        click.echo(f"Error: {e}", err=True)
+        sys.exit(1)
+
+
+@cli.command()
+@click.argument('fits_file', type=click.Path(exists=True))
+@click.option('--hdu', '-h', default=0, type=int, help='HDU index (default: 0)')
+@click.option('--filter', '-f', default=None, help='Filter keywords containing this text')
+@click.pass_context
+def view(ctx, fits_file, hdu, filter):
+    """Print header cards as tab-separated keyword, value, comment."""
+    response = run_request(ctx, {'op': 'view', 'file': os.path.abspath(fits_file), 'hdu': hdu, 'filter': filter})
+    for keyword, value, comment in response['cards']:
+        click.echo(f"{keyword}\t{value}\t{comment}")
+
+
+@cli.command()
+@click.argument('fits_file', type=click.Path(exists=True))
+@click.option('--hdu', '-h', default=0, type=int, help='HDU index (default: 0)')
+@click.option('--keyword', '-k', required=True, help='Keyword to add')
+@click.option('--value', '-v', required=True, help='Value for the keyword')
+@click.option('--comment', '-c', default='', help='Optional comment')
+@click.pass_context
+def add(ctx, fits_file, hdu, keyword, value, comment):
+    """Add a new keyword to FITS header."""
+    run_request(ctx, {'op': 'add', 'file': os.path.abspath(fits_file), 'hdu': hdu,
+                      'keyword': keyword, 'value': value, 'comment': comment, 'parse': True})
+    click.echo(f"✓ Added {keyword.upper()}")
+
+
+@cli.command()
+@click.argument('fits_file', type=click.Path(exists=True))
+@click.option('--hdu', '-h', default=0, type=int, help='HDU index (default: 0)')
+@click.option('--keyword', '-k', required=True, help='Keyword to update')
+@click.option('--value', '-v', required=True, help='New value for the keyword')
+@click.option('--comment', '-c', default=None, help='New comment (optional)')
+@click.pass_context
+def update(ctx, fits_file, hdu, keyword, value, comment):
+    """Update an existing keyword in FITS header."""
+    run_request(ctx, {'op': 'update', 'file': os.path.abspath(fits_file), 'hdu': hdu,
+                      'keyword': keyword, 'value': value, 'comment': comment, 'parse': True})
+    click.echo(f"✓ Updated {keyword.upper()}")
+
+
+@cli.command()
+@click.argument('fits_file', type=click.Path(exists=True))
+@click.option('--hdu', '-h', default=0, type=int, help='HDU index (default: 0)')
+@click.option('--keyword', '-k', required=True, help='Keyword to delete')
+@click.pass_context
+def delete(ctx, fits_file, hdu, keyword):
+    """Delete a keyword from FITS header (no confirmation prompt)."""
+    run_request(ctx, {'op': 'delete', 'file': os.path.abspath(fits_file), 'hdu': hdu, 'keyword': keyword})
+    click.echo(f"✓ Deleted {keyword.upper()}")
+
+
+@cli.command()
+@click.argument('fits_file', type=click.Path(exists=True))
+@click.argument('json_file', type=click.Path(exists=True))
+@click.option('--hdu', '-h', default=0, type=int, help='HDU index (default: 0)')
+@click.pass_context
+def batch(ctx, fits_file, json_file, hdu):
+    """Apply batch edits from a JSON file."""
+    with open(json_file, 'r') as f:
+        operations = json.load(f)
+    response = run_request(ctx, {'op': 'batch', 'file': os.path.abspath(fits_file), 'hdu': hdu,
+                                 'operations': operations})
+    for result in response['results']:
+        if result['ok']:
+            click.echo(f"✓ {result['keyword']}")
+        else:
+            click.echo(f"✗ Error processing {result['keyword']}: {result['error']}", err=True)
+
+
+@cli.command()
+@click.pass_context
+def stats(ctx):
+    """Show per-operation latency and cache statistics."""
+    click.echo(json.dumps(run_request(ctx, {'op': 'stats'}), indent=2))
+
+
+@cli.command()
+@click.pass_context
+def pipe(ctx):
+    """Forward JSON requests from stdin (one per line) and print the responses."""
+    with ServiceClient(ctx.obj['socket']) as client:
+        for line in sys.stdin:
+            if line.strip():
+                click.echo(json.dumps(client.request(json.loads(line))))
+
+
+if __name__ == '__main__':
+    cli()
@@ -6,65 +6,416 @@ A script to view and display metadata from FITS files.
 
 import os
 import sys
+import csv
+import json
+import time
+import shutil
 from pathlib import Path
-from typing import Dict, List, Tuple, Any, Optional
+from typing import TYPE_CHECKING, Callable, Dict, List, Tuple, Any, Optional, Iterator, TextIO, Union
 import click
-from astropy.io import fits
-from astropy.io.fits.header import Header
-from tabulate import tabulate
-import warnings
 
-# Suppress FITS verification warnings for better output
-warnings.filterwarnings('ignore', category=fits.verify.VerifyWarning)
+from fits_headers import (compression_of, iter_raw_headers, hdu_type_name,
+                          import_fits, split_fits_name, RawHeader)
+from fits_ranges import SOURCES, is_url, location_path, open_fits_stream
+from fits_profile import PROFILE_FORMATS, PhaseProfile, phase_context, profiled
+
+if TYPE_CHECKING:
+    from astropy.io.fits.header import Header
+
+# astropy and tabulate are imported on first use (see import_fits); headers are
+# parsed by fits_headers unless astropy's view of the file is needed
+AnyHeader = Union['Header', RawHeader]
+
+OUTPUT_FORMATS = ['table', 'json', 'ndjson', 'csv']
+
+
+def data_shape(header: AnyHeader) -> Optional[Tuple[int, ...]]:
+    """
+    Compute the data shape from the NAXISn keywords without reading the data.
+    
+    Args:
+        header: HDU header
+        
+    Returns:
+        Shape in numpy order (rows for tables), or None if the HDU has no data
+    """
+    naxis = header.get('NAXIS', 0)
+    if not naxis:
+        return None
+    if header.get('XTENSION') in ('BINTABLE', 'TABLE'):
+        return (header.get('NAXIS2', 0),)
+    return tuple(header.get(f'NAXIS{i}', 0) for i in range(naxis, 0, -1))
+
+
+def iter_cards(header: AnyHeader, 
+               filter_keyword: Optional[str] = None) -> Iterator[Tuple[str, Any, str]]:
+    """
+    Iterate over header cards with their raw values.
+    
+    Args:
+        header: HDU header
+        filter_keyword: Optional keyword to filter cards
+        
+    Yields:
+        Tuples (keyword, value, comment)
+    """
+    needle = filter_keyword.upper() if filter_keyword else None
+    for card in header.cards:
+        keyword = card.keyword
+        if needle and needle not in keyword.upper():
+            continue
+        yield keyword, card.value, card.comment
+
+
+def json_value(value: Any) -> Any:
+    """Convert a card value into a JSON-serializable value."""
+    if isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, complex):
+        return [value.real, value.imag]
+    if value is None:
+        return None
+    # Only astropy cards carry other value types, so astropy is already loaded
+    from astropy.io.fits.card import Undefined
+    if isinstance(value, Undefined):
+        return None
+    return str(value)
+
+
+class MetadataStreamWriter:
+    """Write header cards as JSON, NDJSON or CSV as soon as they are read."""
+    
+    def __init__(self, fmt: str, out: TextIO, show_comments: bool = True):
+        """
+        Initialize the stream writer.
+        
+        Args:
+            fmt: One of 'json', 'ndjson' or 'csv'
+            out: Text stream to write to
+            show_comments: Whether to include card comments
+        """
+        self.fmt = fmt
+        self.out = out
+        self.show_comments = show_comments
+        self.csv_writer = csv.writer(out) if fmt == 'csv' else None
+        self.files_written = 0
+        self.cards_in_file = 0
+        self.in_file = False
+    
+    def begin(self) -> None:
+        """Write the document preamble."""
+        if self.fmt == 'json':
+            self.out.write('{"files": [')
+        elif self.fmt == 'csv':
+            columns = ['file', 'hdu', 'name', 'keyword', 'value']
+            self.csv_writer.writerow(columns + ['comment'] if self.show_comments else columns)
+    
+    def begin_file(self, path: str) -> None:
+        """Start the records of one file."""
+        if self.fmt == 'json':
+            self.out.write(',' if self.files_written else '')
+            self.out.write(f'\n{{"path": {json.dumps(path)}, "cards": [')
+        self.cards_in_file = 0
+        self.in_file = True
+    
+    def card(self, path: str, hdu: Dict[str, Any], keyword: str, value: Any, comment: str) -> None:
+        """Write one header card."""
+        if self.fmt == 'csv':
+            row = [path, hdu['index'], hdu['name'], keyword, json_value(value)]
+            self.csv_writer.writerow(row + [comment] if self.show_comments else row)
+            return
+        record = {'hdu': hdu['index'], 'name': hdu['name'], 'keyword': keyword, 'value': json_value(value)}
+        if self.show_comments:
+            record['comment'] = comment
+        if self.fmt == 'ndjson':
+            record = {'type': 'card', 'file': path, **record}
+            self.out.write(json.dumps(record) + '\n')
+        else:
+            self.out.write((',' if self.cards_in_file else '') + '\n' + json.dumps(record))
+        self.cards_in_file += 1
+    
+    def end_file(self, path: str, size: int, hdus: List[Dict[str, Any]], complete: bool = True) -> None:
+        """
+        Write the summary of one file (once, after its cards; CSV has no summary rows).
+        
+        Args:
+            path: File the cards came from
+            size: File size in bytes
+            hdus: HDUs read
+            complete: Whether every HDU of the file was read; if not, the
+                summary has no 'hdu_count' (the file may have more HDUs)
+        """
+        summary: Dict[str, Any] = {'size_bytes': size}
+        if complete:
+            summary['hdu_count'] = len(hdus)
+        summary['hdus'] = [{'index': h['index'], 'name': h['name'], 'type': h['type'],
+                            'data_shape': list(h['data_shape']) if h['data_shape'] else None,
+                            'cards': len(h['header'])} for h in hdus]
+        if self.fmt == 'json':
+            self.out.write('\n], ' + json.dumps(summary)[1:])
+        elif self.fmt == 'ndjson':
+            self.out.write(json.dumps({'type': 'summary', 'file': path, **summary}) + '\n')
+        self.files_written += 1
+        self.in_file = False
+    
+    def error_file(self, path: str, error: str) -> None:
+        """
+        Record a file that could not be read, in place of its summary.
+        
+        Cards already written for it are kept; in JSON the file's object is
+        closed with an "error" member (or is just {"path", "error"}), so the
+        document stays valid. CSV has no error rows.
+        """
+        if self.fmt == 'json':
+            if self.in_file:
+                self.out.write(f'\n], "error": {json.dumps(error)}}}')
+            else:
+                self.out.write(',' if self.files_written else '')
+                self.out.write('\n' + json.dumps({'path': path, 'error': error}))
+        elif self.fmt == 'ndjson':
+            self.out.write(json.dumps({'type': 'error', 'file': path, 'error': error}) + '\n')
+        self.files_written += 1
+        self.in_file = False
+    
+    def end(self) -> None:
+        """Close the document."""
+        if self.fmt == 'json':
+            self.out.write('\n]}\n')
+        self.out.flush()
+
+
+def stream_metadata(viewer: 'FITSMetadataViewer', writer: MetadataStreamWriter,
+                    hdu_index: Optional[int] = 0,
+                    filter_keyword: Optional[str] = None) -> None:
+    """
+    Stream the cards of one file through a writer.
+    
+    Args:
+        viewer: Viewer for the file (load_file is not required)
+        writer: Output writer
+        hdu_index: HDU to write, or None for all HDUs
+        filter_keyword: Optional keyword to filter
+    """
+    if hdu_index is not None and hdu_index < 0:
+        raise ValueError(f"HDU index {hdu_index} out of range (must be 0 or greater)")
+    path = viewer.location
+    with viewer.phase('render'):
+        writer.begin_file(path)
+        hdus = []
+        # A single HDU of a gzip file only needs the stream up to its header;
+        # the summary then covers the HDUs read so far, without a total count
+        max_hdus = hdu_index + 1 if hdu_index is not None and viewer.compression == 'gzip' else None
+        for hdu in viewer.iter_hdus(max_hdus):
+            hdus.append(hdu)
+            if hdu_index is None or hdu['index'] == hdu_index:
+                for keyword, value, comment in iter_cards(hdu['header'], filter_keyword):
+                    writer.card(path, hdu, keyword, value, comment)
+        if hdu_index is not None and hdu_index >= len(hdus):
+            raise ValueError(f"HDU index {hdu_index} out of range (0-{len(hdus)-1})")
+        viewer.headers = hdus
+        writer.end_file(path, viewer.file_size(), hdus, complete=max_hdus is None or len(hdus) < max_hdus)
 
 
 class FITSMetadataViewer:
     """Class to handle FITS file metadata viewing operations."""
     
-    def __init__(self, filepath: str):
+    def __init__(self, filepath: str, source: str = 'auto',
+                 hooks: Optional[List[Callable[[Dict[str, Any]], None]]] = None):
         """
         Initialize the FITS metadata viewer.
         
         Args:
-            filepath: Path to the FITS file
+            filepath: Path to the FITS file, or an http(s) URL
+            source: Byte-range source for local files ('auto', 'file' or 'mmap')
+            hooks: Callables receiving a record per measured phase (see fits_profile)
         """
-        self.filepath = Path(filepath)
-        if not self.filepath.exists():
+        self.location = filepath if is_url(filepath) else str(Path(filepath))
+        self.filepath = location_path(filepath)
+        if not is_url(filepath) and not self.filepath.exists():
             raise FileNotFoundError(f"FITS file not found: {filepath}")
-        if not self.filepath.suffix.lower() in ['.fits', '.fit', '.fts']:
-            raise ValueError(f"File does not appear to be a FITS file: {filepath}")
+        # All reads go through byte-range streams that fetch header blocks only
+        self.source = source
+        self.streams = []
+        # Headers are parsed without astropy (.fits.gz is inflated only up to the
+        # needed blocks); tile-compressed .fz files are read by astropy so that
+        # compressed HDUs show their image header
+        self.compression = compression_of(self.filepath)
         
         self.hdulist = None
         self.headers = []
+        self.hooks = list(hooks or [])
+    
+    def add_hook(self, hook: Callable[[Dict[str, Any]], None]) -> None:
+        """Register a profiling hook; it is called with the record of every later phase."""
+        self.hooks.append(hook)
+    
+    def phase(self, name: str):
+        """Context manager measuring a phase of work on this file for the hooks."""
+        return phase_context(self.hooks, name, file=self.location)
     
     def load_file(self) -> None:
         """Load the FITS file and extract headers."""
+        if self.compression != 'tile':
+            self.headers = list(self.iter_hdus())
+            return
+        fits = self._import_fits()
         try:
-            self.hdulist = fits.open(self.filepath)
+            with self.phase('fits.open'):
+                self.hdulist = fits.open(self._open_stream())
             self.headers = []
+            with self.phase('parse'):
+                for i, hdu in enumerate(self.hdulist):
+                    self.headers.append({
+                        'index': i,
+                        'name': hdu.name if hdu.name else f'HDU{i}',
+                        'type': type(hdu).__name__,
+                        'header': hdu.header,
+                        'data_shape': data_shape(hdu.header)
+                    })
+        except Exception as e:
+            raise RuntimeError(f"Error loading FITS file: {e}")
+
+    def iter_hdus(self, max_hdus: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Iterate over HDUs without loading the whole file first.
+
+        HDUs are parsed one at a time as the iteration reaches them and data
+        units are never read, so streaming output can start right away.
+
+        Args:
+            max_hdus: Stop after this many HDUs (gzip files are not inflated further)
+
+        Yields:
+            Dictionaries with the same keys as the entries of self.headers
+        """
+        if self.compression != 'tile':
+            yield from self._iter_raw_hdus(max_hdus)
+            return
+        fits = self._import_fits()
+        try:
+            with self.phase('fits.open'):
+                self.hdulist = fits.open(self._open_stream(), lazy_load_hdus=True)
             for i, hdu in enumerate(self.hdulist):
-                self.headers.append({
+                yield {
                     'index': i,
                     'name': hdu.name if hdu.name else f'HDU{i}',
                     'type': type(hdu).__name__,
                     'header': hdu.header,
-                    'data_shape': hdu.data.shape if hdu.data is not None else None
-                })
+                    'data_shape': data_shape(hdu.header)
+                }
         except Exception as e:
             raise RuntimeError(f"Error loading FITS file: {e}")
     
+    def _iter_raw_hdus(self, max_hdus: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        """Read headers without astropy (gzip is inflated only as far as needed)."""
+        try:
+            with self._open_stream() as f:
+                raw_headers = iter_raw_headers(f, max_hdus)
+                while True:
+                    with self.phase('read'):
+                        item = next(raw_headers, None)
+                    if item is None:
+                        break
+                    i, header_bytes, values, _ = item
+                    with self.phase('parse'):
+                        if values.get('ZIMAGE'):
+                            # Compressed image inside plain FITS: let astropy build the image header
+                            hdu = self._astropy_hdu(i)
+                            header, name = hdu.header, hdu.name
+                        else:
+                            header = RawHeader.fromstring(header_bytes)
+                            name = str(header.get('EXTNAME', 'PRIMARY' if i == 0 else '')).strip()
+                    yield {
+                        'index': i,
+                        'name': name if name else f'HDU{i}',
+                        'type': hdu_type_name(i, values),
+                        'header': header,
+                        'data_shape': data_shape(header)
+                    }
+        except (OSError, ValueError) as e:
+            raise RuntimeError(f"Error loading FITS file: {e}")
+    
+    def _astropy_hdu(self, index: int):
+        """One HDU as presented by astropy (its header and name)."""
+        if self.hdulist is None:
+            fits = self._import_fits()
+            with self.phase('fits.open'):
+                self.hdulist = fits.open(self._open_stream(), lazy_load_hdus=True)
+        return self.hdulist[index]
+    
+    def _import_fits(self):
+        with self.phase('import'):
+            return import_fits()
+    
+    def _open_stream(self):
+        """Open a byte-range stream of the file (inflating for .fits.gz)."""
+        stream = open_fits_stream(self.location, self.source)
+        self.streams.append(stream)
+        return stream
+    
+    def file_size(self) -> int:
+        """Size of the file in bytes (as stored, i.e. compressed for .gz)."""
+        if is_url(self.location):
+            return self.streams[0].size() if self.streams else self._open_stream().size()
+        return self.filepath.stat().st_size
+    
+    def io_stats(self) -> Dict[str, int]:
+        """Requests, bytes fetched and block cache hits of all reads so far."""
+        totals = {'requests': 0, 'bytes_fetched': 0, 'cache_hits': 0}
+        for stream in self.streams:
+            for key, value in stream.stats().items():
+                totals[key] += value
+        return totals
+    
+    def image_info(self, hdu_index: Optional[int] = None) -> Dict[str, Any]:
+        """Shape and type of an image HDU (the first one with data if hdu_index is None)."""
+        from fits_preview import image_info
+        
+        self._require_local('Previews')
+        with self.phase('parse'):
+            return image_info(self.filepath, hdu_index)
+    
+    @profiled('preview')
+    def preview(self, hdu_index: Optional[int] = None, size: int = 256,
+                mode: str = 'block', plane: int = 0) -> Tuple[Any, Dict[str, Any]]:
+        """
+        Read a downsampled copy of an image HDU (see fits_preview.sample_image).
+        
+        Args:
+            hdu_index: HDU index, or None for the first HDU with image data
+            size: Largest dimension of the sample in pixels
+            mode: 'block' or 'stride'
+            plane: Plane of a data cube
+            
+        Returns:
+            Tuple (sample array, info dict with hdu, shape, step and elapsed_s)
+        """
+        from fits_preview import sample_image
+        
+        self._require_local('Previews')
+        start = time.perf_counter()
+        sample, info = sample_image(self.filepath, hdu_index, size, mode, plane)
+        info['elapsed_s'] = time.perf_counter() - start
+        return sample, info
+    
+    def _require_local(self, what: str) -> None:
+        if is_url(self.location):
+            raise ValueError(f"{what} need a local file: {self.location}")
+    
+    @profiled('close')
     def close(self) -> None:
         """Close the FITS file."""
         if self.hdulist:
             self.hdulist.close()
+        for stream in self.streams:
+            stream.close()
     
     def get_file_info(self) -> Dict[str, Any]:
         """Get basic file information."""
-        stat = self.filepath.stat()
         return {
             'filename': self.filepath.name,
-            'path': str(self.filepath.absolute()),
-            'size': f"{stat.st_size / (1024*1024):.2f} MB",
+            'path': self.location if is_url(self.location) else str(self.filepath.absolute()),
+            'size': f"{self.file_size() / (1024*1024):.2f} MB",
             'hdu_count': len(self.headers),
         }
     
@@ -99,15 +450,7 @@ class FITSMetadataViewer:
         header = self.headers[hdu_index]['header']
         cards = []
         
-        for card in header.cards:
-            keyword = card.keyword
-            value = card.value
-            comment = card.comment
-            
-            # Apply filter if specified
-            if filter_keyword and filter_keyword.upper() not in keyword.upper():
-                continue
-            
+        for keyword, value, comment in iter_cards(header, filter_keyword):
             # Format value for display
             if isinstance(value, str):
                 value = value.strip()
@@ -120,17 +463,10 @@ class FITSMetadataViewer:
         
         return cards
     
-    def display_metadata(self, hdu_index: int = 0, 
-                        filter_keyword: Optional[str] = None,
-                        show_comments: bool = True) -> None:
-        """
-        Display metadata in a formatted table.
+    def display_summary(self) -> None:
+        """Display file information and the HDU summary table."""
+        from tabulate import tabulate
         
-        Args:
-            hdu_index: Index of the HDU to display
-            filter_keyword: Optional keyword to filter
-            show_comments: Whether to show comment column
-        """
         # File info
         file_info = self.get_file_info()
         click.echo("\n" + "="*80)
@@ -146,6 +482,23 @@ class FITSMetadataViewer:
         hdu_summary = self.get_hdu_summary()
         headers = ['Index', 'Name', 'Type', 'Data Shape', 'Header Cards']
         click.echo(tabulate(hdu_summary, headers=headers, tablefmt='grid'))
+    
+    @profiled('render')
+    def display_metadata(self, hdu_index: int = 0, 
+                        filter_keyword: Optional[str] = None,
+                        show_comments: bool = True,
+                        show_summary: bool = True) -> None:
+        """
+        Display metadata in a formatted table.
+        
+        Args:
+            hdu_index: Index of the HDU to display
+            filter_keyword: Optional keyword to filter
+            show_comments: Whether to show comment column
+            show_summary: Whether to show file information and HDU summary first
+        """
+        if show_summary:
+            self.display_summary()
         
         # Header cards for selected HDU
         click.echo("\n" + "-"*80)
@@ -162,6 +515,8 @@ class FITSMetadataViewer:
             click.echo("No metadata found matching the criteria.")
             return
         
+        from tabulate import tabulate
+        
         # Prepare table data
         table_data = []
         for keyword, value, comment in cards:
@@ -180,9 +535,64 @@ class FITSMetadataViewer:
         click.echo(f"\nTotal cards displayed: {len(cards)}")
 
 
+def echo_io_stats(viewer: FITSMetadataViewer) -> None:
+    """Print the read statistics of a viewer on stderr."""
+    stats = viewer.io_stats()
+    click.echo(f"{viewer.location}: {stats['requests']} requests, {stats['bytes_fetched']} bytes read, "
+               f"{stats['cache_hits']} cache hits", err=True)
+
+
+def display_preview(viewer: FITSMetadataViewer, hdu_index: Optional[int], terminal: bool,
+                    png: Optional[Path], size: Optional[int], mode: str, plane: int, stretch: str) -> None:
+    """
+    Show a thumbnail of an image HDU in the terminal and/or write it as PNG.
+    
+    Args:
+        viewer: Viewer of a local file
+        hdu_index: HDU index, or None for the first HDU with image data
+        terminal: Render the thumbnail on stdout
+        png: PNG output path, or None
+        size: Largest thumbnail dimension in pixels (None: fit the terminal,
+            or DEFAULT_PNG_SIZE for PNG only)
+        mode: Sampling mode ('block' or 'stride')
+        plane: Plane of a data cube
+        stretch: Intensity stretch ('linear', 'log' or 'asinh')
+    """
+    import fits_preview
+    
+    if size is None and terminal:
+        columns, lines = shutil.get_terminal_size()
+        info = viewer.image_info(hdu_index)
+        hdu_index = info['hdu']
+        size = fits_preview.thumbnail_size(info['shape'], columns, lines - 2)
+    sample, info = viewer.preview(hdu_index, size or fits_preview.DEFAULT_PNG_SIZE, mode, plane)
+    pixels = fits_preview.to_uint8(sample, stretch)
+    shape = 'x'.join(str(n) for n in reversed(info['shape']))
+    click.echo(f"{viewer.filepath.name} HDU {info['hdu']}: {shape} (BITPIX {info['bitpix']}), "
+               f"step {info['step']}, {info['block']}x{info['block']} {mode} -> "
+               f"{pixels.shape[1]}x{pixels.shape[0]} in {info['elapsed_s']:.3f} s")
+    if terminal:
+        color = click.get_text_stream('stdout').isatty()
+        for line in fits_preview.terminal_lines(pixels, color):
+            click.echo(line)
+    if png is not None:
+        fits_preview.write_png(str(png), pixels)
+        click.echo(f"Preview saved to: {png}")
+
+
+def preview_path(png: str, fits_file: str, several: bool) -> Path:
+    """PNG path for a file: png itself, or <stem>_preview.png inside png for several files."""
+    target = Path(png)
+    if several or target.is_dir():
+        stem, _ = split_fits_name(location_path(fits_file))
+        target.mkdir(parents=True, exist_ok=True)
+        return target / f"{stem}_preview.png"
+    return target
+
+
 @click.command()
-@click.argument('fits_file', type=click.Path(exists=True))
-@click.option('--hdu', '-h', default=0, type=int, 
+@click.argument('fits_files', nargs=-1, required=True)
+@click.option('--hdu', '-h', default=0, type=click.IntRange(min=0), 
               help='HDU index to display (default: 0)')
 @click.option('--filter', '-f', default=None, 
               help='Filter keywords containing this text')
@@ -190,43 +600,135 @@ class FITSMetadataViewer:
               help='Hide comment column')
 @click.option('--all-hdus', '-a', is_flag=True,
               help='Show metadata for all HDUs')
-def main(fits_file: str, hdu: int, filter: str, no_comments: bool, all_hdus: bool):
+@click.option('--format', 'output_format', type=click.Choice(OUTPUT_FORMATS), default='table',
+              help='Output format (json/ndjson/csv stream cards without truncation)')
+@click.option('--source', type=click.Choice(SOURCES), default='auto',
+              help='How local files are read (file: positional reads, mmap: memory map)')
+@click.option('--io-stats', is_flag=True, help='Report requests and bytes read per file on stderr')
+@click.option('--profile', is_flag=True, help='Report time, I/O and peak RSS per phase on stderr')
+@click.option('--profile-format', type=click.Choice(PROFILE_FORMATS), default='table',
+              help='Profile report format (default: table)')
+@click.option('--profile-output', type=click.Path(), default=None,
+              help='Write the profile report to a file instead of stderr')
+@click.option('--preview', is_flag=True,
+              help='Show a downsampled thumbnail of the image instead of the header')
+@click.option('--png', type=click.Path(), default=None,
+              help='Write the thumbnail as PNG (a directory when several files are given)')
+@click.option('--preview-size', type=click.IntRange(min=1), default=None,
+              help='Largest thumbnail dimension in pixels (default: terminal size, 256 for PNG)')
+@click.option('--preview-mode', type=click.Choice(['block', 'stride']), default='block',
+              help='block: mean of small blocks, stride: single pixels (default: block)')
+@click.option('--stretch', type=click.Choice(['linear', 'log', 'asinh']), default='linear',
+              help='Intensity stretch between the 0.5 and 99.5 percentiles (default: linear)')
+@click.option('--plane', type=click.IntRange(min=0), default=0,
+              help='Plane of a data cube to preview (default: 0)')
+@click.pass_context
+def main(ctx, fits_files: Tuple[str, ...], hdu: int, filter: str, no_comments: bool, all_hdus: bool,
+         output_format: str, source: str, io_stats: bool, profile: bool, profile_format: str,
+         profile_output: Optional[str], preview: bool, png: Optional[str], preview_size: Optional[int],
+         preview_mode: str, stretch: str, plane: int):
     """
     View metadata from FITS files.
     
-    FITS_FILE: Path to the FITS file to view.
+    FITS_FILES: Paths or http(s) URLs of the FITS files to view (URLs are
+    read with HTTP Range requests, fetching only the header blocks).
     
     Examples:
         fits_metadata_viewer.py myfile.fits
         fits_metadata_viewer.py myfile.fits --hdu 1
         fits_metadata_viewer.py myfile.fits --filter DATE
         fits_metadata_viewer.py myfile.fits --all-hdus
+        fits_metadata_viewer.py *.fits --all-hdus --format ndjson
+        fits_metadata_viewer.py https://example.org/archive/obs1.fits --io-stats
+        fits_metadata_viewer.py large.fits --preview
+        fits_metadata_viewer.py *.fits --png previews/ --stretch asinh
     """
+    hooks = []
+    if profile:
+        # Aggregated over all files; reported even when a file fails
+        profiler = PhaseProfile()
+        hooks.append(profiler)
+        ctx.call_on_close(lambda: profiler.write(profile_format, profile_output))
     try:
-        viewer = FITSMetadataViewer(fits_file)
-        viewer.load_file()
+        if preview or png:
+            # Without an explicit --hdu the first HDU with image data is shown
+            explicit = ctx.get_parameter_source('hdu') != click.core.ParameterSource.DEFAULT
+            for n, fits_file in enumerate(fits_files):
+                if n > 0 and preview:
+                    click.echo()
+                viewer = FITSMetadataViewer(fits_file, source, hooks)
+                try:
+                    display_preview(viewer, hdu if explicit else None, preview,
+                                    preview_path(png, fits_file, len(fits_files) > 1) if png else None,
+                                    preview_size, preview_mode, plane, stretch)
+                finally:
+                    viewer.close()
+            return
         
-        if all_hdus:
-            # Display metadata for all HDUs
-            file_info = viewer.get_file_info()
-            for i in range(file_info['hdu_count']):
+        if output_format != 'table':
+            writer = MetadataStreamWriter(output_format, click.get_text_stream('stdout'),
+                                          show_comments=not no_comments)
+            writer.begin()
+            failed = False
+            try:
+                for fits_file in fits_files:
+                    # One unreadable file must not cut the document short or skip the rest
+                    viewer = None
+                    try:
+                        viewer = FITSMetadataViewer(fits_file, source, hooks)
+                        stream_metadata(viewer, writer, None if all_hdus else hdu, filter)
+                    except BrokenPipeError:
+                        raise
+                    except Exception as e:
+                        failed = True
+                        writer.error_file(fits_file, str(e))
+                        click.echo(f"Error: {fits_file}: {e}", err=True)
+                    finally:
+                        if viewer is not None:
+                            viewer.close()
+                    if io_stats and viewer is not None:
+                        echo_io_stats(viewer)
+            finally:
+                writer.end()
+            if failed:
+                sys.exit(1)
+            return
+        
+        for n, fits_file in enumerate(fits_files):
+            if n > 0:
+                click.echo("\n" + "="*80 + "\n")
+            
+            viewer = FITSMetadataViewer(fits_file, source, hooks)
+            viewer.load_file()
+            
+            if all_hdus:
+                # Display metadata for all HDUs, with the file summary shown once
+                hdu_count = len(viewer.headers)
+                for i in range(hdu_count):
+                    viewer.display_metadata(
+                        hdu_index=i, 
+                        filter_keyword=filter,
+                        show_comments=not no_comments,
+                        show_summary=(i == 0)
+                    )
+                    if i < hdu_count - 1:
+                        click.echo("\n" + "="*80 + "\n")
+            else:
+                # Display metadata for specified HDU
                 viewer.display_metadata(
-                    hdu_index=i, 
+                    hdu_index=hdu, 
                     filter_keyword=filter,
                     show_comments=not no_comments
                 )
-                if i < file_info['hdu_count'] - 1:
-                    click.echo("\n" + "="*80 + "\n")
-        else:
-            # Display metadata for specified HDU
-            viewer.display_metadata(
-                hdu_index=hdu, 
-                filter_keyword=filter,
-                show_comments=not no_comments
-            )
-        
-        viewer.close()
+            
+            viewer.close()
+            if io_stats:
+                echo_io_stats(viewer)
         
+    except BrokenPipeError:
+        # Downstream stage closed the pipe (e.g. `| head`): stop quietly
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        sys.exit(0)
     except FileNotFoundError as e:
         click.echo(f"Error: {e}", err=True)
         sys.exit(1)
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+FITS Worker Pools
+Process pool helpers shared by the commands that spread files over workers
+(index export, bulk edits, the watch-folder daemon).
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Optional, Tuple
+
+MAX_CHUNKSIZE = 64
+
+
+def chunksize(items: int, workers: int) -> int:
+    """
+    Items handed to a worker per task for Executor.map.
+
+    Headers take milliseconds to read, so a task per file would spend most of
+    its time on inter-process overhead; each worker gets several at a time,
+    while keeping about four chunks per worker to balance uneven files.
+
+    Args:
+        items: Number of items to map
+        workers: Worker processes
+
+    Returns:
+        Chunk size (1 to MAX_CHUNKSIZE)
+    """
+    return max(1, min(MAX_CHUNKSIZE, items // (workers * 4)))
+
+
+def _init_worker(initializer: Optional[Callable[..., Any]], initargs: Tuple[Any, ...]) -> None:
+    from fits_headers import import_fits
+    if initializer is not None:
+        initializer(*initargs)
+    import_fits()  # Pay for astropy once per worker, not in the first file's timing
+
+
+def process_pool(workers: int, initializer: Optional[Callable[..., Any]] = None,
+                 initargs: Tuple[Any, ...] = ()) -> ProcessPoolExecutor:
+    """
+    Process pool whose workers import astropy before taking work.
+
+    Args:
+        workers: Worker processes
+        initializer: Optional per-worker setup, run before the import
+        initargs: Arguments for initializer
+
+    Returns:
+        The ProcessPoolExecutor
+    """
+    return ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(initializer, initargs))
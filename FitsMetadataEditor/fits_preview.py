@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""
+FITS Image Preview
+Downsampled thumbnails of image HDUs without loading the image.
+
+The image is sampled on a regular grid sized for the thumbnail: every
+step-th row is read and, from each of those rows, only the sampled columns.
+Plain FITS files are memory-mapped, so only the pages under the sampled
+pixels are read; tile-compressed (.fz) images are read through astropy's
+section, which decompresses only the tiles of the sampled rows. In both cases
+time and memory depend on the thumbnail size, not on the image size.
+.fits.gz files cannot be read at random, so they are inflated as a stream up
+to the last sampled row (memory stays constant, time grows with the file).
+
+Sampling modes:
+    stride   One pixel per grid cell
+    block    Mean of a small block (up to BLOCK_MAX x BLOCK_MAX pixels) per
+             grid cell, which suppresses noise and hot pixels
+
+Thumbnails are written as 8-bit grayscale PNG (standard library only) or
+rendered in the terminal with half-block characters and 24-bit colour.
+"""
+
+import math
+import mmap
+import struct
+import zlib
+import warnings
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from fits_headers import RawHeader, compression_of, import_fits, iter_raw_headers, open_raw
+
+PREVIEW_MODES = ['block', 'stride']
+STRETCHES = ['linear', 'log', 'asinh']
+BLOCK_MAX = 4
+DENSE_BAND = 64  # Rows per read of a compressed image sampled at step <= 2 * block
+DEFAULT_PNG_SIZE = 256
+BITPIX_DTYPES = {8: 'u1', 16: '>i2', 32: '>i4', 64: '>i8', -32: '>f4', -64: '>f8'}
+
+
+class _MemmapRows:
+    """Rows of an uncompressed image, memory-mapped (only touched pages are read)."""
+
+    def __init__(self, path: Path, offset: int, dtype: str, shape: Tuple[int, ...], plane: int):
+        ny, nx = shape[-2:]
+        self.row_bytes = nx * np.dtype(dtype).itemsize
+        offset += plane * ny * self.row_bytes
+        self.array = np.memmap(path, dtype=dtype, mode='r', shape=(ny, nx), offset=offset)
+        self.base = offset % mmap.ALLOCATIONGRANULARITY  # Image start within the mapping
+        if hasattr(mmap, 'MADV_RANDOM'):
+            self.array._mmap.madvise(mmap.MADV_RANDOM)  # No read-ahead past the sampled rows
+
+    def rows(self, start: int, count: int) -> np.ndarray:
+        return self.array[start:start + count]  # A view: nothing is read until indexed
+
+    def release(self, start: int, count: int) -> None:
+        """Drop the pages of sampled rows from the process, so RSS stays flat."""
+        if not hasattr(mmap, 'MADV_DONTNEED'):
+            return
+        first = self.base + start * self.row_bytes
+        first -= first % mmap.PAGESIZE
+        last = self.base + (start + count) * self.row_bytes
+        self.array._mmap.madvise(mmap.MADV_DONTNEED, first, last - first)
+
+    def close(self) -> None:
+        self.array._mmap.close()
+
+
+class _StreamRows:
+    """Rows of an image inside a .fits.gz stream, read forward only."""
+
+    def __init__(self, path: Path, offset: int, dtype: str, shape: Tuple[int, ...], plane: int):
+        self.f = open_raw(path)
+        self.dtype = np.dtype(dtype)
+        ny, nx = shape[-2:]
+        self.nx = nx
+        self.start = offset + plane * ny * nx * self.dtype.itemsize
+
+    def rows(self, start: int, count: int) -> np.ndarray:
+        row_bytes = self.nx * self.dtype.itemsize
+        self.f.seek(self.start + start * row_bytes)
+        data = self.f.read(count * row_bytes)
+        return np.frombuffer(data, dtype=self.dtype).reshape(-1, self.nx)
+
+    def release(self, start: int, count: int) -> None:
+        pass
+
+    def close(self) -> None:
+        self.f.close()
+
+
+class _SectionRows:
+    """
+    Rows of a tile-compressed image; astropy decompresses only the tiles they cross.
+
+    Reads are whole tile rows, kept until a sampled row falls outside them, so
+    a tile taller than the sampling step is decompressed once. When most rows
+    are sampled anyway, reads are widened to DENSE_BAND rows to save calls.
+    """
+
+    def __init__(self, hdulist, index: int, plane: int, tile_height: int, dense: bool):
+        self.hdulist = hdulist
+        self.section = hdulist[index].section
+        shape = hdulist[index].shape
+        self.ny = shape[-2]
+        self.plane = np.unravel_index(plane, shape[:-2]) if len(shape) > 2 else ()
+        self.height = max(1, tile_height)
+        if dense:
+            self.height *= -(-DENSE_BAND // self.height)
+        self.band = None
+        self.band_start = 0
+
+    def rows(self, start: int, count: int) -> np.ndarray:
+        end = start + count
+        if self.band is None or start < self.band_start or end > self.band_start + len(self.band):
+            first = start - start % self.height
+            last = min(self.ny, end + -(end - first) % self.height)  # Round up to whole tile rows
+            self.band = self.section[self.plane + (slice(first, last), slice(None))]
+            self.band_start = first
+        return self.band[start - self.band_start:end - self.band_start]
+
+    def release(self, start: int, count: int) -> None:
+        pass
+
+    def close(self) -> None:
+        self.hdulist.close()
+
+
+def image_info(path: Path, hdu: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Locate an image HDU and its data unit.
+
+    Args:
+        path: FITS file
+        hdu: HDU index, or None for the first HDU with image data
+
+    Returns:
+        {'hdu', 'shape', 'bitpix', 'offset', 'header', 'compressed'}
+
+    Raises:
+        ValueError: If the HDU does not exist or holds no image
+    """
+    compression = compression_of(path)
+    max_hdus = hdu + 1 if hdu is not None else None
+    with open_raw(path) as f:
+        for index, header_bytes, values, header_offset in iter_raw_headers(f, max_hdus):
+            if hdu is not None and index != hdu:
+                continue
+            naxis = values.get('NAXIS') or 0
+            xtension = (values.get('XTENSION') or '').strip()
+            compressed = bool(values.get('ZIMAGE'))
+            is_image = (index == 0 and not values.get('GROUPS')) or xtension == 'IMAGE'
+            if not (compressed or (is_image and naxis >= 2)):
+                if hdu is not None:
+                    raise ValueError(f"HDU {hdu} has no image data")
+                continue
+            header = RawHeader.fromstring(header_bytes)
+            if compressed:
+                shape = tuple(header.get(f'ZNAXIS{i}') for i in range(header.get('ZNAXIS', 0), 0, -1))
+                bitpix = header.get('ZBITPIX')
+            else:
+                shape = tuple(values[f'NAXIS{i}'] for i in range(naxis, 0, -1))
+                bitpix = values['BITPIX']
+            if len(shape) < 2 or 0 in shape:
+                if hdu is not None:
+                    raise ValueError(f"HDU {index} has no 2-D image data")
+                continue
+            if compressed and compression == 'gzip':
+                raise ValueError("Tile-compressed images inside .fits.gz are not supported")
+            return {'hdu': index, 'shape': shape, 'bitpix': bitpix, 'header': header,
+                    'offset': header_offset + len(header_bytes), 'compressed': compressed}
+    if hdu is not None:
+        raise ValueError(f"HDU index {hdu} out of range")
+    raise ValueError("No image HDU found")
+
+
+def _grid(n: int, step: int, k: int) -> np.ndarray:
+    """Start index of the k-pixel block centred in each step-sized cell."""
+    starts = np.arange(0, n - k + 1, step) + (step - k) // 2
+    return np.minimum(starts, n - k)
+
+
+def sample_image(path: str, hdu: Optional[int] = None, size: int = DEFAULT_PNG_SIZE,
+                 mode: str = 'block', plane: int = 0) -> Tuple[np.ndarray, Dict[str, Any]]:
+    """
+    Read a downsampled copy of an image HDU.
+
+    Args:
+        path: FITS file
+        hdu: HDU index, or None for the first image HDU
+        size: Largest dimension of the sample in pixels
+        mode: 'block' (mean of small blocks) or 'stride' (single pixels)
+        plane: Plane of a cube (index over the axes beyond the first two)
+
+    Returns:
+        Tuple (float64 array in FITS row order, info); BSCALE/BZERO are
+        applied and BLANK pixels are NaN. info holds hdu, shape, step and
+        sample shape.
+    """
+    if mode not in PREVIEW_MODES:
+        raise ValueError(f"Unknown preview mode '{mode}'")
+    path = Path(path)
+    info = image_info(path, hdu)
+    shape = info['shape']
+    planes = int(np.prod(shape[:-2])) if len(shape) > 2 else 1
+    if not 0 <= plane < planes:
+        raise ValueError(f"Plane {plane} out of range (0-{planes - 1})")
+    ny, nx = shape[-2:]
+    step = max(1, math.ceil(max(ny, nx) / max(1, size)))
+    k = min(step, BLOCK_MAX) if mode == 'block' else 1
+    row_starts, col_starts = _grid(ny, step, k), _grid(nx, step, k)
+    columns = (col_starts[:, None] + np.arange(k)).ravel()
+
+    header = info['header']
+    scale, zero, blank = 1.0, 0.0, None
+    if info['compressed']:
+        fits = import_fits()
+        hdulist = fits.open(path)
+        reader = _SectionRows(hdulist, info['hdu'], plane, header.get('ZTILE2', 1),
+                              dense=step <= 2 * k)  # Scaled by astropy
+    else:
+        scale, zero = float(header.get('BSCALE', 1.0)), float(header.get('BZERO', 0.0))
+        blank = header.get('BLANK') if info['bitpix'] > 0 else None
+        dtype = BITPIX_DTYPES[info['bitpix']]
+        rows_class = _StreamRows if compression_of(path) == 'gzip' else _MemmapRows
+        reader = rows_class(path, info['offset'], dtype, shape, plane)
+
+    sample = np.empty((len(row_starts), len(col_starts)))
+    try:
+        for i, start in enumerate(row_starts):
+            raw = np.asarray(reader.rows(int(start), k))[:, columns]
+            values = raw.astype(np.float64)
+            if blank is not None:
+                values[raw == blank] = np.nan
+            cells = values.reshape(k, len(col_starts), k)
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', RuntimeWarning)  # All-BLANK blocks become NaN
+                sample[i] = np.nanmean(cells, axis=(0, 2)) if k > 1 else cells[0, :, 0]
+            reader.release(int(start), k)
+    finally:
+        reader.close()
+    if scale != 1.0 or zero != 0.0:
+        sample = sample * scale + zero
+    info = {key: info[key] for key in ('hdu', 'shape', 'bitpix')}
+    info.update(step=step, block=k, sample_shape=sample.shape, plane=plane)
+    return sample, info
+
+
+def to_uint8(sample: np.ndarray, stretch: str = 'linear',
+             limits: Tuple[float, float] = (0.5, 99.5)) -> np.ndarray:
+    """
+    Scale a sample to 0-255 between percentiles, with an optional stretch.
+
+    NaN pixels become 0. The result is flipped so the first FITS row is at the
+    bottom, as images are conventionally displayed.
+    """
+    finite = sample[np.isfinite(sample)]
+    if finite.size == 0:
+        return np.zeros(sample.shape, dtype=np.uint8)[::-1]
+    low, high = np.percentile(finite, limits)
+    if high <= low:
+        high = low + 1.0
+    scaled = np.clip((np.nan_to_num(sample, nan=low) - low) / (high - low), 0.0, 1.0)
+    if stretch == 'log':
+        scaled = np.log1p(1000.0 * scaled) / np.log1p(1000.0)
+    elif stretch == 'asinh':
+        scaled = np.arcsinh(10.0 * scaled) / np.arcsinh(10.0)
+    return (scaled * 255.0 + 0.5).astype(np.uint8)[::-1]
+
+
+def write_png(path: str, pixels: np.ndarray) -> None:
+    """Write a 2-D uint8 array as an 8-bit grayscale PNG."""
+    height, width = pixels.shape
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+    # Each scanline is prefixed with filter type 0 (none)
+    raw = np.hstack([np.zeros((height, 1), dtype=np.uint8), pixels]).tobytes()
+    with open(path, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        f.write(chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 0, 0, 0, 0)))
+        f.write(chunk(b'IDAT', zlib.compress(raw, 6)))
+        f.write(chunk(b'IEND', b''))
+
+
+def terminal_lines(pixels: np.ndarray, color: bool = True) -> List[str]:
+    """
+    Render a uint8 image as terminal lines, two pixel rows per line.
+
+    With color, each character is an upper half block whose foreground and
+    background are the two gray levels (24-bit ANSI); otherwise an ASCII
+    ramp is used for the mean of the two rows.
+    """
+    if pixels.shape[0] % 2:
+        pixels = np.vstack([pixels, pixels[-1:]])
+    top, bottom = pixels[0::2], pixels[1::2]
+    lines = []
+    if color:
+        for upper, lower in zip(top.tolist(), bottom.tolist()):
+            lines.append(''.join(f'\x1b[38;2;{u};{u};{u}m\x1b[48;2;{v};{v};{v}m▀'
+                                 for u, v in zip(upper, lower)) + '\x1b[0m')
+    else:
+        ramp = ' .:-=+*#%@'
+        levels = ((top.astype(np.uint16) + bottom) * (len(ramp) - 1) // 510).tolist()
+        lines = [''.join(ramp[v] for v in row) for row in levels]
+    return lines
+
+
+def thumbnail_size(shape: Tuple[int, ...], columns: int, lines: int) -> int:
+    """
+    Sample size that fits an image into a terminal.
+
+    Args:
+        shape: Image shape (the last two axes are used)
+        columns: Terminal width in characters
+        lines: Terminal height in lines (two pixel rows each)
+
+    Returns:
+        Largest sample dimension for sample_image()
+    """
+    ny, nx = shape[-2:]
+    longest = max(ny, nx)
+    return max(1, min(columns * longest // nx, 2 * lines * longest // ny))
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+FITS Profiling Hooks
+Per-phase wall time, bytes read/written and peak RSS of editor and viewer work.
+
+FITSMetadataEditor and FITSMetadataViewer wrap their phases (import,
+fits.open, parse, edit, create_backup, checksum, flush, render, close) in
+phase(). Each registered hook is called with one record per finished phase:
+
+    {'phase': 'flush', 'file': 'obs1.fits', 'wall_s': 0.012, 'self_s': 0.012,
+     'read_bytes': 0, 'write_bytes': 5760, 'peak_rss': 61734912}
+
+Nothing is measured while no hook is registered. PhaseProfile is a hook that
+aggregates records, e.g. over all files of a batch, and renders them as a
+table or JSON.
+
+Phases nest (rendering reads headers, saving computes checksums). self_s and
+the byte counts exclude nested phases, so they add up to the profiled total;
+wall_s and peak_rss include them. Bytes are the process's read()/write()
+totals from /proc/self/io, so they include output written while rendering but
+not memory-mapped access. Peak RSS is per phase where the kernel allows the
+high-water mark to be reset (/proc/self/clear_refs), otherwise it is the
+process peak so far. Without /proc (non-Linux) byte counts are None.
+"""
+
+import sys
+import time
+import functools
+import threading
+from contextlib import contextmanager, nullcontext
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+Hook = Callable[[Dict[str, Any]], None]
+PROFILE_FORMATS = ['table', 'json']
+
+_local = threading.local()
+_proc_read = 0  # Bytes read from /proc by this module, excluded from rchar
+_proc_written = 0  # Bytes written to /proc/self/clear_refs, excluded from wchar
+
+
+class _Frame:
+    __slots__ = ('t0', 'io', 'peak', 'child_wall', 'child_read', 'child_written')
+
+    def __init__(self, t0: float, io: Optional[Tuple[int, int]]):
+        self.t0 = t0
+        self.io = io
+        self.peak = 0
+        self.child_wall = 0.0
+        self.child_read = 0
+        self.child_written = 0
+
+
+def _read_proc(name: str) -> Optional[bytes]:
+    global _proc_read
+    try:
+        with open(f'/proc/self/{name}', 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None
+    _proc_read += len(data)
+    return data
+
+
+def io_counters() -> Optional[Tuple[int, int]]:
+    """(bytes read, bytes written) by the process so far, or None if unknown."""
+    data = _read_proc('io')
+    if data is None:
+        return None
+    fields = dict(line.split(b': ') for line in data.splitlines())
+    # Our own /proc reads so far; the one just made is counted from the next call on
+    return int(fields[b'rchar']) - (_proc_read - len(data)), int(fields[b'wchar']) - _proc_written
+
+
+def peak_rss() -> int:
+    """Peak resident set size in bytes since the last reset_peak_rss()."""
+    data = _read_proc('status')
+    if data is not None:
+        for line in data.splitlines():
+            if line.startswith(b'VmHWM:'):
+                return int(line.split()[1]) * 1024
+    try:
+        import resource
+    except ImportError:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def reset_peak_rss() -> None:
+    """Reset the kernel's RSS high-water mark, where supported."""
+    global _proc_written
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        _proc_written += 1
+    except OSError:
+        pass
+
+
+@contextmanager
+def measure(name: str, hooks: List[Hook], **context):
+    """
+    Measure a phase and report it to hooks (a no-op without hooks).
+
+    Args:
+        name: Phase name
+        hooks: Callables that receive the phase record
+        **context: Extra fields for the record (e.g. file)
+    """
+    if not hooks:
+        yield
+        return
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    if stack:
+        stack[-1].peak = max(stack[-1].peak, peak_rss())  # Before the reset hides it
+    reset_peak_rss()
+    frame = _Frame(time.perf_counter(), io_counters())
+    stack.append(frame)
+    try:
+        yield
+    finally:
+        wall = time.perf_counter() - frame.t0
+        io = io_counters()
+        stack.pop()
+        peak = max(frame.peak, peak_rss())
+        read = written = None
+        if io is not None and frame.io is not None:
+            read, written = io[0] - frame.io[0], io[1] - frame.io[1]
+        record = dict(context, phase=name, wall_s=wall, self_s=wall - frame.child_wall,
+                      read_bytes=None if read is None else read - frame.child_read,
+                      write_bytes=None if written is None else written - frame.child_written,
+                      peak_rss=peak)
+        if stack:
+            parent = stack[-1]
+            parent.child_wall += wall
+            parent.child_read += read or 0
+            parent.child_written += written or 0
+            parent.peak = max(parent.peak, peak)
+        for hook in hooks:
+            hook(record)
+
+
+def phase_context(hooks: List[Hook], name: str, **context):
+    """measure() when hooks are registered, otherwise a shared no-op context."""
+    return measure(name, hooks, **context) if hooks else nullcontext()
+
+
+def profiled(name: str):
+    """Decorator measuring a whole method as a phase of self (see phase())."""
+    def decorate(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with self.phase(name):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def _size(n: Optional[int]) -> str:
+    if n is None:
+        return '-'
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if abs(n) < 1024 or unit == 'GB':
+            return f"{n:.0f} {unit}" if unit == 'B' else f"{n:.1f} {unit}"
+        n /= 1024
+
+
+def percentiles(samples: Iterable[float], unit: str = 's', digits: int = 4) -> Dict[str, Any]:
+    """
+    Count, mean, p50, p99 and max of latency samples.
+
+    Args:
+        samples: Latencies, e.g. the last N kept in a deque
+        unit: Unit of the samples, used as key suffix ('mean_s', 'p99_ms', ...)
+        digits: Decimal places the values are rounded to
+
+    Returns:
+        Summary dict ({'count': 0} without samples)
+    """
+    ordered = sorted(samples)
+    if not ordered:
+        return {'count': 0}
+    return {
+        'count': len(ordered),
+        f'mean_{unit}': round(sum(ordered) / len(ordered), digits),
+        f'p50_{unit}': round(ordered[len(ordered) // 2], digits),
+        f'p99_{unit}': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))], digits),
+        f'max_{unit}': round(ordered[-1], digits),
+    }
+
+
+class PhaseProfile:
+    """Hook that aggregates phase records over any number of files."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases: Dict[str, Dict[str, Any]] = {}
+        self.files: Dict[str, Dict[str, float]] = {}
+
+    def __call__(self, record: Dict[str, Any]) -> None:
+        entry = self.phases.setdefault(record['phase'], {
+            'calls': 0, 'files': set(), 'self_s': 0.0, 'max_s': 0.0,
+            'read_bytes': None, 'write_bytes': None, 'peak_rss': 0})
+        entry['calls'] += 1
+        entry['self_s'] += record['self_s']
+        entry['max_s'] = max(entry['max_s'], record['self_s'])
+        entry['peak_rss'] = max(entry['peak_rss'], record['peak_rss'])
+        for key in ('read_bytes', 'write_bytes'):
+            if record[key] is not None:
+                entry[key] = (entry[key] or 0) + record[key]
+        path = record.get('file')
+        if path is not None:
+            entry['files'].add(path)
+            per_file = self.files.setdefault(path, {})
+            per_file[record['phase']] = per_file.get(record['phase'], 0.0) + record['self_s']
+
+    def summary(self) -> Dict[str, Any]:
+        """Aggregated phases (in first-seen order), per-file times and totals."""
+        phases = {}
+        for name, entry in self.phases.items():
+            phases[name] = dict(entry, files=len(entry['files']), self_s=round(entry['self_s'], 6),
+                                max_s=round(entry['max_s'], 6),
+                                mean_s=round(entry['self_s'] / entry['calls'], 6))
+        return {
+            'elapsed_s': round(time.perf_counter() - self.started, 6),
+            'profiled_s': round(sum(e['self_s'] for e in self.phases.values()), 6),
+            'files': len(self.files),
+            'phases': phases,
+            'per_file': {path: {k: round(v, 6) for k, v in times.items()} for path, times in self.files.items()},
+        }
+
+    def table(self) -> str:
+        """Summary as a text table, one row per phase."""
+        from tabulate import tabulate
+
+        summary = self.summary()
+        total = summary['profiled_s'] or 1.0
+        rows = [[name, e['calls'], e['files'], f"{e['self_s']:.4f}", f"{e['mean_s'] * 1000:.2f}",
+                 f"{e['max_s'] * 1000:.2f}", f"{e['self_s'] / total * 100:.1f}",
+                 _size(e['read_bytes']), _size(e['write_bytes']), _size(e['peak_rss'])]
+                for name, e in summary['phases'].items()]
+        headers = ['Phase', 'Calls', 'Files', 'Time (s)', 'Mean (ms)', 'Max (ms)', '%',
+                   'Read', 'Written', 'Peak RSS']
+        return (tabulate(rows, headers=headers, tablefmt='simple') +
+                f"\nProfiled {summary['profiled_s']:.4f} s of {summary['elapsed_s']:.4f} s "
+                f"over {summary['files']} file(s)")
+
+    def report(self, fmt: str = 'table') -> str:
+        """Render the summary as 'table' or 'json'."""
+        if fmt == 'json':
+            import json
+            return json.dumps(self.summary(), indent=2)
+        return self.table()
+
+    def write(self, fmt: str = 'table', output: Optional[str] = None) -> None:
+        """Print the report on stderr, or write it to a file."""
+        report = self.report(fmt)
+        if output:
+            with open(output, 'w') as f:
+                f.write(report + '\n')
+        else:
+            import click
+            click.echo(report, err=True)
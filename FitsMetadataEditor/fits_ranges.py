@@ -0,0 +1,425 @@
+#!/usr/bin/env python3
+"""
+FITS Byte-Range Reader
+Read FITS headers through pluggable byte-range sources (local file, mmap, HTTP).
+
+Header reads only need the 2880-byte header blocks; data units are skipped
+with sizes computed from the header (see fits_headers.iter_raw_headers). On
+NFS or object stores a buffered or astropy read pulls far more than that, so
+sources here fetch exact block ranges:
+
+- LocalFileSource: os.pread of the requested ranges
+- MmapSource: slices of a read-only memory map
+- HTTPRangeSource: GET with a Range header over a kept-alive connection
+
+BlockReader sits on top with a small LRU block cache and read-ahead: adjacent
+missing blocks are coalesced into one request, and the request window doubles
+while reads are sequential (a long header or a gzip stream), so the cost per
+file is the header size plus a few round trips. RangeFile exposes all of it as
+a seekable binary file for iter_raw_headers, gzip and astropy.
+
+This module only uses the standard library.
+"""
+
+import io
+import os
+import sys
+import gzip
+import mmap
+import http.client
+import threading
+from collections import OrderedDict
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlsplit
+import click
+
+from fits_headers import BLOCK_SIZE, compression_of, iter_raw_headers
+
+SOURCES = ['auto', 'file', 'mmap']
+CACHE_BLOCKS = 64          # Block cache per reader (~180 KB)
+MAX_WINDOW_BLOCKS = 32     # Largest coalesced request while reading sequentially
+
+
+def is_url(location: str) -> bool:
+    return location.startswith(('http://', 'https://'))
+
+
+class ByteRangeSource:
+    """Base class: random access to byte ranges of one file."""
+
+    def __init__(self):
+        self.size: Optional[int] = None
+        self.requests = 0
+        self.bytes_fetched = 0
+
+    def read_range(self, offset: int, length: int) -> bytes:
+        """Return up to `length` bytes at `offset` (fewer at end of file)."""
+        data = self._read(offset, length)
+        self.requests += 1
+        self.bytes_fetched += len(data)
+        return data
+
+    def _read(self, offset: int, length: int) -> bytes:
+        raise NotImplementedError
+
+    def get_size(self) -> int:
+        """Total size in bytes."""
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class LocalFileSource(ByteRangeSource):
+    """Positional reads of a local file; no read-ahead beyond what is requested."""
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.fd = os.open(path, os.O_RDONLY)
+        self.size = os.fstat(self.fd).st_size
+
+    def _read(self, offset: int, length: int) -> bytes:
+        return os.pread(self.fd, length, offset)
+
+    def get_size(self) -> int:
+        return self.size
+
+    def close(self) -> None:
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+class MmapSource(ByteRangeSource):
+    """Slices of a read-only memory map; pages are faulted in only where read."""
+
+    def __init__(self, path: str):
+        super().__init__()
+        with open(path, 'rb') as f:
+            self.size = os.fstat(f.fileno()).st_size
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if self.size else None
+
+    def _read(self, offset: int, length: int) -> bytes:
+        return self.map[offset:offset + length] if self.map is not None else b''
+
+    def get_size(self) -> int:
+        return self.size
+
+    def close(self) -> None:
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+
+
+class HTTPRangeSource(ByteRangeSource):
+    """HTTP(S) GET requests with a Range header on one kept-alive connection."""
+
+    def __init__(self, url: str, timeout: float = 30.0):
+        super().__init__()
+        parts = urlsplit(url)
+        self.url = url
+        self.path = parts.path + (f'?{parts.query}' if parts.query else '')
+        connection = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        self.connection = connection(parts.netloc, timeout=timeout)
+
+    def _request(self, offset: int, length: int) -> Tuple[int, bytes, Dict[str, str]]:
+        headers = {'Range': f'bytes={offset}-{offset + length - 1}'}
+        for attempt in (0, 1):
+            try:
+                self.connection.request('GET', self.path, headers=headers)
+                response = self.connection.getresponse()
+                headers_out = {k.lower(): v for k, v in response.getheaders()}
+                if response.status not in (206, 416):
+                    # A server ignoring Range answers 200 with the whole file: don't download it,
+                    # drop the connection instead (the next request reconnects)
+                    self.connection.close()
+                    return response.status, b'', headers_out
+                return response.status, response.read(), headers_out
+            except (http.client.HTTPException, ConnectionError):
+                # The server closed the kept-alive connection: reconnect once
+                self.connection.close()
+                if attempt:
+                    raise
+        raise AssertionError('unreachable')
+
+    def _read(self, offset: int, length: int) -> bytes:
+        if self.size is not None and offset >= self.size:
+            return b''
+        status, body, headers = self._request(offset, length)
+        if status == 416:  # Range starts past the end
+            self.size = self.size if self.size is not None else offset
+            return b''
+        if status == 404:
+            raise FileNotFoundError(f"Not found: {self.url}")
+        if status != 206:
+            raise OSError(f"HTTP {status} for {self.url} (byte ranges not supported?)")
+        content_range = headers.get('content-range', '')
+        if '/' in content_range and content_range.rsplit('/', 1)[1].isdigit():
+            self.size = int(content_range.rsplit('/', 1)[1])
+        return body
+
+    def get_size(self) -> int:
+        if self.size is None:
+            self.read_range(0, 1)
+        return self.size
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+def open_source(location: str, kind: str = 'auto') -> ByteRangeSource:
+    """
+    Open a byte-range source.
+
+    Args:
+        location: Local path or http(s) URL
+        kind: 'auto' (HTTP for URLs, else pread), 'file' or 'mmap'
+
+    Returns:
+        ByteRangeSource
+    """
+    if is_url(location):
+        return HTTPRangeSource(location)
+    if kind == 'mmap':
+        return MmapSource(location)
+    return LocalFileSource(location)
+
+
+class BlockReader:
+    """Block-aligned reads over a source with an LRU cache and read-ahead."""
+
+    def __init__(self, source: ByteRangeSource, cache_blocks: int = CACHE_BLOCKS,
+                 max_window: int = MAX_WINDOW_BLOCKS):
+        self.source = source
+        self.cache: 'OrderedDict[int, bytes]' = OrderedDict()
+        self.cache_blocks = cache_blocks
+        self.max_window = max_window
+        self.window = 1
+        self.next_block = -1   # Block right after the last fetch, for sequential detection
+        self.hits = 0
+
+    def _fetch(self, first: int, count: int) -> Dict[int, bytes]:
+        # Grow the window on sequential access, reset it on a jump
+        self.window = min(self.window * 2, self.max_window) if first == self.next_block else 1
+        count = max(count, self.window)
+        size = self.source.size
+        if size is not None:
+            if first * BLOCK_SIZE >= size:
+                return {}  # Past the end: no request needed
+            count = min(count, -(-(size - first * BLOCK_SIZE) // BLOCK_SIZE))
+        data = self.source.read_range(first * BLOCK_SIZE, count * BLOCK_SIZE)
+        blocks = {}
+        for i in range(0, len(data), BLOCK_SIZE):
+            blocks[first + i // BLOCK_SIZE] = data[i:i + BLOCK_SIZE]
+        self.next_block = first + count
+        for block, content in blocks.items():
+            self.cache[block] = content
+            self.cache.move_to_end(block)
+        while len(self.cache) > self.cache_blocks:
+            self.cache.popitem(last=False)
+        return blocks
+
+    def read(self, offset: int, length: int) -> bytes:
+        """Read `length` bytes at `offset` (fewer at end of file)."""
+        if length <= 0:
+            return b''
+        first, last = offset // BLOCK_SIZE, (offset + length - 1) // BLOCK_SIZE
+        blocks: Dict[int, bytes] = {}
+        block = first
+        while block <= last:
+            if block in self.cache:
+                self.hits += 1
+                self.cache.move_to_end(block)
+                blocks[block] = self.cache[block]
+                block += 1
+                continue
+            # Coalesce the run of missing blocks into one request
+            run_end = block
+            while run_end + 1 <= last and run_end + 1 not in self.cache:
+                run_end += 1
+            fetched = self._fetch(block, run_end - block + 1)
+            blocks.update(fetched)
+            if block not in fetched:
+                break  # End of file
+            block = run_end + 1
+        data = b''.join(blocks[b] for b in range(first, last + 1) if b in blocks)
+        start = offset - first * BLOCK_SIZE
+        return data[start:start + length]
+
+
+class RangeFile(io.RawIOBase):
+    """Seekable read-only binary file backed by a BlockReader."""
+
+    def __init__(self, reader: BlockReader, name: str = ''):
+        super().__init__()
+        self.reader = reader
+        self.name = name
+        self.mode = 'rb'
+        self.pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        data = self.reader.read(self.pos, len(buffer))
+        buffer[:len(data)] = data
+        self.pos += len(data)
+        return len(data)
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self.pos
+        elif whence == io.SEEK_END:
+            offset += self.reader.source.get_size()
+        self.pos = offset
+        return self.pos
+
+    def tell(self) -> int:
+        return self.pos
+
+    def size(self) -> int:
+        return self.reader.source.get_size()
+
+    def stats(self) -> Dict[str, int]:
+        """Requests made, bytes fetched and block cache hits so far."""
+        return {'requests': self.reader.source.requests, 'bytes_fetched': self.reader.source.bytes_fetched,
+                'cache_hits': self.reader.hits}
+
+    def close(self) -> None:
+        if not self.closed:
+            self.reader.source.close()
+        super().close()
+
+
+class GzipRangeFile(gzip.GzipFile):
+    """Inflating stream over a RangeFile; closing it closes the source too."""
+
+    def __init__(self, raw: RangeFile):
+        # gzip reads member headers a few bytes at a time; buffer them above the block cache
+        super().__init__(fileobj=io.BufferedReader(raw, BLOCK_SIZE), mode='rb')
+        self.raw = raw
+
+    def size(self) -> int:
+        return self.raw.size()
+
+    def stats(self) -> Dict[str, int]:
+        return self.raw.stats()
+
+    def close(self) -> None:
+        try:
+            super().close()
+        finally:
+            self.raw.close()
+
+
+def location_path(location: str) -> Path:
+    """File name part of a local path or URL."""
+    return Path(urlsplit(location).path) if is_url(location) else Path(location)
+
+
+def open_fits_stream(location: str, kind: str = 'auto'):
+    """
+    Open a FITS file or URL for header reads.
+
+    Args:
+        location: Local path or http(s) URL
+        kind: Source for local files ('auto', 'file' or 'mmap')
+
+    Returns:
+        RangeFile, or GzipRangeFile for .fits.gz (inflated on the fly)
+    """
+    raw = RangeFile(BlockReader(open_source(location, kind)), name=location)
+    if compression_of(location_path(location)) == 'gzip':
+        return GzipRangeFile(raw)
+    return raw
+
+
+class RangeRequestHandler(SimpleHTTPRequestHandler):
+    """Static file handler with single-range GET support, for local testing."""
+
+    protocol_version = 'HTTP/1.1'  # Keep connections alive between range requests
+    disable_nagle_algorithm = True  # Headers and body are written separately
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def do_GET(self):
+        path = self.translate_path(self.path)
+        spec = self.headers.get('Range', '')
+        if not os.path.isfile(path) or not spec.startswith('bytes='):
+            return super().do_GET()
+        size = os.path.getsize(path)
+        start_text, _, end_text = spec[len('bytes='):].partition('-')
+        start = int(start_text) if start_text else max(0, size - int(end_text))
+        end = min(int(end_text), size - 1) if start_text and end_text else size - 1
+        if start >= size:
+            self.send_response(416)
+            self.send_header('Content-Range', f'bytes */{size}')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        with open(path, 'rb') as f:
+            f.seek(start)
+            body = f.read(end - start + 1)
+        self.send_response(206)
+        self.send_header('Content-Type', 'application/fits')
+        self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def serve(directory: str, host: str = '127.0.0.1', port: int = 8000, verbose: bool = False) -> ThreadingHTTPServer:
+    """Start a range-capable HTTP server for a directory in a background thread."""
+    server = ThreadingHTTPServer((host, port), partial(RangeRequestHandler, directory=directory))
+    server.verbose = verbose
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+@click.group()
+def cli():
+    """Byte-range access to FITS headers (local, mmap, HTTP)."""
+
+
+@cli.command('serve')
+@click.argument('directory', type=click.Path(exists=True, file_okay=False))
+@click.option('--host', default='127.0.0.1', help='Address to bind')
+@click.option('--port', '-p', default=8000, type=int, help='Port to listen on')
+@click.option('--verbose', '-v', is_flag=True, help='Log every request')
+def serve_command(directory, host, port, verbose):
+    """Serve a directory over HTTP with Range support (for testing)."""
+    server = serve(directory, host, port, verbose)
+    click.echo(f"Serving {directory} on http://{host}:{server.server_address[1]}/ … Ctrl+C to stop.")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+@cli.command('stats')
+@click.argument('locations', nargs=-1, required=True)
+@click.option('--source', type=click.Choice(SOURCES), default='auto', help='Byte-range source for local files')
+def stats_command(locations, source):
+    """Read all headers of files or URLs and report the I/O it took."""
+    for location in locations:
+        try:
+            with open_fits_stream(location, source) as f:
+                hdus = sum(1 for _ in iter_raw_headers(f))
+                s = f.stats()
+            click.echo(f"{location}: {hdus} HDUs, {s['requests']} requests, "
+                       f"{s['bytes_fetched']} bytes, {s['cache_hits']} cache hits")
+        except Exception as e:
+            click.echo(f"Error: {location}: {e}", err=True)
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,444 @@
+#!/usr/bin/env python3
+"""
+FITS Header Rules
+Batch operations whose values are computed from other header keywords.
+
+A rule is a batch operation with an "expr" (and optionally a "when" condition)
+instead of a literal "value":
+
+    {"action": "set", "keyword": "MJD-OBS", "expr": "mjd(DATE_OBS)"}
+    {"action": "set", "keyword": "QUALITY", "expr": "1 if AIRMASS < 1.5 else 2 if AIRMASS < 2 else 3"}
+    {"action": "add", "keyword": "EFFEXP", "expr": "EXPTIME * NCOMBINE", "when": "NCOMBINE > 1"}
+
+Expressions are a small, checked subset of Python: arithmetic, comparisons,
+and/or/not, conditional expressions and the functions in FUNCTIONS. Keywords
+are referenced by name, with '-' written as '_' (DATE_OBS for DATE-OBS).
+
+Each rule is compiled once. The same code object is evaluated either per
+header (scalar values) or over the columns of a header index (NumPy arrays),
+so a whole archive is planned with a handful of vectorized operations and
+only files that actually change are opened.
+"""
+
+import ast
+import math
+from datetime import datetime
+from functools import reduce
+from typing import Any, Callable, Dict, List, Mapping, Optional, Set
+
+from fits_headers import header_values
+
+ACTIONS = ('add', 'update', 'set', 'delete')
+MJD_EPOCH = datetime(1858, 11, 17)
+
+_ALLOWED_NODES = (
+    ast.Expression, ast.BinOp, ast.UnaryOp, ast.Compare, ast.Call, ast.Name, ast.Load, ast.Constant,
+    ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow, ast.USub, ast.UAdd,
+    ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE,
+    ast.BoolOp, ast.And, ast.Or, ast.Not, ast.IfExp,
+)
+
+
+def _mjd(value: str) -> float:
+    """Modified Julian Date of an ISO 8601 date/time string."""
+    return (datetime.fromisoformat(value) - MJD_EPOCH).total_seconds() / 86400
+
+
+def _mjd_array(values):
+    import numpy as np
+    times = np.asarray(values).astype('datetime64[us]')
+    return (times - np.datetime64('1858-11-17')) / np.timedelta64(1, 'D')
+
+
+# Scalar implementations; the vectorized ones are built on first use
+FUNCTIONS: Dict[str, Callable] = {
+    'mjd': _mjd,
+    'sqrt': math.sqrt,
+    'log10': math.log10,
+    'exp': math.exp,
+    'abs': abs,
+    'round': round,
+    'float': float,
+    'int': int,
+    'str': str,
+    'min': min,
+    'max': max,
+    'where': lambda cond, a, b: a if cond else b,
+    '_and': lambda *args: all(args),
+    '_or': lambda *args: any(args),
+    '_not': lambda a: not a,
+}
+_VECTOR_FUNCTIONS: Dict[str, Callable] = {}
+
+
+def vector_functions() -> Dict[str, Callable]:
+    """NumPy versions of FUNCTIONS (min/max/where are element-wise)."""
+    if not _VECTOR_FUNCTIONS:
+        import numpy as np
+        _VECTOR_FUNCTIONS.update({
+            'mjd': _mjd_array,
+            'sqrt': np.sqrt,
+            'log10': np.log10,
+            'exp': np.exp,
+            'abs': np.abs,
+            'round': lambda a, ndigits=None: (np.round(a).astype(np.int64) if ndigits is None
+                                              else np.round(a, ndigits)),  # round(x) is an int
+            'float': lambda a: np.asarray(a, dtype=np.float64),
+            'int': lambda a: np.asarray(a).astype(np.int64),
+            'str': lambda a: np.asarray(a).astype(str),
+            'min': np.minimum,
+            'max': np.maximum,
+            'where': np.where,
+            '_and': lambda *args: reduce(np.logical_and, args),
+            '_or': lambda *args: reduce(np.logical_or, args),
+            '_not': np.logical_not,
+        })
+    return _VECTOR_FUNCTIONS
+
+
+class _Vectorize(ast.NodeTransformer):
+    """Rewrite the constructs NumPy arrays can't go through into function calls."""
+
+    @staticmethod
+    def _call(name: str, args: List[ast.expr]) -> ast.Call:
+        return ast.Call(func=ast.Name(id=name, ctx=ast.Load()), args=args, keywords=[])
+
+    def visit_BoolOp(self, node: ast.BoolOp) -> ast.Call:
+        self.generic_visit(node)
+        return self._call('_and' if isinstance(node.op, ast.And) else '_or', node.values)
+
+    def visit_UnaryOp(self, node: ast.UnaryOp) -> ast.expr:
+        self.generic_visit(node)
+        return self._call('_not', [node.operand]) if isinstance(node.op, ast.Not) else node
+
+    def visit_IfExp(self, node: ast.IfExp) -> ast.Call:
+        self.generic_visit(node)
+        return self._call('where', [node.test, node.body, node.orelse])
+
+    def visit_Compare(self, node: ast.Compare) -> ast.expr:
+        self.generic_visit(node)
+        if len(node.ops) == 1:
+            return node
+        # a < b < c -> _and(a < b, b < c)
+        operands = [node.left] + node.comparators
+        return self._call('_and', [ast.Compare(left=operands[i], ops=[op], comparators=[operands[i + 1]])
+                                   for i, op in enumerate(node.ops)])
+
+
+class Expression:
+    """A compiled header expression."""
+
+    def __init__(self, source: str):
+        """
+        Parse, check and compile an expression.
+
+        Args:
+            source: Expression text
+
+        Raises:
+            ValueError: If the expression is invalid or uses unsupported syntax
+        """
+        self.source = source
+        try:
+            tree = ast.parse(source, mode='eval')
+        except SyntaxError as e:
+            raise ValueError(f"Invalid expression '{source}': {e.msg}")
+        self.names: Set[str] = set()
+        for node in ast.walk(tree):
+            if not isinstance(node, _ALLOWED_NODES):
+                raise ValueError(f"Unsupported syntax in expression '{source}': {type(node).__name__}")
+            if isinstance(node, ast.Call) and not (isinstance(node.func, ast.Name) and node.func.id in FUNCTIONS):
+                raise ValueError(f"Unknown function in expression '{source}'")
+            if isinstance(node, ast.Name) and node.id not in FUNCTIONS:
+                self.names.add(node.id)
+        # Scalar code keeps Python's short-circuiting; the vector code routes
+        # and/or/not/if-else through element-wise functions
+        self.code = compile(tree, f'<expr {source}>', 'eval')
+        vector_tree = ast.fix_missing_locations(_Vectorize().visit(ast.parse(source, mode='eval')))
+        self.vector_code = compile(vector_tree, f'<expr {source}>', 'eval')
+
+    def evaluate(self, values: Mapping[str, Any], vectorized: bool = False) -> Any:
+        """
+        Evaluate against keyword values.
+
+        Args:
+            values: Values by expression name (scalars, or equal-length arrays
+                when vectorized)
+            vectorized: Evaluate element-wise over NumPy arrays
+
+        Returns:
+            The expression value
+        """
+        namespace = dict(vector_functions() if vectorized else FUNCTIONS)
+        namespace.update(values)
+        return eval(self.vector_code if vectorized else self.code, {'__builtins__': {}}, namespace)
+
+
+def resolve_name(name: str, available) -> Optional[str]:
+    """
+    Map an expression name to a header keyword.
+
+    DATE_OBS matches DATE_OBS if present, otherwise DATE-OBS.
+
+    Returns:
+        The keyword, or None if neither form is available
+    """
+    for keyword in (name.upper(), name.upper().replace('_', '-')):
+        if keyword in available:
+            return keyword
+    return None
+
+
+class Rule:
+    """One batch operation, with a literal or computed value."""
+
+    def __init__(self, operation: Dict[str, Any]):
+        """
+        Compile a batch operation.
+
+        Args:
+            operation: {"action", "keyword", "value" | "expr", "comment", "when"}
+
+        Raises:
+            ValueError: For unknown actions or invalid expressions
+        """
+        self.action = operation.get('action')
+        if self.action not in ACTIONS:
+            raise ValueError(f"Unknown action '{self.action}'")
+        self.keyword = operation.get('keyword', '').upper()
+        self.comment = operation.get('comment', '')
+        self.value = operation.get('value')
+        self.expr = Expression(operation['expr']) if 'expr' in operation else None
+        self.when = Expression(operation['when']) if 'when' in operation else None
+
+    @property
+    def names(self) -> Set[str]:
+        """Expression names the rule reads."""
+        names: Set[str] = set()
+        for expression in (self.expr, self.when):
+            if expression is not None:
+                names |= expression.names
+        return names
+
+
+def compile_rules(operations: List[Dict[str, Any]]) -> List[Rule]:
+    """Compile the operations of a batch file (all errors are raised up front)."""
+    return [Rule(op) for op in operations]
+
+
+def _lookup(rule: Rule, values: Mapping[str, Any]) -> Dict[str, Any]:
+    """Bind the names a rule reads to header values; missing keywords raise ValueError."""
+    bound = {}
+    for name in rule.names:
+        keyword = resolve_name(name, values)
+        if keyword is None:
+            raise ValueError(f"missing keyword {name.upper().replace('_', '-')}")
+        bound[name] = values[keyword]
+    return bound
+
+
+def _same(a: Any, b: Any) -> bool:
+    """Equality that doesn't treat True and 1 as the same header value."""
+    if isinstance(a, bool) or isinstance(b, bool):
+        return type(a) is type(b) and a == b
+    return a == b
+
+
+def _plain(value: Any) -> Any:
+    """Convert NumPy scalars to the Python types astropy expects in headers."""
+    return value.item() if hasattr(value, 'item') else value
+
+
+def plan_header(rules: List[Rule], values: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Evaluate rules in order against one header's values.
+
+    Later rules see the values set by earlier ones.
+
+    Args:
+        rules: Compiled rules
+        values: Keyword values of the header (modified in place)
+
+    Returns:
+        One result per rule: {'keyword', 'action', 'status', 'value'/'error'};
+        status is 'apply', 'skipped' (when was false), 'unchanged' or 'error'
+    """
+    results = []
+    for rule in rules:
+        result = {'keyword': rule.keyword, 'action': rule.action, 'comment': rule.comment}
+        try:
+            bound = _lookup(rule, values)
+            if rule.when is not None and not rule.when.evaluate(bound):
+                result['status'] = 'skipped'
+            elif rule.action == 'delete':
+                result['status'] = 'apply'
+                values.pop(rule.keyword, None)
+            else:
+                value = _plain(rule.expr.evaluate(bound)) if rule.expr is not None else rule.value
+                result['value'] = value
+                if rule.action != 'add' and not rule.comment and rule.keyword in values \
+                        and _same(values[rule.keyword], value):
+                    result['status'] = 'unchanged'
+                else:
+                    result['status'] = 'apply'
+                values[rule.keyword] = value
+        except Exception as e:
+            result['status'] = 'error'
+            result['error'] = str(e)
+        results.append(result)
+    return results
+
+
+def apply_plan(editor, hdu: int, plan: List[Dict[str, Any]]) -> None:
+    """
+    Apply planned edits through the editor; failures are recorded in the plan.
+
+    Args:
+        editor: FITSMetadataEditor with the file loaded
+        hdu: HDU index
+        plan: Results of plan_header or plan_index (updated in place)
+    """
+    for result in plan:
+        if result['status'] != 'apply':
+            continue
+        keyword, action = result['keyword'], result['action']
+        try:
+            if action == 'set':
+                action = 'update' if keyword in editor.hdulist[hdu].header else 'add'
+            if action == 'add':
+                editor.add_keyword(hdu, keyword, result['value'], result['comment'])
+            elif action == 'update':
+                editor.update_keyword(hdu, keyword, result['value'], result['comment'] or None)
+            else:
+                editor.delete_keyword(hdu, keyword)
+            result['applied'] = action
+        except Exception as e:
+            result['status'] = 'error'
+            result['error'] = str(e)
+
+
+def apply_rules(editor, hdu, rules: List[Rule]) -> List[Dict[str, Any]]:
+    """
+    Evaluate and apply rules to one loaded file (one pass, no save).
+
+    Args:
+        editor: FITSMetadataEditor with the file loaded
+        hdu: HDU index, EXTNAME or (EXTNAME, EXTVER)
+        rules: Compiled rules
+
+    Returns:
+        Per-rule results as in plan_header
+    """
+    hdu = editor.resolve_hdu(hdu)  # Once, so every edit below gets a plain index
+    plan = plan_header(rules, header_values(editor.hdulist[hdu].header))
+    apply_plan(editor, hdu, plan)
+    return plan
+
+
+def plan_index(rules: List[Rule], index) -> List[List[Dict[str, Any]]]:
+    """
+    Evaluate rules over every row of a header index at once.
+
+    Each rule is evaluated once over whole columns. Rows missing a keyword a
+    rule reads get an error result for that rule, like plan_header does for a
+    single header; if the vectorized evaluation fails for any row (e.g. one
+    malformed date, or a division by zero), that rule falls back to
+    row-by-row evaluation, so the plans always match plan_header's.
+
+    Args:
+        rules: Compiled rules
+        index: fits_index.HeaderIndex
+
+    Returns:
+        One plan per index row, in the format of plan_header
+    """
+    import numpy as np
+
+    n = len(index)
+    columns = dict(index.columns)
+    masks = dict(index.masks)
+    plans: List[List[Dict[str, Any]]] = [[] for _ in range(n)]
+    for rule in rules:
+        valid = np.ones(n, dtype=bool)
+        missing = np.full(n, '', dtype=object)
+        bound = {}
+        for name in sorted(rule.names):
+            keyword = resolve_name(name, columns)
+            if keyword is None:
+                missing[valid] = name.upper().replace('_', '-')
+                valid[:] = False
+                continue
+            bound[name] = columns[keyword]
+            missing[valid & ~masks[keyword]] = keyword
+            valid &= masks[keyword]
+
+        errors = np.full(n, None, dtype=object)
+        rows = np.flatnonzero(valid)
+        try:
+            # Only rows that have every keyword are evaluated, and any floating
+            # point error (x // 0, log10(0), overflow) raises instead of yielding
+            # 0/inf/nan, so such rules fall back to the row-by-row path below and
+            # plan exactly what plan_header would for the same header
+            with np.errstate(divide='raise', invalid='raise', over='raise'):
+                active = valid.copy()
+                if rule.when is not None:
+                    when = rule.when.evaluate({name: column[rows] for name, column in bound.items()},
+                                              vectorized=True)
+                    active[rows] = np.broadcast_to(np.asarray(when, dtype=bool), (len(rows),))
+                if rule.expr is not None and rule.action != 'delete':
+                    # Like plan_header, the value is only computed where "when" holds
+                    targets = np.flatnonzero(active)
+                    evaluated = rule.expr.evaluate({name: column[targets] for name, column in bound.items()},
+                                                   vectorized=True)
+                    evaluated = np.broadcast_to(np.asarray(evaluated), (len(targets),))
+                    values = np.zeros(n, dtype=evaluated.dtype)
+                    values[targets] = evaluated
+                else:
+                    values = np.full(n, rule.value, dtype=object)
+        except Exception:
+            active, values = valid.copy(), np.full(n, None, dtype=object)
+            for row in rows:
+                row_values = {name: _plain(column[row]) for name, column in bound.items()}
+                try:
+                    if rule.when is not None and not rule.when.evaluate(row_values):
+                        active[row] = False
+                    elif rule.expr is not None and rule.action != 'delete':
+                        values[row] = _plain(rule.expr.evaluate(row_values))
+                    else:
+                        values[row] = rule.value
+                except Exception as e:
+                    active[row] = False
+                    errors[row] = str(e)
+
+        current = columns.get(rule.keyword)
+        current_mask = masks.get(rule.keyword, np.zeros(n, dtype=bool))
+        for row in range(n):
+            result = {'keyword': rule.keyword, 'action': rule.action, 'comment': rule.comment}
+            if not valid[row]:
+                result.update(status='error', error=f"missing keyword {missing[row]}")
+            elif errors[row] is not None:
+                result.update(status='error', error=errors[row])
+            elif not active[row]:
+                result['status'] = 'skipped'
+            elif rule.action == 'delete':
+                result['status'] = 'apply'
+            else:
+                value = _plain(values[row])
+                result['value'] = value
+                result['status'] = 'unchanged' if (
+                    rule.action != 'add' and not rule.comment and current is not None
+                    and current_mask[row] and _same(_plain(current[row]), value)) else 'apply'
+            plans[row].append(result)
+
+        # Later rules see this rule's effect
+        if rule.action == 'delete':
+            if rule.keyword in masks:
+                masks[rule.keyword] = current_mask & ~active
+        else:
+            if current is None:
+                current = np.zeros(n, dtype=values.dtype)
+            elif current.dtype.kind != values.dtype.kind:
+                current, values = current.astype(object), values.astype(object)
+            columns[rule.keyword] = np.where(active, values, current)
+            masks[rule.keyword] = current_mask | active
+    return plans
@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+"""
+FITS Archive Verifier
+Check the integrity of FITS files: HDU structure, mandatory keywords and
+CHECKSUM/DATASUM values.
+
+Each file is streamed once. Plain and tile-compressed files are memory-mapped
+and their data units summed in chunks without copying; .fits.gz files are
+inflated chunk by chunk. Files are spread over a process pool, and results are
+cached by (path, size, mtime, inode) so re-runs only re-check changed files.
+"""
+
+import os
+import json
+import mmap
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, Iterable, List, Optional
+
+from fits_headers import (BLOCK_SIZE, CARD_SIZE, MANDATORY_KEYWORDS, RawHeader, checksum32,
+                          compression_of, data_unit_size, hdu_type_name, open_raw,
+                          read_header_bytes, split_fits_name, structural_values)
+
+VERIFY_VERSION = 1  # Bump when checks change so cached results are discarded
+CHUNK_SIZE = 64 * 1024 * 1024
+DEFAULT_CACHE = Path.home() / '.cache' / 'fits_metadata_editor' / 'verify_cache.json'
+EXTENSION_KEYWORDS = ('XTENSION', 'BITPIX', 'NAXIS', 'PCOUNT', 'GCOUNT')
+
+
+def file_signature(path: str) -> List[int]:
+    """Return [size, mtime_ns, inode]; a file with the same signature is unchanged."""
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+
+
+def sum_buffer(buffer, sum32: int = 0) -> int:
+    """
+    Ones'-complement sum of a buffer whose length is a multiple of 4.
+
+    Same result as fits_headers.checksum32, vectorized with numpy for data units.
+
+    Args:
+        buffer: bytes, memoryview or mmap slice
+        sum32: Sum of preceding regions
+
+    Returns:
+        Ones'-complement sum
+    """
+    import numpy as np
+
+    # 64 MB chunks hold 2**24 words, far below uint64 overflow
+    total = int(np.frombuffer(buffer, dtype='>u4').sum(dtype=np.uint64)) + sum32
+    while total >> 32:
+        total = (total & 0xFFFFFFFF) + (total >> 32)
+    return total
+
+
+def _data_sum(f: BinaryIO, view: Optional[memoryview], size: int) -> int:
+    """
+    Sum a data unit of `size` bytes starting at the current position.
+
+    Args:
+        f: Stream positioned at the data unit (left positioned after it)
+        view: Memory map of the whole file, or None for streams
+        size: Padded data unit size
+
+    Raises:
+        ValueError: If the file ends inside the data unit
+    """
+    total = 0
+    if view is not None:
+        start = f.tell()
+        if start + size > len(view):
+            raise ValueError("Truncated data unit")
+        for offset in range(start, start + size, CHUNK_SIZE):
+            total = sum_buffer(view[offset:min(offset + CHUNK_SIZE, start + size)], total)
+        f.seek(start + size)
+        return total
+    remaining = size
+    while remaining:
+        chunk = f.read(min(CHUNK_SIZE, remaining))
+        if not chunk:
+            raise ValueError("Truncated data unit")
+        if len(chunk) % 4:
+            # Only the last read of a truncated file can be unaligned
+            raise ValueError("Truncated data unit")
+        total = sum_buffer(chunk, total)
+        remaining -= len(chunk)
+    return total
+
+
+class TrailingData(Exception):
+    """Bytes after the last HDU that don't start an extension."""
+
+
+def _read_header(f: BinaryIO, index: int) -> Optional[bytes]:
+    """
+    Read the header of HDU `index`.
+
+    Returns:
+        Raw header bytes, or None at end of file
+
+    Raises:
+        TrailingData: If what follows the last HDU is not a header
+        ValueError: If the header is truncated or the primary header is invalid
+    """
+    first = f.read(BLOCK_SIZE)
+    if not first:
+        if index == 0:
+            raise ValueError("Empty file")
+        return None
+    expected = b'SIMPLE  ' if index == 0 else b'XTENSION'
+    if not first.startswith(expected):
+        if index == 0:
+            raise ValueError("File does not start with a SIMPLE card")
+        raise TrailingData()
+    if len(first) < BLOCK_SIZE:
+        raise ValueError(f"Truncated header of HDU {index}")
+    if any(first[i:i + 8] == b'END     ' for i in range(0, BLOCK_SIZE, CARD_SIZE)):
+        return first
+    try:
+        rest = read_header_bytes(f)
+    except ValueError:
+        rest = None
+    if rest is None:
+        raise ValueError(f"Truncated header of HDU {index} (no END card)")
+    return first + rest
+
+
+def _sum_status(stored: Any, matches) -> str:
+    if stored is None:
+        return 'missing'
+    try:
+        return 'ok' if matches(stored) else 'bad'
+    except (TypeError, ValueError):
+        return 'bad'
+
+
+def _verify_hdu(index: int, header_bytes: bytes, datasum: int,
+                header: RawHeader, errors: List[str]) -> Dict[str, Any]:
+    """Check keywords and sums of one HDU and describe it for the report."""
+    required = MANDATORY_KEYWORDS if index == 0 else EXTENSION_KEYWORDS
+    missing = [k for k in required if k not in header]
+    naxis = header.get('NAXIS')
+    if isinstance(naxis, int):
+        missing += [f'NAXIS{n}' for n in range(1, naxis + 1) if f'NAXIS{n}' not in header]
+    if missing:
+        errors.append(f"HDU {index}: missing mandatory keywords {', '.join(missing)}")
+
+    datasum_status = _sum_status(header.get('DATASUM'), lambda stored: int(stored) == datasum)
+    checksum_status = _sum_status(header.get('CHECKSUM'),
+                                  lambda stored: checksum32(header_bytes, datasum) == 0xFFFFFFFF)
+    if datasum_status == 'bad':
+        errors.append(f"HDU {index}: DATASUM mismatch (stored {header.get('DATASUM')}, computed {datasum})")
+    if checksum_status == 'bad':
+        errors.append(f"HDU {index}: CHECKSUM mismatch")
+
+    return {
+        'index': index,
+        'name': header.get('EXTNAME') or ('PRIMARY' if index == 0 else ''),
+        'missing_keywords': missing,
+        'datasum': datasum_status,
+        'checksum': checksum_status,
+    }
+
+
+def verify_file(path: str) -> Dict[str, Any]:
+    """
+    Verify one FITS file, reading it exactly once.
+
+    Args:
+        path: Path to the file
+
+    Returns:
+        Result dictionary with 'errors', 'warnings' and per-HDU 'hdus';
+        problems never raise
+    """
+    t0 = time.perf_counter()
+    result: Dict[str, Any] = {'path': path, 'errors': [], 'warnings': [], 'hdus': [], 'bytes': 0}
+    errors = result['errors']
+    f = mm = view = None
+    try:
+        try:
+            compression = compression_of(Path(path))
+        except ValueError:
+            compression = None  # Unusual name; read it as plain FITS
+        if compression == 'gzip':
+            f = open_raw(Path(path))
+        else:
+            with open(path, 'rb') as raw:
+                if os.fstat(raw.fileno()).st_size == 0:
+                    raise ValueError("Empty file")
+                mm = f = mmap.mmap(raw.fileno(), 0, access=mmap.ACCESS_READ)
+            if hasattr(mmap, 'MADV_SEQUENTIAL'):
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+            view = memoryview(mm)
+
+        index = 0
+        while True:
+            try:
+                header_bytes = _read_header(f, index)
+            except TrailingData:
+                result['warnings'].append(f"Data after the last HDU ({index - 1}) is not a FITS extension")
+                break
+            if header_bytes is None:
+                break
+            values = structural_values(header_bytes)
+            header = RawHeader.fromstring(header_bytes)
+            datasum = _data_sum(f, view, data_unit_size(values))
+            hdu = _verify_hdu(index, header_bytes, datasum, header, errors)
+            hdu['type'] = hdu_type_name(index, values)
+            result['hdus'].append(hdu)
+            index += 1
+    except (OSError, ValueError) as e:
+        errors.append(str(e))
+    finally:
+        if view is not None:
+            view.release()
+        if f is not None:
+            result['bytes'] = f.tell()
+            f.close()
+    result['elapsed_s'] = round(time.perf_counter() - t0, 4)
+    return result
+
+
+def collect_files(paths: Iterable[str]) -> List[str]:
+    """Expand directories recursively into FITS files; returns sorted absolute paths."""
+    files = set()
+    for p in map(Path, paths):
+        candidates = p.rglob('*') if p.is_dir() else [p]
+        for candidate in candidates:
+            if not candidate.is_file():
+                continue
+            try:
+                split_fits_name(candidate)
+            except ValueError:
+                if not p.is_dir():
+                    files.add(str(candidate.resolve()))  # Named explicitly: verify anyway
+                continue
+            files.add(str(candidate.resolve()))
+    return sorted(files)
+
+
+class VerifyCache:
+    """JSON file of verification results keyed by path and file signature."""
+
+    def __init__(self, path: Optional[Path]):
+        """
+        Load the cache.
+
+        Args:
+            path: Cache file, or None to disable caching
+        """
+        self.path = path
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        if path is not None and path.exists():
+            try:
+                data = json.loads(path.read_text())
+                if data.get('version') == VERIFY_VERSION:
+                    self.entries = data.get('files', {})
+            except (OSError, ValueError):
+                pass  # Unreadable cache: start over
+
+    def get(self, path: str, signature: List[int]) -> Optional[Dict[str, Any]]:
+        entry = self.entries.get(path)
+        if entry is not None and entry['signature'] == signature:
+            return entry['result']
+        return None
+
+    def put(self, path: str, signature: List[int], result: Dict[str, Any]) -> None:
+        self.entries[path] = {'signature': signature, 'result': result}
+
+    def save(self) -> None:
+        """Write the cache atomically."""
+        if self.path is None:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + '.tmp')
+        tmp_path.write_text(json.dumps({'version': VERIFY_VERSION, 'files': self.entries}))
+        os.replace(tmp_path, self.path)
+
+
+def file_ok(result: Dict[str, Any], require_checksums: bool = False) -> bool:
+    """Whether a file passes; optionally HDUs without CHECKSUM/DATASUM fail too."""
+    if result['errors']:
+        return False
+    if require_checksums:
+        return all(h['checksum'] == 'ok' and h['datasum'] == 'ok' for h in result['hdus'])
+    return True
+
+
+def verify_archive(paths: Iterable[str], workers: Optional[int] = None,
+                   cache_path: Optional[Path] = DEFAULT_CACHE,
+                   require_checksums: bool = False) -> Dict[str, Any]:
+    """
+    Verify files and directories of FITS files in parallel.
+
+    Args:
+        paths: Files or directories (searched recursively)
+        workers: Number of worker processes (default: CPU count)
+        cache_path: Result cache file, or None to re-check everything
+        require_checksums: Treat HDUs without CHECKSUM/DATASUM as failures
+
+    Returns:
+        Report dictionary with 'summary' and per-file results
+    """
+    t0 = time.perf_counter()
+    cache = VerifyCache(cache_path)
+    results: Dict[str, Dict[str, Any]] = {}
+    todo = []
+    signatures = {}
+    for path in collect_files(paths):
+        try:
+            signatures[path] = file_signature(path)
+        except OSError as e:
+            results[path] = {'path': path, 'errors': [str(e)], 'warnings': [], 'hdus': [], 'bytes': 0,
+                             'cached': False}
+            continue
+        cached = cache.get(path, signatures[path])
+        if cached is not None:
+            results[path] = dict(cached, cached=True)
+        else:
+            todo.append(path)
+
+    # Largest files first so one big file doesn't finish last on its own
+    todo.sort(key=lambda p: signatures[p][0], reverse=True)
+    if todo:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for result in pool.map(verify_file, todo):
+                path = result['path']
+                try:
+                    unchanged = file_signature(path) == signatures[path]
+                except OSError:
+                    unchanged = False
+                if unchanged:  # Don't cache a file that was written to meanwhile
+                    cache.put(path, signatures[path], result)
+                results[path] = dict(result, cached=False)
+        cache.save()
+
+    files = []
+    for path in sorted(results):
+        result = results[path]
+        result['ok'] = file_ok(result, require_checksums)
+        files.append(result)
+    elapsed = time.perf_counter() - t0
+    verified_bytes = sum(r['bytes'] for r in files if not r['cached'])
+    return {
+        'version': VERIFY_VERSION,
+        'generated': datetime.now().isoformat(timespec='seconds'),
+        'summary': {
+            'files': len(files),
+            'ok': sum(1 for r in files if r['ok']),
+            'failed': sum(1 for r in files if not r['ok']),
+            'cached': sum(1 for r in files if r['cached']),
+            'verified': sum(1 for r in files if not r['cached']),
+            'bytes_verified': verified_bytes,
+            'elapsed_s': round(elapsed, 3),
+            'mb_per_s': round(verified_bytes / elapsed / 1e6, 1) if elapsed else 0.0,
+        },
+        'files': files,
+    }
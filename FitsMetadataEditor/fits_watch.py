@@ -0,0 +1,582 @@
+#!/usr/bin/env python3
+"""
+FITS Watch-Folder Ingestion
+Applies a batch/rules file to FITS files as they arrive in incoming directories.
+
+Arrivals are detected with inotify on Linux (a polling scan elsewhere). A file
+is processed once it has been quiet for a settle time and its size looks
+complete, so frames that are still being written are not touched. Ready files
+are queued and handed to a process pool; each worker compiles the rules once
+and edits files with run_rules_on_file. Results can be merged into a header
+index (fits_index), and throughput and queue-lag metrics are kept for
+reporting.
+
+Files written by the daemon itself (saves, backups, gzip rewrites) are
+recognised by name or by their signature after processing and not
+re-queued.
+"""
+
+import os
+import re
+import json
+import time
+import errno
+import select
+import signal
+import struct
+import threading
+from collections import deque
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from fits_headers import BLOCK_SIZE, compression_of, split_fits_name
+from fits_pool import process_pool
+from fits_profile import percentiles
+from fits_rules import compile_rules
+
+DEFAULT_SETTLE = 2.0
+DEFAULT_MAX_WAIT = 300.0
+DEFAULT_STATS_INTERVAL = 10.0
+DEFAULT_INDEX_INTERVAL = 5.0
+LATENCY_SAMPLES = 10000
+THROUGHPUT_WINDOW = 60.0
+BACKUP_NAME = re.compile(r'_backup_\d{8}_\d{6}\.')
+
+# inotify(7) event bits
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+EVENT_HEADER = struct.Struct('iIII')
+
+
+def is_candidate(path: Path) -> bool:
+    """Whether a file name is an incoming FITS file (not hidden, not a backup)."""
+    if path.name.startswith('.') or BACKUP_NAME.search(path.name):
+        return False
+    try:
+        split_fits_name(path)
+    except ValueError:
+        return False
+    return True
+
+
+def scan_directories(directories: List[str], recursive: bool) -> List[str]:
+    """Absolute paths of the candidate FITS files in directories."""
+    files = []
+    for directory in directories:
+        candidates = Path(directory).rglob('*') if recursive else Path(directory).iterdir()
+        files.extend(str(p.resolve()) for p in candidates if p.is_file() and is_candidate(p))
+    return files
+
+
+def signature(path: str) -> Optional[Tuple[int, int]]:
+    """(size, mtime_ns) of a file, or None if it is gone."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+def looks_complete(path: str, size: int) -> bool:
+    """
+    Cheap completeness check: uncompressed and tile-compressed FITS files are
+    always a whole number of 2880-byte blocks (gzip can only be checked by
+    inflating, so any non-empty .gz passes).
+    """
+    if size == 0:
+        return False
+    return compression_of(Path(path)) == 'gzip' or size % BLOCK_SIZE == 0
+
+
+class InotifyWatcher:
+    """Reports files written or moved into directories, via Linux inotify."""
+
+    def __init__(self, directories: List[str], recursive: bool = False):
+        """
+        Start watching.
+
+        Args:
+            directories: Directories to watch
+            recursive: Also watch subdirectories (including ones created later)
+
+        Raises:
+            OSError: If inotify is unavailable
+        """
+        import ctypes
+        import ctypes.util
+
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_init1 failed: {os.strerror(ctypes.get_errno())}")
+        self.directories = directories
+        self.recursive = recursive
+        self.watches: Dict[int, str] = {}
+        for directory in directories:
+            self._add(directory)
+
+    def _add(self, directory: str) -> List[str]:
+        """Watch a directory (and its subdirectories if recursive); returns files already there."""
+        import ctypes
+
+        directory = str(Path(directory).resolve())
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"Cannot watch {directory}: {os.strerror(ctypes.get_errno())}")
+        self.watches[wd] = directory
+        found = []
+        for entry in os.scandir(directory):
+            if entry.is_dir() and self.recursive:
+                found.extend(self._add(entry.path))
+            elif entry.is_file() and is_candidate(Path(entry.name)):
+                found.append(entry.path)
+        return found
+
+    def fileno(self) -> int:
+        return self.fd
+
+    def timeout(self, now: float) -> Optional[float]:
+        """Seconds until the watcher needs to run again (None: only when readable)."""
+        return None
+
+    def poll(self, now: float) -> List[str]:
+        """
+        Read pending events without blocking.
+
+        Returns:
+            Paths of candidate files that changed (every file after a queue overflow)
+        """
+        paths = []
+        while True:
+            try:
+                buffer = os.read(self.fd, 65536)
+            except BlockingIOError:
+                return paths
+            offset = 0
+            while offset < len(buffer):
+                wd, mask, _, length = EVENT_HEADER.unpack_from(buffer, offset)
+                offset += EVENT_HEADER.size
+                name = os.fsdecode(buffer[offset:offset + length].rstrip(b'\0'))
+                offset += length
+                if mask & IN_Q_OVERFLOW:
+                    # Events were lost: fall back to a full scan once
+                    paths.extend(scan_directories(self.directories, self.recursive))
+                    continue
+                directory = self.watches.get(wd)
+                if directory is None or not name:
+                    continue
+                path = os.path.join(directory, name)
+                if mask & IN_ISDIR:
+                    if self.recursive and mask & (IN_CREATE | IN_MOVED_TO):
+                        try:
+                            paths.extend(self._add(path))  # Files may land before the watch exists
+                        except OSError:
+                            pass
+                elif is_candidate(Path(name)):
+                    paths.append(path)
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """Reports changed files by rescanning directories at a fixed interval."""
+
+    def __init__(self, directories: List[str], recursive: bool = False, interval: float = 2.0):
+        """
+        Start watching.
+
+        Args:
+            directories: Directories to watch
+            recursive: Also scan subdirectories
+            interval: Seconds between scans
+        """
+        self.directories = directories
+        self.recursive = recursive
+        self.interval = interval
+        self.seen = {path: signature(path) for path in scan_directories(directories, recursive)}
+        self.next_scan = time.monotonic() + interval
+
+    def fileno(self) -> Optional[int]:
+        return None
+
+    def timeout(self, now: float) -> Optional[float]:
+        return max(0.0, self.next_scan - now)
+
+    def poll(self, now: float) -> List[str]:
+        """Rescan if due; returns files that are new or changed since the last scan."""
+        if now < self.next_scan:
+            return []
+        self.next_scan = now + self.interval
+        current = {path: signature(path) for path in scan_directories(self.directories, self.recursive)}
+        changed = [path for path, sig in current.items() if self.seen.get(path) != sig]
+        self.seen = current
+        return changed
+
+    def close(self) -> None:
+        pass
+
+
+def open_watcher(directories: List[str], recursive: bool = False, poll_interval: Optional[float] = None):
+    """inotify watcher where available, polling otherwise (or when poll_interval is given)."""
+    if poll_interval is None:
+        try:
+            return InotifyWatcher(directories, recursive)
+        except (OSError, AttributeError):
+            poll_interval = DEFAULT_SETTLE
+    return PollingWatcher(directories, recursive, poll_interval)
+
+
+class Debouncer:
+    """Holds files back until no event has been seen for them for a settle time."""
+
+    def __init__(self, settle: float):
+        self.settle = settle
+        self.pending: Dict[str, List[float]] = {}  # path -> [deadline, first seen]
+
+    def touch(self, path: str, now: float, first_seen: Optional[float] = None) -> None:
+        entry = self.pending.get(path)
+        if entry is None:
+            self.pending[path] = [now + self.settle, now if first_seen is None else first_seen]
+        else:
+            entry[0] = now + self.settle
+
+    def timeout(self, now: float) -> Optional[float]:
+        if not self.pending:
+            return None
+        return max(0.0, min(deadline for deadline, _ in self.pending.values()) - now)
+
+    def due(self, now: float) -> List[Tuple[str, float]]:
+        """Pop the files whose settle time has passed; returns (path, first seen)."""
+        ready = [(path, first) for path, (deadline, first) in self.pending.items() if deadline <= now]
+        for path, _ in ready:
+            del self.pending[path]
+        return ready
+
+
+class WatchMetrics:
+    """Throughput, queue lag and latency of the ingestion daemon."""
+
+    def __init__(self):
+        self.started = time.time()
+        self.files = 0
+        self.failed = 0
+        self.edits = 0
+        self.queue_lag: deque = deque(maxlen=LATENCY_SAMPLES)    # ready -> worker start
+        self.processing: deque = deque(maxlen=LATENCY_SAMPLES)   # worker start -> done
+        self.latency: deque = deque(maxlen=LATENCY_SAMPLES)      # first event -> done
+        self.completed: deque = deque()                           # done times in the window
+
+    def record(self, result: Dict[str, Any]) -> None:
+        """Account for one finished file (a result of process_file)."""
+        self.files += 1
+        if result.get('error'):
+            self.failed += 1
+        self.edits += sum(1 for r in result.get('results', []) if r['status'] == 'apply')
+        if 'started' in result:
+            self.queue_lag.append(max(0.0, result['started'] - result['ready']))
+            self.processing.append(result['finished'] - result['started'])
+        self.latency.append(result['finished'] - result['first_seen'])
+        self.completed.append(result['finished'])
+
+    def snapshot(self, queued: int, in_flight: int, settling: int,
+                 oldest_queued: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Current metrics as a JSON-serialisable dict.
+
+        Args:
+            queued: Files ready and waiting for a worker
+            in_flight: Files submitted to the pool
+            settling: Files still inside their settle time
+            oldest_queued: Ready time of the oldest queued file
+        """
+        now = time.time()
+        while self.completed and self.completed[0] < now - THROUGHPUT_WINDOW:
+            self.completed.popleft()
+        uptime = now - self.started
+        return {
+            'uptime_s': round(uptime, 1),
+            'files': self.files,
+            'failed': self.failed,
+            'edits': self.edits,
+            'files_per_s': round(len(self.completed) / min(uptime, THROUGHPUT_WINDOW), 3) if uptime else 0.0,
+            'files_per_s_total': round(self.files / uptime, 3) if uptime else 0.0,
+            'queue_depth': queued,
+            'in_flight': in_flight,
+            'settling': settling,
+            'oldest_queued_s': round(now - oldest_queued, 3) if oldest_queued else 0.0,
+            'queue_lag': percentiles(self.queue_lag),
+            'processing': percentiles(self.processing),
+            'latency': percentiles(self.latency),
+        }
+
+
+_worker_rules = None
+
+
+def _init_worker(operations: List[Dict[str, Any]]) -> None:
+    global _worker_rules
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # The daemon decides when workers stop
+    _worker_rules = compile_rules(operations)
+
+
+def process_file(path: str, hdu: int, backup: bool, dry_run: bool, index: bool) -> Dict[str, Any]:
+    """
+    Apply the worker's rules to one file (runs in a pool process).
+
+    Returns:
+        {'path', 'started', 'finished', 'results', 'signature', 'rows'?} or
+        with 'error' on failure
+    """
+    from fits_metadata_editor import run_rules_on_file
+
+    result: Dict[str, Any] = {'path': path, 'started': time.time()}
+    try:
+        result['results'] = run_rules_on_file(path, hdu, _worker_rules, backup, dry_run)
+        if index:
+            from fits_index import index_rows
+            result['rows'] = index_rows(path)
+    except Exception as e:
+        result['error'] = str(e)
+    result['signature'] = signature(path)
+    result['finished'] = time.time()
+    return result
+
+
+class IngestDaemon:
+    """Watches directories and applies rules to arriving FITS files through a worker pool."""
+
+    def __init__(self, operations: List[Dict[str, Any]], directories: List[str], hdu: int = 0,
+                 workers: Optional[int] = None, backup: bool = True, dry_run: bool = False,
+                 settle: float = DEFAULT_SETTLE, max_wait: float = DEFAULT_MAX_WAIT,
+                 recursive: bool = False, poll_interval: Optional[float] = None,
+                 index_path: Optional[str] = None, index_interval: float = DEFAULT_INDEX_INTERVAL,
+                 metrics_path: Optional[str] = None, stats_interval: float = DEFAULT_STATS_INTERVAL,
+                 on_result: Optional[Callable[[Dict[str, Any]], None]] = None,
+                 on_stats: Optional[Callable[[Dict[str, Any]], None]] = None):
+        """
+        Initialize the daemon (nothing runs until run()).
+
+        Args:
+            operations: Batch/rules operations (as loaded from the JSON file)
+            directories: Incoming directories to watch
+            hdu: HDU index the rules apply to
+            workers: Worker processes (default: CPU count)
+            backup: Back up each file before saving it
+            dry_run: Evaluate the rules without writing files
+            settle: Seconds without events before a file is processed
+            max_wait: Give up on files that still look incomplete after this long
+            recursive: Watch subdirectories too
+            poll_interval: Rescan interval; forces polling instead of inotify
+            index_path: Header index (.npz) to keep up to date, created if missing
+            index_interval: Minimum seconds between index writes
+            metrics_path: JSON file the metrics are written to
+            stats_interval: Seconds between metrics reports
+            on_result: Called with each finished file's result
+            on_stats: Called with the metrics snapshot every stats_interval
+
+        Raises:
+            ValueError: If the rules do not compile
+        """
+        compile_rules(operations)  # Fail before starting anything
+        self.operations = operations
+        self.directories = [str(Path(d).resolve()) for d in directories]
+        self.hdu = hdu
+        self.workers = workers or os.cpu_count() or 1
+        self.backup = backup
+        self.dry_run = dry_run
+        self.settle = settle
+        self.max_wait = max_wait
+        self.recursive = recursive
+        self.poll_interval = poll_interval
+        self.index_path = index_path
+        self.index_interval = index_interval
+        self.metrics_path = metrics_path
+        self.stats_interval = stats_interval
+        self.on_result = on_result
+        self.on_stats = on_stats
+
+        self.debouncer = Debouncer(settle)
+        self.metrics = WatchMetrics()
+        self.queue: deque = deque()               # (path, first seen, ready)
+        self.in_flight: Dict[str, Tuple[Any, float, float]] = {}  # path -> (future, first seen, ready)
+        self.done = deque()                       # results handed over by pool callbacks
+        self.processed: Dict[str, Optional[Tuple[int, int]]] = {}  # path -> signature after processing
+        self.index_rows: List[Any] = []
+        self.running = False
+        self.wake_r, self.wake_w = os.pipe()
+        os.set_blocking(self.wake_r, False)
+        os.set_blocking(self.wake_w, False)
+
+    def stop(self) -> None:
+        """Ask the run loop to finish in-flight files and return (safe from signal handlers)."""
+        self.running = False
+        self._wake()
+
+    def _wake(self) -> None:
+        try:
+            os.write(self.wake_w, b'x')
+        except OSError as e:
+            if e.errno != errno.EAGAIN:
+                raise
+
+    def _drain_wake(self) -> None:
+        try:
+            while os.read(self.wake_r, 4096):
+                pass
+        except BlockingIOError:
+            pass
+
+    def _ready(self, now: float) -> None:
+        """Move settled files to the queue, holding back incomplete or busy ones."""
+        wall = time.time()
+        for path, first_seen in self.debouncer.due(now):
+            sig = signature(path)
+            if sig is None or sig == self.processed.get(path):
+                continue  # Deleted, or our own write / a duplicate event
+            if path in self.in_flight or not looks_complete(path, sig[0]):
+                if now - first_seen < self.max_wait:
+                    self.debouncer.touch(path, now, first_seen)
+                else:
+                    self.processed[path] = sig
+                    self._finish({'path': path, 'first_seen': wall - (now - first_seen),
+                                  'ready': wall, 'finished': wall,
+                                  'error': f"still incomplete after {self.max_wait:.0f} s (size {sig[0]})"})
+                continue
+            self.queue.append((path, wall - (now - first_seen), wall))
+
+    def _dispatch(self, pool) -> None:
+        """Keep the pool busy without handing it the whole queue (lag stays measurable)."""
+        while self.queue and len(self.in_flight) < self.workers * 2:
+            path, first_seen, ready = self.queue.popleft()
+            future = pool.submit(process_file, path, self.hdu, self.backup, self.dry_run,
+                                 self.index_path is not None)
+            self.in_flight[path] = (future, first_seen, ready)
+
+            def done(f, path=path, first_seen=first_seen, ready=ready):
+                if f.cancelled():
+                    return
+                try:
+                    result = f.result()
+                except Exception as e:
+                    now = time.time()
+                    result = {'path': path, 'finished': now, 'error': str(e)}
+                result.update(first_seen=first_seen, ready=ready)
+                self.done.append(result)
+                self._wake()
+
+            future.add_done_callback(done)
+
+    def _collect(self) -> None:
+        while self.done:
+            result = self.done.popleft()
+            self.in_flight.pop(result['path'], None)
+            self.processed[result['path']] = result.get('signature')
+            self._finish(result)
+
+    def _finish(self, result: Dict[str, Any]) -> None:
+        self.metrics.record(result)
+        self.index_rows.extend(result.pop('rows', []))
+        if self.on_result:
+            self.on_result(result)
+
+    def _write_index(self) -> None:
+        """Merge the rows of processed files into the index file (atomic replace)."""
+        if not self.index_path or not self.index_rows:
+            return
+        from fits_index import HeaderIndex
+
+        rows, self.index_rows = self.index_rows, []
+        index = HeaderIndex.load(self.index_path) if os.path.exists(self.index_path) else HeaderIndex.from_rows([])
+        index = index.merge(HeaderIndex.from_rows(rows))
+        tmp_path = f"{self.index_path}.tmp"
+        index.save(tmp_path)
+        os.replace(tmp_path, self.index_path)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Current metrics (see WatchMetrics.snapshot)."""
+        return self.metrics.snapshot(len(self.queue), len(self.in_flight), len(self.debouncer.pending),
+                                     self.queue[0][2] if self.queue else None)
+
+    def _report(self) -> None:
+        snapshot = self.snapshot()
+        if self.metrics_path:
+            tmp_path = f"{self.metrics_path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(snapshot, f, indent=2)
+            os.replace(tmp_path, self.metrics_path)
+        if self.on_stats:
+            self.on_stats(snapshot)
+
+    def run(self, initial_scan: bool = False) -> Dict[str, Any]:
+        """
+        Watch and process files until stop() is called (or SIGINT/SIGTERM).
+
+        Args:
+            initial_scan: Also process the files already in the directories;
+                otherwise they are only processed once they change
+
+        Returns:
+            Final metrics snapshot
+        """
+        watcher = open_watcher(self.directories, self.recursive, self.poll_interval)
+        now = time.monotonic()
+        for path in scan_directories(self.directories, self.recursive):
+            if initial_scan:
+                self.debouncer.touch(path, now)
+            else:
+                self.processed[path] = signature(path)
+
+        previous = {}
+        if threading.current_thread() is threading.main_thread():
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                previous[signum] = signal.signal(signum, lambda *_: self.stop())
+
+        pool = process_pool(self.workers, _init_worker, (self.operations,))
+        next_stats = now + self.stats_interval
+        next_index = now + self.index_interval
+        self.running = True
+        try:
+            while self.running:
+                now = time.monotonic()
+                timeouts = [t for t in (watcher.timeout(now), self.debouncer.timeout(now),
+                                        next_stats - now, next_index - now if self.index_rows else None)
+                            if t is not None]
+                fds = [self.wake_r] + ([watcher.fileno()] if watcher.fileno() is not None else [])
+                select.select(fds, [], [], max(0.0, min(timeouts)) if timeouts else None)
+                self._drain_wake()
+
+                now = time.monotonic()
+                for path in watcher.poll(now):
+                    self.debouncer.touch(path, now)
+                self._collect()
+                self._ready(now)
+                self._dispatch(pool)
+
+                if now >= next_index:
+                    self._write_index()
+                    next_index = now + self.index_interval
+                if now >= next_stats:
+                    self._report()
+                    next_stats = now + self.stats_interval
+        finally:
+            # Finish what the workers already have; files still queued are left for next time
+            pool.shutdown(wait=True, cancel_futures=True)
+            for path, (future, first_seen, ready) in list(self.in_flight.items()):
+                if future.cancelled():
+                    del self.in_flight[path]
+                    self.queue.appendleft((path, first_seen, ready))
+            self._collect()
+            watcher.close()
+            for signum, handler in previous.items():
+                signal.signal(signum, handler)
+            self._write_index()
+            self._report()
+            os.close(self.wake_r)
+            os.close(self.wake_w)
+        return self.snapshot()
@@ -0,0 +1,53 @@
+"""plan_index (vectorized over a header index) must plan what plan_header plans per header."""
+
+import pytest
+
+from fits_index import HeaderIndex
+from fits_rules import compile_rules, plan_header, plan_index
+
+HEADERS = [
+    {'EXPTIME': 30, 'AIRMASS': 1.2, 'DATE-OBS': '2024-01-02T03:04:05', 'NCOMBINE': 3},
+    {'EXPTIME': 0, 'AIRMASS': 1.0, 'DATE-OBS': '2024-01-03T00:00:00', 'NCOMBINE': 1},
+    {'EXPTIME': 45, 'AIRMASS': 2.5, 'DATE-OBS': '2024-02-29T12:00:00', 'NCOMBINE': 0},
+    {'EXPTIME': 7, 'AIRMASS': 0.5, 'DATE-OBS': 'not a date'},
+    {'AIRMASS': 1.7, 'DATE-OBS': '2023-12-31T23:59:59', 'NCOMBINE': 2},
+]
+
+RULES = [
+    [{'action': 'set', 'keyword': 'RATE', 'expr': '100 // EXPTIME'}],
+    [{'action': 'set', 'keyword': 'RATE', 'expr': '100.0 / EXPTIME'}],
+    [{'action': 'set', 'keyword': 'RATE', 'expr': '100 // EXPTIME', 'when': 'EXPTIME > 0'}],
+    [{'action': 'set', 'keyword': 'LAM', 'expr': 'log10(AIRMASS - 1)'}],
+    [{'action': 'set', 'keyword': 'SQ', 'expr': 'sqrt(AIRMASS - 1)'}],
+    [{'action': 'set', 'keyword': 'BIG', 'expr': 'exp(AIRMASS * 1000)'}],
+    [{'action': 'set', 'keyword': 'MJD-OBS', 'expr': 'mjd(DATE_OBS)'}],
+    [{'action': 'set', 'keyword': 'QUALITY', 'expr': '1 if AIRMASS < 1.5 else 2 if AIRMASS < 2 else 3'}],
+    [{'action': 'set', 'keyword': 'NEXP', 'expr': 'round(EXPTIME / 4)'},
+     {'action': 'set', 'keyword': 'LABEL', 'expr': 'str(NEXP)'}],
+    [{'action': 'add', 'keyword': 'EFFEXP', 'expr': 'EXPTIME * NCOMBINE', 'when': 'NCOMBINE > 1'},
+     {'action': 'update', 'keyword': 'EXPTIME', 'expr': 'EXPTIME + 1'},
+     {'action': 'delete', 'keyword': 'NCOMBINE', 'when': 'NCOMBINE < 2'}],
+]
+
+
+def _typed(plan):
+    """Results with values tagged by type, so 0 and 0.0 (or 2 and 2.0) differ."""
+    return [dict(result, value=(type(result['value']).__name__, result['value']))
+            if 'value' in result else result for result in plan]
+
+
+@pytest.mark.parametrize('operations', RULES, ids=lambda ops: ops[0]['expr'])
+def test_plan_index_matches_plan_header(operations):
+    rules = compile_rules(operations)
+    index = HeaderIndex.from_rows([(f'obs{i}.fits', 0, [0, 0], header) for i, header in enumerate(HEADERS)])
+    planned = plan_index(rules, index)
+    for header, plan in zip(HEADERS, planned):
+        assert _typed(plan) == _typed(plan_header(rules, dict(header)))
+
+
+def test_division_by_zero_is_an_error():
+    rules = compile_rules([{'action': 'set', 'keyword': 'RATE', 'expr': '100 // EXPTIME'}])
+    index = HeaderIndex.from_rows([('a.fits', 0, [0, 0], {'EXPTIME': 30}), ('b.fits', 0, [0, 0], {'EXPTIME': 0})])
+    ok, zero = plan_index(rules, index)
+    assert ok[0]['status'] == 'apply' and ok[0]['value'] == 3
+    assert zero[0]['status'] == 'error'
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+recorder.py の asyncio 版録音エンジン（python recorder.py --engine asyncio）
+- オーディオコールバック → call_soon_threadsafe → asyncio.Queue のブリッジでブロックを受け渡し
+- WAV への書き込み（ゲート判定を含む）はスレッドプール上で実行
+- MP3 変換は asyncio.create_subprocess_exec で起動し、同時実行数をセマフォで制限
+- 終了はシグナルでイベントを立てるだけなので、タイムアウト付きポーリングによる定期起床がない
+"""
+
+import asyncio
+import concurrent.futures
+import contextlib
+import functools
+import os
+import signal
+import sys
+import time
+
+import numpy as np
+
+import recorder
+
+
+class FrameBridge:
+    """
+    オーディオスレッドからイベントループへブロックを渡すスレッドセーフなブリッジ。
+    キューが溢れた場合は取りこぼしとして数えるだけで、オーディオスレッドは待たない。
+    """
+    def __init__(self, loop: asyncio.AbstractEventLoop, maxsize: int = 64):
+        self.loop = loop
+        self.q: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+
+    def push(self, cap: recorder.DeviceCapture, frames: np.ndarray):
+        # オーディオスレッドから呼ばれる
+        try:
+            self.loop.call_soon_threadsafe(self._put, cap, frames)
+        except RuntimeError:
+            # ループ終了後に届いたブロックは捨てる
+            pass
+
+    def _put(self, cap: recorder.DeviceCapture, frames: np.ndarray):
+        try:
+            self.q.put_nowait(frames)
+            cap.blocks += 1
+        except asyncio.QueueFull:
+            cap.dropped += 1
+
+
+class AsyncEncoderPool:
+    """
+    RotatingWavWriter から（書き込みスレッド上で）呼ばれる submit を、イベントループ上の
+    ffmpeg サブプロセスへ橋渡しする。EncoderPool と同じ submit インターフェース。
+    """
+    def __init__(self, loop: asyncio.AbstractEventLoop, workers: int = 1, cpus: set[int] | None = None):
+        self.loop = loop
+        self.cpus = cpus
+        self.sem = asyncio.Semaphore(max(1, workers))
+        self.tasks: set[asyncio.Task] = set()
+
+    def submit(self, wav_path: str, mp3_path: str, keep_wav: bool, vbr_quality: int):
+        self.loop.call_soon_threadsafe(self._spawn, wav_path, mp3_path, keep_wav, vbr_quality)
+
+    def _spawn(self, wav_path: str, mp3_path: str, keep_wav: bool, vbr_quality: int):
+        task = self.loop.create_task(self._encode(wav_path, mp3_path, keep_wav, vbr_quality))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    def _preexec(self):
+        # ffmpeg 子プロセスを指定 CPU に固定
+        recorder.pin_current_thread(self.cpus)
+
+    async def _encode(self, wav_path: str, mp3_path: str, keep_wav: bool, vbr_quality: int):
+        async with self.sem:
+            try:
+                proc = await asyncio.create_subprocess_exec(
+                    *recorder.mp3_command(wav_path, mp3_path, vbr_quality),
+                    preexec_fn=self._preexec if self.cpus else None,
+                )
+            except FileNotFoundError:
+                print("[WARN] ffmpeg が見つかりません。brew install ffmpeg してください。", file=sys.stderr)
+                return
+            returncode = await proc.wait()
+        if returncode != 0:
+            print(f"[WARN] ffmpeg 変換に失敗: {wav_path} (exit {returncode})", file=sys.stderr)
+            return
+        if not keep_wav:
+            os.remove(wav_path)
+
+    async def join(self):
+        while self.tasks:
+            await asyncio.gather(*list(self.tasks), return_exceptions=True)
+
+
+async def consume(cap: recorder.DeviceCapture, bridge: FrameBridge,
+                  executor: concurrent.futures.Executor):
+    """デバイス毎に 1 タスク。書き込みを順番に executor へ流すのでデバイス内の順序は保たれる"""
+    loop = asyncio.get_running_loop()
+    while True:
+        frames = await bridge.q.get()
+        if frames is None:
+            return
+        try:
+            await loop.run_in_executor(executor, cap.writer.write, frames)
+        except Exception as e:
+            print(f"[WARN] {cap.label}: 書き込みで例外: {e}", file=sys.stderr)
+
+
+async def every(interval_s: float, fn):
+    while True:
+        await asyncio.sleep(interval_s)
+        fn()
+
+
+async def _main(args):
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+
+    def request_stop():
+        if not stop.is_set():
+            print("\n[INFO] 終了処理中...（Ctrl+C）")
+        stop.set()
+
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, request_stop)
+
+    encoder = AsyncEncoderPool(loop, workers=args.encoder_threads, cpus=recorder.parse_cpus(args.encoder_cpus))
+    captures = recorder.build_captures(args, encoder)
+    io_cpus = recorder.parse_cpus(args.io_cpus)
+    executor = concurrent.futures.ThreadPoolExecutor(
+        max_workers=min(len(captures), args.writer_threads),
+        thread_name_prefix="writer",
+        initializer=recorder.pin_current_thread,
+        initargs=(io_cpus,),
+    )
+
+    bridges: list[FrameBridge] = []
+    try:
+        for cap in captures:
+            bridge = FrameBridge(loop)
+            bridges.append(bridge)
+
+            def audio_callback(indata, frames, t, status, cap=cap, bridge=bridge, quiet=args.realtime):
+                t0 = time.perf_counter_ns()
+                if status:
+                    cap.xruns += 1
+                    if not quiet:
+                        loop.call_soon_threadsafe(functools.partial(print, f"[WARN] {cap.label}: {status}", file=sys.stderr))
+                bridge.push(cap, indata.copy())
+                if cap.profiler is not None:
+                    cap.profiler.record(t0)
+
+            cap.stream = recorder.open_input_stream(cap, args, audio_callback)
+    except BaseException:
+        # N 台目のストリームを開けなかった場合も、開いたストリームと書き込み中のファイルを閉じる
+        recorder.close_captures(captures)
+        await encoder.join()
+        executor.shutdown()
+        raise
+
+    retention_mgr = recorder.start_retention(args, captures)
+    gc_ctl = recorder.GCController(args.gc_interval, args.gc_full_interval) if args.realtime else None
+    # 定期処理は有効なものだけタスクにする（無効ならアイドル時の起床はない）
+    periodic: list[asyncio.Task] = []
+    if gc_ctl is not None:
+        gc_ctl.start()
+        if args.gc_interval > 0:
+            periodic.append(loop.create_task(every(args.gc_interval, gc_ctl.tick)))
+    if args.stats_interval > 0:
+        def report():
+            for cap in captures:
+                print(f"[STAT] {cap.stats_line()}")
+        periodic.append(loop.create_task(every(args.stats_interval, report)))
+
+    consumers = [loop.create_task(consume(cap, bridge, executor)) for cap, bridge in zip(captures, bridges)]
+
+    print(f"[INFO] 録音開始（{len(captures)} デバイス, asyncio）。終了するには Ctrl+C")
+    try:
+        with contextlib.ExitStack() as stack:
+            for cap in captures:
+                stack.enter_context(cap.stream)
+            await stop.wait()
+    finally:
+        for task in periodic:
+            task.cancel()
+        # 受け取り済みのブロックを書き切ってからファイルを閉じる
+        for bridge in bridges:
+            await bridge.q.put(None)
+        await asyncio.gather(*consumers)
+        for cap in captures:
+            await loop.run_in_executor(executor, cap.writer.close)
+        await encoder.join()
+        executor.shutdown()
+        if retention_mgr is not None:
+            retention_mgr.stop()
+        if gc_ctl is not None:
+            gc_ctl.stop()
+        recorder.print_report(captures, gc_ctl)
+
+
+def run(args):
+    asyncio.run(_main(args))
@@ -0,0 +1,395 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+共有メモリのキャプチャバス
+- 1 プロセスがデバイスを開き、ブロックを multiprocessing.shared_memory のリングバッファへ書き込む
+- 各コンシューマ（WAV 保存 / VAD セグメンタ / レベルメータ / MP3 エンコーダ）は独立したプロセスで、
+  リング上のブロックを numpy のビューとしてコピーせずに読む
+- VAD は 48kHz などのキャプチャをベクトル化したポリフェーズリサンプラで 16kHz にして判定する
+1 つのキャプチャを複数コアで処理できる。
+
+python capture_bus.py --consumers wav,vad,level --segment 60
+"""
+
+import argparse
+import datetime as dt
+import math
+import multiprocessing as mp
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+HEADER_BYTES = 64
+
+
+class ShmRing:
+    """
+    単一ライター・複数リーダーのブロックリング。
+    レイアウト: ヘッダ(書き込み済みブロック数, スロット数, ブロック長, チャンネル数, サンプルレート)
+    + スロット毎のシーケンス番号と有効フレーム数 + float32 のブロック領域。
+    スロットのシーケンス番号はシーケンスロック: 書き込み中は奇数 2*seq+1、書き込み完了で 2*(seq+1)。
+    """
+    def __init__(self, shm: shared_memory.SharedMemory):
+        self.shm = shm
+        self.hdr = np.ndarray((8,), dtype=np.uint64, buffer=shm.buf)
+        self.slots = int(self.hdr[1])
+        self.blocksize = int(self.hdr[2])
+        self.channels = int(self.hdr[3])
+        self.samplerate = int(self.hdr[4])
+        off = HEADER_BYTES
+        self.slot_seq = np.ndarray((self.slots,), dtype=np.uint64, buffer=shm.buf, offset=off)
+        off += 8 * self.slots
+        self.slot_len = np.ndarray((self.slots,), dtype=np.uint64, buffer=shm.buf, offset=off)
+        off += 8 * self.slots
+        self.data = np.ndarray((self.slots, self.blocksize, self.channels), dtype=np.float32,
+                               buffer=shm.buf, offset=off)
+
+    @classmethod
+    def create(cls, slots: int, blocksize: int, channels: int, samplerate: int) -> "ShmRing":
+        size = HEADER_BYTES + 16 * slots + slots * blocksize * channels * 4
+        shm = shared_memory.SharedMemory(create=True, size=size)
+        hdr = np.ndarray((8,), dtype=np.uint64, buffer=shm.buf)
+        hdr[:] = 0
+        hdr[1:5] = (slots, blocksize, channels, samplerate)
+        ring = cls(shm)
+        ring.slot_seq[:] = 0
+        return ring
+
+    @classmethod
+    def attach(cls, name: str) -> "ShmRing":
+        try:
+            # Python 3.13 以降: 読む側はリソーストラッカーに登録しない
+            shm = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            # それ以前: バスが起動した子プロセスはトラッカーを共有するので登録されても問題ない
+            shm = shared_memory.SharedMemory(name=name)
+        return cls(shm)
+
+    @property
+    def write_seq(self) -> int:
+        return int(self.hdr[0])
+
+    def write(self, block: np.ndarray):
+        """オーディオコールバックから呼ぶ。スロットを書き込み中にしてからコピーし、完了後に公開する"""
+        seq = int(self.hdr[0])
+        i = seq % self.slots
+        n = min(len(block), self.blocksize)
+        self.slot_seq[i] = 2 * seq + 1
+        self.data[i, :n] = block[:n]
+        self.slot_len[i] = n
+        self.slot_seq[i] = 2 * (seq + 1)
+        self.hdr[0] = seq + 1
+
+    def close(self, unlink: bool = False):
+        # numpy のビューを解放してから閉じる
+        del self.hdr, self.slot_seq, self.slot_len, self.data
+        try:
+            self.shm.close()
+        except BufferError:
+            # コンシューマのループ変数などにビューが残っている場合。プロセス終了時に解放される
+            pass
+        if unlink:
+            self.shm.unlink()
+
+
+class RingReader:
+    """
+    コンシューマ側の読み出し位置。追いつかれた（上書きされた）ブロックは取りこぼしとして数える。
+    """
+    def __init__(self, ring: ShmRing):
+        self.ring = ring
+        self.seq = ring.write_seq  # 接続時点の最新から読む
+        self.dropped = 0
+        self.torn = 0
+        self.period_s = ring.blocksize / ring.samplerate
+
+    def blocks(self, stop):
+        """
+        ブロックのビュー（コピーなし）を順に返すジェネレータ。
+        ビューは次のブロックを要求するまで有効。読み出しの前後でスロットのシーケンス番号を確認し、
+        読み出し前に上書きが始まっていたブロックは渡さず、読み出し中に上書きされたものは torn として数える。
+        """
+        ring = self.ring
+        # ライターが書き込み中のスロットを避けるため 1 スロット余裕を持つ
+        window = ring.slots - 1
+        while True:
+            w = ring.write_seq
+            if self.seq >= w:
+                # 停止後は書き込み済みのブロックを読み切ってから終わる
+                if stop.is_set():
+                    return
+                time.sleep(self.period_s / 2)
+                continue
+            if w - self.seq > window:
+                self.dropped += w - self.seq - window
+                self.seq = w - window
+            i = self.seq % ring.slots
+            expected = 2 * (self.seq + 1)
+            if int(ring.slot_seq[i]) != expected:
+                # 読む前にライターが次の周回の書き込みを始めている
+                self.dropped += 1
+                self.seq += 1
+                continue
+            view = ring.data[i, :int(ring.slot_len[i])]
+            yield view
+            if int(ring.slot_seq[i]) != expected:
+                self.torn += 1
+            self.seq += 1
+
+
+class PolyphaseResampler:
+    """
+    有理数比（dst/src = L/M）のストリーミング・ポリフェーズリサンプラ（1 チャンネル）。
+    カイザー窓付き sinc の FIR を L 個の位相に分解し、出力サンプルごとの窓をまとめて
+    sliding_window_view + einsum で計算する（Python のループなし）。ブロック境界をまたいで状態を保持する。
+    """
+    def __init__(self, src_rate: int, dst_rate: int, taps_per_phase: int = 32, beta: float = 8.0):
+        g = math.gcd(src_rate, dst_rate)
+        self.up = dst_rate // g
+        self.down = src_rate // g
+        self.taps = taps_per_phase
+
+        n = taps_per_phase * self.up
+        cutoff = 1.0 / max(self.up, self.down)  # アップサンプル後のナイキストに対する比
+        t = np.arange(n) - (n - 1) / 2
+        h = cutoff * np.sinc(cutoff * t) * np.kaiser(n, beta) * self.up
+        # phases[p] = h[p::L] を相関用に反転
+        self.phases = h.reshape(taps_per_phase, self.up).T[:, ::-1].astype(np.float32)
+
+        self.hist = np.zeros(taps_per_phase - 1, dtype=np.float32)
+        self.t = 0  # 次の出力のアップサンプル上の位置（現在ブロック先頭基準）
+
+    def process(self, x: np.ndarray) -> np.ndarray:
+        x = np.asarray(x, dtype=np.float32)
+        total = len(x) * self.up
+        if self.t >= total:
+            n_out = 0
+        else:
+            n_out = -(-(total - self.t) // self.down)
+        ext = np.concatenate((self.hist, x))
+        if n_out:
+            ks = self.t + self.down * np.arange(n_out)
+            qs = ks // self.up
+            ps = ks % self.up
+            windows = np.lib.stride_tricks.sliding_window_view(ext, self.taps)[qs]
+            y = np.einsum("nk,nk->n", windows, self.phases[ps])
+        else:
+            y = np.zeros(0, dtype=np.float32)
+        self.t += n_out * self.down - total
+        self.hist = ext[len(ext) - (self.taps - 1):]
+        return y
+
+
+# ---- コンシューマ（それぞれ独立したプロセスで動く） ----
+
+def _report(name: str, reader: RingReader):
+    print(f"[INFO] {name}: dropped={reader.dropped} torn={reader.torn}")
+
+
+def wav_consumer(shm_name: str, stop, outdir: str, segment: int, do_mp3: bool, keep_wav: bool, vbrq: int):
+    """RotatingWavWriter で連続保存（リング上のビューをそのまま書き込む）"""
+    import recorder
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    ring = ShmRing.attach(shm_name)
+    reader = RingReader(ring)
+    writer = recorder.RotatingWavWriter(outdir, ring.samplerate, ring.channels, segment,
+                                        do_mp3, keep_wav, vbrq)
+    try:
+        for view in reader.blocks(stop):
+            writer.write(view)
+    finally:
+        writer.close()
+        _report("wav", reader)
+        ring.close()
+
+
+def vad_consumer(shm_name: str, stop, outdir: str):
+    """16kHz モノラルへリサンプルし、VADAudioRecorder/app.py の状態遷移でセグメントを保存"""
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "VADAudioRecorder"))
+    import app as vad_app
+    import webrtcvad
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    ring = ShmRing.attach(shm_name)
+    reader = RingReader(ring)
+    resampler = PolyphaseResampler(ring.samplerate, vad_app.SAMPLE_RATE)
+    vad = webrtcvad.Vad(vad_app.VAD_MODE)
+    state = vad_app.reset_state()
+    gate = vad_app.reset_gate() if vad_app.GATE_ENABLED else None
+    pending = np.zeros(0, dtype=np.int16)
+    os.makedirs(outdir, exist_ok=True)
+
+    def save(state):
+        # エンコード中もリングを読み続けるため、保存はスレッドで行う
+        if len(state['seg_frames']) >= vad_app.MIN_FRAMES:
+            path = vad_app.get_filepath(state['seg_start_ts'], outdir)
+            threading.Thread(target=vad_app.save_as_mp3, args=(path, b"".join(state['seg_frames']))).start()
+            print("[INFO] VAD セグメント保存:", path)
+
+    try:
+        for view in reader.blocks(stop):
+            mono = view.mean(axis=1) if ring.channels > 1 else view[:, 0]
+            pcm16 = (np.clip(resampler.process(mono), -1.0, 1.0) * 32767).astype(np.int16)
+            pending = np.concatenate((pending, pcm16))
+            n = len(pending) // vad_app.FRAME_SAMPLES
+            for i in range(n):
+                frame = pending[i * vad_app.FRAME_SAMPLES:(i + 1) * vad_app.FRAME_SAMPLES].tobytes()
+                if vad_app.process_audio_frame(frame, vad, state, save=save, gate=gate):
+                    state = vad_app.reset_state()
+            pending = pending[n * vad_app.FRAME_SAMPLES:]
+    finally:
+        _report("vad", reader)
+        if gate is not None:
+            print(f"[INFO] vad: {vad_app.gate_stats(gate)}")
+        ring.close()
+
+
+def level_consumer(shm_name: str, stop, interval_s: float = 1.0):
+    """チャンネル毎の RMS / ピーク（dBFS）を定期的に表示"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    ring = ShmRing.attach(shm_name)
+    reader = RingReader(ring)
+    sq = np.zeros(ring.channels)
+    peak = np.zeros(ring.channels)
+    count = 0
+    last = time.monotonic()
+    try:
+        for view in reader.blocks(stop):
+            sq += np.einsum("ij,ij->j", view, view)
+            peak = np.maximum(peak, np.abs(view).max(axis=0))
+            count += len(view)
+            if time.monotonic() - last >= interval_s and count:
+                rms_db = 10 * np.log10(np.maximum(sq / count, 1e-12))
+                peak_db = 20 * np.log10(np.maximum(peak, 1e-6))
+                print("[LEVEL] " + " ".join(f"ch{c}: rms {r:6.1f} dB peak {p:6.1f} dB"
+                                            for c, (r, p) in enumerate(zip(rms_db, peak_db))))
+                sq[:] = 0
+                peak[:] = 0
+                count = 0
+                last = time.monotonic()
+    finally:
+        _report("level", reader)
+        ring.close()
+
+
+def encoder_consumer(shm_name: str, stop, outdir: str, bitrate: str):
+    """ffmpeg の標準入力へ float32 PCM を流して MP3 を連続作成（ビューのバッファを直接渡す）"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    ring = ShmRing.attach(shm_name)
+    reader = RingReader(ring)
+    path = os.path.join(outdir, dt.datetime.now().strftime("%Y%m%d%H%M%S") + ".stream.mp3")
+    cmd = ["ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
+           "-f", "f32le", "-ar", str(ring.samplerate), "-ac", str(ring.channels), "-i", "pipe:0",
+           "-codec:a", "libmp3lame", "-b:a", bitrate, path]
+    try:
+        proc = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+    except FileNotFoundError:
+        print("[WARN] ffmpeg が見つかりません。brew install ffmpeg してください。", file=sys.stderr)
+        ring.close()
+        return
+    try:
+        for view in reader.blocks(stop):
+            proc.stdin.write(view)  # C 連続のビューなのでそのままバッファとして渡せる
+    except BrokenPipeError:
+        pass
+    finally:
+        proc.stdin.close()
+        proc.wait()
+        print(f"[INFO] Saved MP3: {path}")
+        _report("encoder", reader)
+        ring.close()
+
+
+def main():
+    import sounddevice as sd
+    import recorder
+
+    parser = argparse.ArgumentParser(description="共有メモリのキャプチャバス（1 デバイス → 複数コンシューマプロセス）")
+    parser.add_argument("--outdir", "-o", type=str, default="./recordings", help="保存ディレクトリ（既定: ./recordings）")
+    parser.add_argument("--samplerate", "-r", type=int, default=48000, help="サンプルレート（既定: 48000）")
+    parser.add_argument("--channels", "-c", type=int, default=1, help="チャンネル数（既定: 1）")
+    parser.add_argument("--device", type=str, default=None, help="録音デバイス名/番号（未指定で既定デバイス）")
+    parser.add_argument("--blocksize", type=int, default=2048, help="1 ブロックのフレーム数（既定: 2048）")
+    parser.add_argument("--latency", type=str, default="low", help="低遅延プロファイル: 'low' 推奨")
+    parser.add_argument("--slots", type=int, default=256, help="リングのブロック数（既定: 256）")
+    parser.add_argument("--consumers", type=str, default="wav,level",
+                        help="起動するコンシューマ（wav, vad, level, encoder をカンマ区切り。既定: wav,level）")
+    parser.add_argument("--segment", "-s", type=int, default=0, help="wav: ファイル分割の間隔（秒）")
+    parser.add_argument("--mp3", action="store_true", help="wav: 各セグメントを MP3 へ変換")
+    parser.add_argument("--keep-wav", action="store_true", help="wav: --mp3 指定時も WAV を残す")
+    parser.add_argument("--vbrq", type=int, default=2, help="wav: MP3 VBR 品質（既定: 2）")
+    parser.add_argument("--bitrate", type=str, default="128k", help="encoder: MP3 ビットレート（既定: 128k）")
+    args = parser.parse_args()
+
+    recorder.ensure_dir(args.outdir)
+    names = [c.strip() for c in args.consumers.split(",") if c.strip()]
+
+    targets = {
+        "wav": (wav_consumer, (args.outdir, args.segment, args.mp3, args.keep_wav, args.vbrq)),
+        "vad": (vad_consumer, (os.path.join(args.outdir, "vad"),)),
+        "level": (level_consumer, ()),
+        "encoder": (encoder_consumer, (args.outdir, args.bitrate)),
+    }
+    # プロセスを 1 つでも起動する前に検証する（起動後に終了するとコンシューマの join で止まる）
+    unknown = [name for name in names if name not in targets]
+    if unknown:
+        print(f"[ERROR] 不明なコンシューマ: {', '.join(unknown)}", file=sys.stderr)
+        sys.exit(1)
+
+    ctx = mp.get_context("spawn")
+    stop = ctx.Event()
+    ring = ShmRing.create(args.slots, args.blocksize, args.channels, args.samplerate)
+
+    stop_flag = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: stop_flag.set())
+    signal.signal(signal.SIGTERM, lambda *_: stop_flag.set())
+
+    xruns = 0
+
+    def audio_callback(indata, frames, t, status):
+        nonlocal xruns
+        if status:
+            xruns += 1
+        ring.write(indata)
+
+    procs = []
+    try:
+        for name in names:
+            fn, extra = targets[name]
+            p = ctx.Process(target=fn, args=(ring.shm.name, stop, *extra), name=name)
+            p.start()
+            procs.append(p)
+
+        # デバイスを開けなかった場合もコンシューマを止めて共有メモリを解放する
+        stream = sd.InputStream(
+            device=recorder.parse_device(args.device),
+            channels=args.channels,
+            samplerate=args.samplerate,
+            blocksize=args.blocksize,
+            latency=args.latency,
+            dtype="float32",
+            callback=audio_callback,
+        )
+
+        print(f"[INFO] キャプチャバス開始（{ring.shm.name}, コンシューマ: {', '.join(names)}）。終了するには Ctrl+C")
+        with stream:
+            stop_flag.wait()
+    finally:
+        print("\n[INFO] 終了処理中...")
+        stop.set()
+        for p in procs:
+            p.join()
+        print(f"[INFO] capture: blocks={ring.write_seq} xruns={xruns}")
+        ring.close(unlink=True)
+    print("[INFO] 正常終了")
+
+
+if __name__ == "__main__":
+    main()
@@ -8,21 +8,31 @@ Mac用・常時録音スクリプト（シンプル実装）
 - セグメント未指定: 1ファイルに連続保存
 - セグメント指定: n秒ごとにファイル分割
 - ファイル名: 録音開始日時 yyyyMMddHHmmss.wav / .mp3
+- --gate 指定で発話区間のみ保存（webrtcvad, 区間情報は yyyyMMddHHmmss.json）
 """
 
 import argparse
+import collections
+import concurrent.futures
+import contextlib
 import datetime as dt
+import gc
+import json
 import os
 import queue
 import signal
 import subprocess
 import sys
 import threading
+import time
+import wave
 
 import numpy as np
 import sounddevice as sd
 import soundfile as sf
 
+import retention
+
 STOP_FLAG = False
 
 def fmt_now_for_filename(t: dt.datetime) -> str:
@@ -31,16 +41,41 @@ def fmt_now_for_filename(t: dt.datetime) -> str:
 def ensure_dir(path: str):
     os.makedirs(path, exist_ok=True)
 
-def encode_mp3_with_ffmpeg(wav_path: str, mp3_path: str, keep_wav: bool = False, vbr_quality: int = 2):
+def parse_cpus(value: str | None) -> set[int] | None:
+    """'2,3' や '0-3' 形式の CPU 指定を集合に変換"""
+    if not value:
+        return None
+    cpus = set()
+    for part in value.split(","):
+        if "-" in part:
+            lo, hi = part.split("-", 1)
+            cpus.update(range(int(lo), int(hi) + 1))
+        else:
+            cpus.add(int(part))
+    return cpus
+
+def pin_current_thread(cpus: set[int] | None):
+    """呼び出したスレッドを指定 CPU に固定（Linux のみ。子プロセスにも継承される）"""
+    if not cpus:
+        return
+    if not hasattr(os, "sched_setaffinity"):
+        print("[WARN] この OS ではスレッドの CPU 固定に未対応です。", file=sys.stderr)
+        return
+    try:
+        os.sched_setaffinity(0, cpus)
+    except OSError as e:
+        print(f"[WARN] CPU 固定に失敗: {e}", file=sys.stderr)
+
+def mp3_command(wav_path: str, mp3_path: str, vbr_quality: int = 2) -> list[str]:
     """
     ffmpeg -i input.wav -codec:a libmp3lame -q:a 2 output.mp3
     """
+    return ["ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
+            "-i", wav_path, "-codec:a", "libmp3lame", "-q:a", str(vbr_quality), mp3_path]
+
+def encode_mp3_with_ffmpeg(wav_path: str, mp3_path: str, keep_wav: bool = False, vbr_quality: int = 2):
     try:
-        subprocess.run(
-            ["ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
-             "-i", wav_path, "-codec:a", "libmp3lame", "-q:a", str(vbr_quality), mp3_path],
-            check=True
-        )
+        subprocess.run(mp3_command(wav_path, mp3_path, vbr_quality), check=True)
         if not keep_wav:
             os.remove(wav_path)
     except FileNotFoundError:
@@ -48,13 +83,162 @@ def encode_mp3_with_ffmpeg(wav_path: str, mp3_path: str, keep_wav: bool = False,
     except subprocess.CalledProcessError as e:
         print(f"[WARN] ffmpeg 変換に失敗: {e}", file=sys.stderr)
 
+class EncoderPool:
+    """
+    WAV→MP3 エンコードを非同期に行うワーカースレッドプール。
+    複数デバイスを録音する場合は全ライターで 1 つのプールを共有する。
+    """
+    def __init__(self, workers: int = 1, cpus: set[int] | None = None):
+        self.cpus = cpus
+        self.q: queue.Queue[tuple[str, str, bool, int]] = queue.Queue()
+        self.threads = [threading.Thread(target=self._worker, daemon=True) for _ in range(max(1, workers))]
+        for t in self.threads:
+            t.start()
+
+    def submit(self, wav_path: str, mp3_path: str, keep_wav: bool, vbr_quality: int):
+        self.q.put((wav_path, mp3_path, keep_wav, vbr_quality))
+
+    def _worker(self):
+        # ffmpeg はこのスレッドから起動されるので CPU 固定を引き継ぐ
+        pin_current_thread(self.cpus)
+        while True:
+            try:
+                wav_path, mp3_path, keep_wav, vbr_quality = self.q.get()
+                # すでにSTOP_FLAGでも、キューに残った分は処理して良い
+                encode_mp3_with_ffmpeg(wav_path, mp3_path, keep_wav=keep_wav, vbr_quality=vbr_quality)
+            except Exception as e:
+                print(f"[WARN] エンコードスレッドで例外: {e}", file=sys.stderr)
+            finally:
+                self.q.task_done()
+
+    def join(self):
+        self.q.join()
+
+class SpeechGate:
+    """
+    VADAudioRecorder/app.py と同じ判定ロジック（K-of-N 開始判定・ハングタイム）で発話区間を判定するゲート。
+    VAD は 16kHz モノラルへ間引いたコピー上で 30ms フレーム単位に評価する（保存する音声には手を加えない）。
+    プリロールは判定結果を受けて RotatingWavWriter 側が元のサンプルレートで保持する。
+    """
+    VAD_RATE = 16000
+    FRAME_MS = 30
+
+    def __init__(self, samplerate: int, vad_mode: int = 2, start_k: int = 20, start_n: int = 30,
+                 pre_roll_s: float = 2.0, post_roll_s: float = 2.0):
+        try:
+            import webrtcvad
+        except ImportError:
+            raise RuntimeError("webrtcvad が見つかりません。pip install webrtcvad してください。")
+
+        self.vad = webrtcvad.Vad(vad_mode)
+        self.samplerate = samplerate
+        self.frame_samples = self.VAD_RATE * self.FRAME_MS // 1000
+        self.start_k = start_k
+        self.hang_frames = int(post_roll_s * 1000 / self.FRAME_MS)
+        self.pre_roll_samples = int(pre_roll_s * samplerate)
+
+        self.collecting = False
+        self.silence_run = 0
+        self.recent_flags: collections.deque[int] = collections.deque(maxlen=start_n)
+
+        # 間引き処理の状態（ブロック境界をまたいで位相を連続させる）
+        self._step = samplerate / self.VAD_RATE
+        self._phase = 0.0
+        self._last = np.zeros(0, dtype=np.float32)
+        self._pending = np.zeros(0, dtype=np.int16)  # 30ms に満たない 16kHz サンプル
+
+    def _downsample(self, frames: np.ndarray) -> np.ndarray:
+        """モノラル化して 16kHz へ線形補間で間引き、int16 で返す"""
+        mono = frames.mean(axis=1) if frames.ndim > 1 else frames
+        x = np.concatenate((self._last, mono.astype(np.float32, copy=False)))
+        if len(x) == 0:
+            return np.zeros(0, dtype=np.int16)
+        if self._phase > len(x) - 1:
+            self._phase -= len(x) - 1
+            self._last = x[-1:]
+            return np.zeros(0, dtype=np.int16)
+
+        n = int((len(x) - 1 - self._phase) // self._step) + 1
+        positions = self._phase + self._step * np.arange(n)
+        out = np.interp(positions, np.arange(len(x)), x)
+        self._phase = self._phase + self._step * n - (len(x) - 1)
+        self._last = x[-1:]
+        return (np.clip(out, -1.0, 1.0) * 32767).astype(np.int16)
+
+    def process(self, frames: np.ndarray) -> bool:
+        """
+        ブロックを VAD に通して状態を更新し、ブロック末尾時点で発話区間内かを返す。
+        """
+        pcm = np.concatenate((self._pending, self._downsample(frames)))
+        n_frames = len(pcm) // self.frame_samples
+        for i in range(n_frames):
+            frame = pcm[i * self.frame_samples:(i + 1) * self.frame_samples]
+            is_voiced = self.vad.is_speech(frame.tobytes(), self.VAD_RATE)
+            self.recent_flags.append(1 if is_voiced else 0)
+
+            if not self.collecting:
+                if sum(self.recent_flags) >= self.start_k:
+                    self.collecting = True
+                    self.silence_run = 0
+            else:
+                self.silence_run = 0 if is_voiced else self.silence_run + 1
+                if self.silence_run >= self.hang_frames:
+                    self.collecting = False
+                    self.recent_flags.clear()
+        self._pending = pcm[n_frames * self.frame_samples:]
+        return self.collecting
+
+class PreallocatedWavFile:
+    """
+    セグメント長ぶんのディスク領域を先に確保して書き込む PCM16 WAV ファイル（ギャップレスローテーション用）。
+    sf.SoundFile と同じ name / write / flush / close を持つ。
+    close 時にヘッダのデータ長を確定し、使わなかった確保領域を切り詰める。
+    """
+    HEADER_BYTES = 44
+
+    def __init__(self, path: str, samplerate: int, channels: int, prealloc_frames: int | None = None):
+        self.name = path
+        self._f = open(path, "wb")
+        if prealloc_frames and hasattr(os, "posix_fallocate"):
+            try:
+                os.posix_fallocate(self._f.fileno(), 0, self.HEADER_BYTES + prealloc_frames * channels * 2)
+            except OSError:
+                # 確保できなくても書き込みは続行できる
+                pass
+        self._w = wave.open(self._f, "wb")
+        self._w.setnchannels(channels)
+        self._w.setsampwidth(2)
+        self._w.setframerate(samplerate)
+        # ヘッダをここで書いておき、最初の write を軽くする
+        self._w.writeframesraw(b"")
+
+    def write(self, frames: np.ndarray):
+        pcm = (np.clip(frames, -1.0, 1.0) * 32767).astype("<i2")
+        self._w.writeframesraw(pcm.tobytes())
+
+    def flush(self):
+        self._f.flush()
+
+    def close(self):
+        end = self._f.tell()
+        self._w.close()  # ヘッダのデータ長を書き戻す（ファイル自体は閉じない）
+        self._f.truncate(end)
+        self._f.close()
+
 class RotatingWavWriter:
     """
     入力ストリームから受け取った音声フレームを、セグメント長ごとにWAVファイルへローテーション保存。
     セグメント未指定（None または 0）の場合は 1ファイル連続保存。
+    gate を渡すと発話区間のみを書き出し（ゲートモード）、セグメントは実時間で区切る。
+    区間とギャップの位置はセグメント毎に同名の .json へ記録する。
+    gapless=True では、次のセグメントファイルをバックグラウンドで先に開いて領域を確保し、
+    ファイルの確定（flush/close）もバックグラウンドで行う。切り替えはサンプル単位で正確に行い、
+    次ファイルの開始時刻は前ファイルの開始時刻 + セグメント長とする。
     """
     def __init__(self, outdir: str, samplerate: int, channels: int,
-                 segment_sec: int | None, do_mp3: bool, keep_wav: bool, vbr_quality: int):
+                 segment_sec: int | None, do_mp3: bool, keep_wav: bool, vbr_quality: int,
+                 gate: SpeechGate | None = None, encoder: EncoderPool | None = None,
+                 gapless: bool = False):
         self.outdir = outdir
         self.samplerate = samplerate
         self.channels = channels
@@ -68,52 +252,165 @@ class RotatingWavWriter:
         self.samples_written_this_segment = 0
         self.segment_samples = (self.segment_sec * self.samplerate) if self.segment_sec else None
 
-        # エンコード用のジョブキュー（WAV→MP3を非同期化して取りこぼしを防止）
-        self.encode_q: queue.Queue[tuple[str, str]] = queue.Queue()
-        self.enc_thread = threading.Thread(target=self._encode_worker, daemon=True)
-        self.enc_thread.start()
+        # ゲートモード用の状態
+        self.gate = gate
+        self.timeline_samples = 0  # セグメント開始からの実時間（サンプル数、無音区間を含む）
+        self.regions: list[dict] = []  # 書き出した発話区間
+        self.preroll: collections.deque[np.ndarray] = collections.deque()
+        self.preroll_samples = 0
+        self.total_timeline_samples = 0
+        self.total_stored_samples = 0
+
+        # エンコード用のワーカー（WAV→MP3を非同期化して取りこぼしを防止）
+        # encoder 未指定なら専用のプールを持ち、close() で完了を待つ
+        self.owns_encoder = encoder is None
+        self.encoder = encoder or EncoderPool()
+
+        # ギャップレスローテーション用: ファイルの事前オープンと確定を行うバックグラウンドスレッド
+        # 事前オープンは開始時刻を予測できる連続保存（セグメント指定あり）のみ
+        self.gapless = gapless
+        self.preopen = gapless and gate is None and self.segment_samples is not None
+        self.bg = concurrent.futures.ThreadPoolExecutor(max_workers=1) if gapless else None
+        self.next_file = None  # type: tuple[dt.datetime, concurrent.futures.Future] | None
+
+    def _create_file(self, start: dt.datetime):
+        # 閉じるまでは .part 付きの名前にし、保持管理（retention.py）が書き込み中のファイルに触れないようにする
+        fpath = os.path.join(self.outdir, fmt_now_for_filename(start) + ".wav" + retention.PART_SUFFIX)
+        if self.gapless:
+            prealloc = self.segment_samples if self.preopen else None
+            return PreallocatedWavFile(fpath, self.samplerate, self.channels, prealloc)
+        return sf.SoundFile(fpath, mode="w", samplerate=self.samplerate,
+                            channels=self.channels, subtype="PCM_16", format="WAV")
 
-    def _open_new_file(self):
+    def _open_new_file(self, start: dt.datetime | None = None):
         if self.current_file is not None:
             self._close_current_file()
 
-        self.current_start = dt.datetime.now()
-        fname = fmt_now_for_filename(self.current_start) + ".wav"
-        fpath = os.path.join(self.outdir, fname)
-        self.current_file = sf.SoundFile(fpath, mode="w", samplerate=self.samplerate,
-                                         channels=self.channels, subtype="PCM_16")
+        if self.next_file is not None:
+            # 先に開いておいたファイルへ切り替え（通常は既に完了している）
+            self.current_start, fut = self.next_file
+            self.next_file = None
+            self.current_file = fut.result()
+        else:
+            self.current_start = start or dt.datetime.now()
+            self.current_file = self._create_file(self.current_start)
         self.samples_written_this_segment = 0
 
+        if self.preopen:
+            next_start = self.current_start + dt.timedelta(seconds=self.segment_sec)
+            self.next_file = (next_start, self.bg.submit(self._create_file, next_start))
+
     def _close_current_file(self):
         if self.current_file is None:
             return
 
-        wav_path = self.current_file.name
-        self.current_file.flush()
-        self.current_file.close()
+        f = self.current_file
+        self.current_file = None
+        # ゲートモードのメタデータは切り替え前の状態から作る
+        meta = self._segment_metadata() if self.gate is not None else None
+        if self.bg is not None:
+            self.bg.submit(self._finalize_file, f, meta)
+        else:
+            self._finalize_file(f, meta)
+
+    def _finalize_file(self, f, meta: dict | None):
+        f.flush()
+        f.close()
+        wav_path = f.name[:-len(retention.PART_SUFFIX)]
+        os.replace(f.name, wav_path)
+
+        if meta is not None:
+            with open(os.path.splitext(wav_path)[0] + ".json", "w", encoding="utf-8") as jf:
+                json.dump(meta, jf, ensure_ascii=False, indent=2)
 
         if self.do_mp3:
             mp3_path = os.path.splitext(wav_path)[0] + ".mp3"
             # 非同期エンコード
-            self.encode_q.put((wav_path, mp3_path))
+            self.encoder.submit(wav_path, mp3_path, self.keep_wav, self.vbr_quality)
             print(f"[INFO] Saved MP3: {mp3_path}")
         else:
             print(f"[INFO] Saved WAV: {wav_path}")
 
-        self.current_file = None
+    def _segment_metadata(self) -> dict:
+        """発話区間（ファイル内位置との対応）と無音ギャップ。サイドカー JSON に記録する"""
+        gaps = []
+        pos = 0
+        for r in self.regions:
+            if r["start"] > pos:
+                gaps.append({"start": pos, "end": r["start"]})
+            pos = max(pos, r["start"] + r["samples"])
+        if self.timeline_samples > pos:
+            gaps.append({"start": pos, "end": self.timeline_samples})
 
-    def _encode_worker(self):
-        while True:
-            try:
-                wav_path, mp3_path = self.encode_q.get()
-                # すでにSTOP_FLAGでも、キューに残った分は処理して良い
-                encode_mp3_with_ffmpeg(wav_path, mp3_path, keep_wav=self.keep_wav, vbr_quality=self.vbr_quality)
-            except Exception as e:
-                print(f"[WARN] エンコードスレッドで例外: {e}", file=sys.stderr)
-            finally:
-                self.encode_q.task_done()
+        return {
+            "segment_start": self.current_start.isoformat(),
+            "samplerate": self.samplerate,
+            "timeline_samples": self.timeline_samples,
+            "stored_samples": self.samples_written_this_segment,
+            # start/end はセグメント開始からのサンプル位置。start が負ならプリロールが前セグメントにまたがる
+            "regions": self.regions,
+            "gaps": gaps,
+        }
+
+    def _write_active(self, frames: np.ndarray):
+        if self.current_file is None:
+            # 発話が無いセグメントはファイルを作らない
+            self._open_new_file(self.current_start)
+        self.current_file.write(frames)
+        self.regions[-1]["samples"] += len(frames)
+        self.samples_written_this_segment += len(frames)
+        self.total_stored_samples += len(frames)
+
+    def _begin_region(self, start: int):
+        self.regions.append({"start": start, "file_offset": self.samples_written_this_segment, "samples": 0})
+
+    def _begin_segment(self):
+        self.current_start = dt.datetime.now()
+        self.timeline_samples = 0
+        self.regions = []
+        self.samples_written_this_segment = 0
+
+    def _write_gated(self, frames: np.ndarray):
+        if self.current_start is None:
+            self._begin_segment()
+
+        was_collecting = self.gate.collecting
+        collecting = self.gate.process(frames)
+
+        if collecting or was_collecting:
+            if not was_collecting:
+                # 発話開始: 保持していたプリロールから書き出す
+                self._begin_region(self.timeline_samples - self.preroll_samples)
+                while self.preroll:
+                    self._write_active(self.preroll.popleft())
+                self.preroll_samples = 0
+            # ハングタイム終了ブロックまでは区間に含める
+            self._write_active(frames)
+        else:
+            self.preroll.append(frames)
+            self.preroll_samples += len(frames)
+            while self.preroll and self.preroll_samples - len(self.preroll[0]) >= self.gate.pre_roll_samples:
+                self.preroll_samples -= len(self.preroll.popleft())
+
+        self.timeline_samples += len(frames)
+        self.total_timeline_samples += len(frames)
+
+        if self.segment_samples and self.timeline_samples >= self.segment_samples:
+            # セグメント切り替え（発話中なら次セグメントの先頭から区間を継続）
+            self._close_current_file()
+            self._begin_segment()
+            if collecting:
+                self._begin_region(0)
 
     def write(self, frames: np.ndarray):
+        if self.gate is not None:
+            self._write_gated(frames)
+            return
+
+        if self.preopen:
+            self._write_exact(frames)
+            return
+
         if self.current_file is None:
             self._open_new_file()
 
@@ -124,10 +421,315 @@ class RotatingWavWriter:
             # セグメント切り替え
             self._open_new_file()
 
+    def _write_exact(self, frames: np.ndarray):
+        """セグメント境界でブロックを分割し、各ファイルを正確に segment_samples にする"""
+        while len(frames):
+            if self.current_file is None:
+                self._open_new_file()
+            room = self.segment_samples - self.samples_written_this_segment
+            self.current_file.write(frames[:room])
+            self.samples_written_this_segment += min(room, len(frames))
+            frames = frames[room:]
+            if self.samples_written_this_segment >= self.segment_samples:
+                self._open_new_file()
+
     def close(self):
         self._close_current_file()
-        # エンコード完了待ち（必要に応じて）
-        self.encode_q.join()
+        if self.next_file is not None:
+            # 使わなかった事前オープン分を削除
+            _, fut = self.next_file
+            self.next_file = None
+            unused = fut.result()
+            unused.close()
+            os.remove(unused.name)
+        if self.bg is not None:
+            self.bg.shutdown(wait=True)
+        if self.gate is not None and self.total_timeline_samples:
+            ratio = self.total_stored_samples / self.total_timeline_samples
+            print(f"[INFO] ゲート保存率: {ratio:.1%} "
+                  f"({self.total_stored_samples / self.samplerate:.1f}s / "
+                  f"{self.total_timeline_samples / self.samplerate:.1f}s)")
+        # エンコード完了待ち（共有プールの場合は所有者が待つ）
+        if self.owns_encoder:
+            self.encoder.join()
+
+class LatencyHistogram:
+    """
+    µs 単位の log2 バケットヒストグラム。オーディオコールバック内で使うため処理は整数演算のみ。
+    """
+    BUCKETS = 24  # 最大 2^23 µs ≒ 8.4 秒
+
+    def __init__(self, name: str):
+        self.name = name
+        self.counts = [0] * self.BUCKETS
+        self.n = 0
+        self.max_us = 0
+
+    def add(self, us: int):
+        self.counts[min(us.bit_length(), self.BUCKETS - 1)] += 1
+        self.n += 1
+        if us > self.max_us:
+            self.max_us = us
+
+    def percentile(self, p: float) -> int:
+        """p パーセンタイルが含まれるバケットの上限（µs）"""
+        if not self.n:
+            return 0
+        target = self.n * p / 100
+        acc = 0
+        for i, c in enumerate(self.counts):
+            acc += c
+            if acc >= target:
+                return (1 << i) - 1 if i else 0
+        return self.max_us
+
+    def summary(self) -> str:
+        return (f"{self.name}: n={self.n} p50<={self.percentile(50)}us p99<={self.percentile(99)}us "
+                f"p99.9<={self.percentile(99.9)}us max={self.max_us}us")
+
+    def table(self) -> str:
+        lines = []
+        for i, c in enumerate(self.counts):
+            if c:
+                lines.append(f"  <= {(1 << i) - 1 if i else 0:>8}us: {c}")
+        return "\n".join(lines)
+
+class CallbackProfiler:
+    """
+    コールバック毎の処理時間と到着間隔のずれ（ジッタ）を記録する。
+    """
+    def __init__(self, samplerate: int, blocksize: int):
+        self.expected_us = blocksize * 1_000_000 // samplerate
+        self.duration = LatencyHistogram("callback duration")
+        self.jitter = LatencyHistogram("arrival jitter")
+        self.last_ns = 0
+
+    def record(self, t0_ns: int):
+        self.duration.add((time.perf_counter_ns() - t0_ns) // 1000)
+        if self.last_ns:
+            self.jitter.add(abs((t0_ns - self.last_ns) // 1000 - self.expected_us))
+        self.last_ns = t0_ns
+
+class GCController:
+    """
+    リアルタイムモードの GC 制御。
+    起動時に生存オブジェクトを gc.freeze で永続世代へ移し、自動 GC を止めて
+    メインスレッドから決まった間隔で若い世代のみを回収する。
+    若い世代の回収では第 2 世代に移った循環参照が残り続けるため、full_interval_s 毎に
+    同じタイミングで全世代を回収する（freeze 済みのオブジェクトは対象外なので短く済む）。GC 停止時間も記録する。
+    """
+    def __init__(self, interval_s: float, full_interval_s: float = 300.0):
+        self.interval_s = interval_s
+        self.full_interval_s = full_interval_s
+        self.pauses = LatencyHistogram("gc pause")
+        self._t0 = 0
+        self._last = 0.0
+        self._last_full = 0.0
+
+    def _on_gc(self, phase, info):
+        if phase == "start":
+            self._t0 = time.perf_counter_ns()
+        elif self._t0:
+            self.pauses.add((time.perf_counter_ns() - self._t0) // 1000)
+
+    def start(self):
+        gc.collect()
+        gc.freeze()
+        gc.disable()
+        gc.callbacks.append(self._on_gc)
+        self._last = self._last_full = time.monotonic()
+
+    def tick(self):
+        if self.interval_s > 0 and time.monotonic() - self._last >= self.interval_s:
+            self._last = time.monotonic()
+            if self.full_interval_s > 0 and self._last - self._last_full >= self.full_interval_s:
+                self._last_full = self._last
+                gc.collect()
+            else:
+                gc.collect(1)
+
+    def stop(self):
+        gc.callbacks.remove(self._on_gc)
+        gc.enable()
+        gc.unfreeze()
+
+class DeviceCapture:
+    """
+    1 デバイス分の録音状態（ライター・入力ストリーム・取りこぼし統計）。
+    """
+    def __init__(self, device: int | str | None, label: str, writer: RotatingWavWriter):
+        self.device = device
+        self.label = label
+        self.writer = writer
+        self.stream = None  # type: sd.InputStream | None
+        self.blocks = 0
+        self.dropped = 0
+        self.xruns = 0
+        self.profiler = None  # type: CallbackProfiler | None
+
+    def stats_line(self) -> str:
+        return f"{self.label}: blocks={self.blocks} dropped={self.dropped} xruns={self.xruns}"
+
+class WriterPool:
+    """
+    複数デバイスのフレーム書き込みを少数のスレッドで処理するプール。
+    デバイスは固定のスレッドへ割り当てるので、デバイス毎の書き込み順序は保たれる。
+    キューはスレッド毎に 1 本なので、バッファ量はデバイス数ではなくスレッド数に比例する。
+    """
+    def __init__(self, workers: int, queue_size: int = 64, cpus: set[int] | None = None):
+        self.cpus = cpus
+        self.queues: list[queue.Queue] = [queue.Queue(maxsize=queue_size) for _ in range(max(1, workers))]
+        self.threads = [threading.Thread(target=self._worker, args=(q,), daemon=True) for q in self.queues]
+        for t in self.threads:
+            t.start()
+
+    def queue_for(self, index: int) -> queue.Queue:
+        return self.queues[index % len(self.queues)]
+
+    def _worker(self, q: queue.Queue):
+        pin_current_thread(self.cpus)
+        while True:
+            item = q.get()
+            try:
+                if item is None:
+                    return
+                cap, frames = item
+                cap.writer.write(frames)
+            except Exception as e:
+                print(f"[WARN] 書き込みスレッドで例外: {e}", file=sys.stderr)
+            finally:
+                q.task_done()
+
+    def close(self):
+        # 残りのフレームを書き切ってからスレッドを止める
+        for q in self.queues:
+            q.put(None)
+        for t in self.threads:
+            t.join()
+
+def parse_device(value: str | None) -> int | str | None:
+    """数字ならデバイス番号、それ以外はデバイス名として扱う"""
+    if value is None:
+        return None
+    return int(value) if value.isdigit() else value
+
+def list_input_devices() -> list[int]:
+    return [i for i, d in enumerate(sd.query_devices()) if d["max_input_channels"] > 0]
+
+def device_label(device: int | str | None) -> str:
+    if device is None:
+        return "default"
+    name = sd.query_devices(device, "input")["name"]
+    safe = "".join(ch if ch.isalnum() or ch in "-_" else "_" for ch in name)
+    return f"{device}_{safe}" if isinstance(device, int) else safe
+
+def unique_label(label: str, device: int | str | None, used: set[str]) -> str:
+    """同名のデバイス（や同じデバイスの重複指定）が同じファイルへ書かないよう、衝突したらデバイス番号を付ける"""
+    if label not in used:
+        return label
+    base = f"{label}_{sd.query_devices(device, 'input')['index']}"
+    candidate, n = base, 2
+    while candidate in used:
+        candidate, n = f"{base}_{n}", n + 1
+    return candidate
+
+def close_captures(captures: list[DeviceCapture]):
+    """録音開始前に失敗したとき、用意済みの入力ストリームとライターを閉じる"""
+    for cap in captures:
+        if cap.stream is not None:
+            cap.stream.close()
+        cap.writer.close()
+
+def build_captures(args, encoder) -> list[DeviceCapture]:
+    """
+    引数で指定されたデバイス毎にライター（とゲート・プロファイラ）を用意する。入力ストリームは各エンジンが開く。
+    途中のデバイスで失敗した場合は、それまでに用意したライターを閉じてから例外を送出する。
+    """
+    devices = list_input_devices() if args.all_devices else [parse_device(d) for d in (args.device or [None])]
+    if not devices:
+        print("[ERROR] 入力デバイスが見つかりません。", file=sys.stderr)
+        sys.exit(1)
+
+    captures: list[DeviceCapture] = []
+    try:
+        for device in devices:
+            captures.append(build_capture(args, encoder, device, len(devices),
+                                          {cap.label for cap in captures}))
+    except BaseException:
+        close_captures(captures)
+        raise
+    return captures
+
+def build_capture(args, encoder, device: int | str | None, n_devices: int, used: set[str]) -> DeviceCapture:
+    """1 デバイス分のライター（とゲート・プロファイラ）を用意する。used は使用済みのラベル"""
+    label = unique_label(device_label(device), device, used)
+    channels = args.channels
+    if args.all_devices:
+        channels = min(channels, sd.query_devices(device, "input")["max_input_channels"])
+    # 複数デバイス時はデバイス毎のサブディレクトリへ保存
+    outdir = os.path.join(args.outdir, label) if n_devices > 1 else args.outdir
+    ensure_dir(outdir)
+
+    gate = None
+    if args.gate:
+        try:
+            gate = SpeechGate(
+                samplerate=args.samplerate,
+                vad_mode=args.gate_vad_mode,
+                start_k=args.gate_start_k,
+                start_n=args.gate_start_n,
+                pre_roll_s=args.gate_pre_roll,
+                post_roll_s=args.gate_post_roll,
+            )
+        except RuntimeError as e:
+            print(f"[ERROR] {e}", file=sys.stderr)
+            sys.exit(1)
+
+    writer = RotatingWavWriter(
+        outdir=outdir,
+        samplerate=args.samplerate,
+        channels=channels,
+        segment_sec=args.segment,
+        do_mp3=args.mp3,
+        keep_wav=args.keep_wav,
+        vbr_quality=args.vbrq,
+        gate=gate,
+        encoder=encoder,
+        gapless=args.gapless,
+    )
+    cap = DeviceCapture(device, label, writer)
+    if args.realtime:
+        cap.profiler = CallbackProfiler(args.samplerate, args.blocksize)
+    return cap
+
+def open_input_stream(cap: DeviceCapture, args, callback) -> sd.InputStream:
+    return sd.InputStream(
+        device=cap.device,
+        channels=cap.writer.channels,
+        samplerate=args.samplerate,
+        blocksize=args.blocksize,
+        latency=args.latency,
+        dtype="float32",
+        callback=callback,
+    )
+
+def start_retention(args, captures: list[DeviceCapture]) -> retention.RetentionManager | None:
+    """保持管理の引数があれば、全デバイスの保存先を対象にバックグラウンドで開始"""
+    manager = retention.manager_from_args(sorted({cap.writer.outdir for cap in captures}), args)
+    if manager is not None:
+        manager.start()
+    return manager
+
+def print_report(captures: list[DeviceCapture], gc_ctl: GCController | None):
+    for cap in captures:
+        print(f"[INFO] {cap.stats_line()}")
+        if cap.profiler is not None:
+            for hist in (cap.profiler.duration, cap.profiler.jitter):
+                print(f"[INFO]   {hist.summary()}")
+                print(hist.table())
+    if gc_ctl is not None:
+        print(f"[INFO] {gc_ctl.pauses.summary()}")
+    print("[INFO] 正常終了")
 
 def signal_handler(sig, frame):
     global STOP_FLAG
@@ -142,62 +744,108 @@ def main():
     parser.add_argument("--segment", "-s", type=int, default=0, help="ファイル分割の間隔（秒）。0 または未指定で1ファイル")
     parser.add_argument("--mp3", action="store_true", help="各セグメントを ffmpeg で MP3 へ変換（WAVは既定で削除）")
     parser.add_argument("--keep-wav", action="store_true", help="--mp3 指定時も WAV を残す")
-    parser.add_argument("--device", type=str, default=None, help="録音デバイス名/番号（未指定で既定デバイス）")
+    parser.add_argument("--device", type=str, action="append", default=None,
+                        help="録音デバイス名/番号（未指定で既定デバイス）。複数回指定で同時録音")
+    parser.add_argument("--all-devices", action="store_true", help="すべての入力デバイスを同時録音")
+    parser.add_argument("--writer-threads", type=int, default=2, help="書き込みスレッド数（全デバイス共有, 既定: 2）")
+    parser.add_argument("--encoder-threads", type=int, default=1, help="MP3 エンコードスレッド数（全デバイス共有, 既定: 1）")
+    parser.add_argument("--stats-interval", type=float, default=0, help="デバイス毎の取りこぼし統計を表示する間隔（秒）。0 で終了時のみ")
     parser.add_argument("--blocksize", type=int, default=2048, help="1回に処理するフレーム数（既定: 2048）")
     parser.add_argument("--latency", type=str, default="low", help="低遅延プロファイル: 'low' 推奨")
     parser.add_argument("--vbrq", type=int, default=2, help="MP3 VBR 品質（0=最高〜9=低, 既定:2）")
+    parser.add_argument("--gapless", action="store_true",
+                        help="次のセグメントファイルを事前に開いて領域確保し、切り替えをサンプル単位で行う（--segment 指定時）")
+    parser.add_argument("--engine", choices=["thread", "asyncio"], default="thread",
+                        help="録音エンジン: thread（既定）または asyncio（async_engine.py）")
+    parser.add_argument("--realtime", action="store_true",
+                        help="リアルタイムモード（GC 制御・コールバック内ログ抑止・コールバック時間ヒストグラム）")
+    parser.add_argument("--gc-interval", type=float, default=5.0, help="リアルタイムモードで GC を実行する間隔（秒, 既定: 5）")
+    parser.add_argument("--gc-full-interval", type=float, default=300.0,
+                        help="リアルタイムモードで全世代の GC を行う間隔（秒, 既定: 300。0 で若い世代のみ）")
+    parser.add_argument("--io-cpus", type=str, default=None, help="書き込みスレッドを固定する CPU（例: 2,3 または 2-3, Linux のみ）")
+    parser.add_argument("--encoder-cpus", type=str, default=None, help="エンコードスレッドと ffmpeg を固定する CPU（Linux のみ）")
+    retention.add_retention_arguments(parser)
+    parser.add_argument("--gate", action="store_true", help="発話区間のみ保存（webrtcvad が必要）")
+    parser.add_argument("--gate-vad-mode", type=int, default=2, help="VAD の積極性 0〜3（既定: 2）")
+    parser.add_argument("--gate-start-k", type=int, default=20, help="直近 N フレーム中 K フレームが発話なら開始（既定: 20）")
+    parser.add_argument("--gate-start-n", type=int, default=30, help="開始判定に使うフレーム数 N（既定: 30）")
+    parser.add_argument("--gate-pre-roll", type=float, default=2.0, help="発話検出前に含める秒数（既定: 2.0）")
+    parser.add_argument("--gate-post-roll", type=float, default=2.0, help="発話終了後に含める秒数（既定: 2.0）")
     args = parser.parse_args()
 
     ensure_dir(args.outdir)
 
+    if args.engine == "asyncio":
+        import async_engine
+        async_engine.run(args)
+        return
+
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGTERM, signal_handler)
 
-    writer = RotatingWavWriter(
-        outdir=args.outdir,
-        samplerate=args.samplerate,
-        channels=args.channels,
-        segment_sec=args.segment,
-        do_mp3=args.mp3,
-        keep_wav=args.keep_wav,
-        vbr_quality=args.vbrq,
-    )
+    # エンコーダーと書き込みスレッドは全デバイスで共有する
+    encoder = EncoderPool(workers=args.encoder_threads, cpus=parse_cpus(args.encoder_cpus))
+    captures = build_captures(args, encoder)
+    writer_pool = WriterPool(workers=min(len(captures), args.writer_threads), cpus=parse_cpus(args.io_cpus))
+
+    try:
+        for idx, cap in enumerate(captures):
+            q_frames = writer_pool.queue_for(idx)
 
-    q_frames: queue.Queue[np.ndarray] = queue.Queue(maxsize=64)
+            def audio_callback(indata, frames, t, status, cap=cap, q_frames=q_frames, quiet=args.realtime):
+                t0 = time.perf_counter_ns()
+                if status:
+                    # xruns など（リアルタイムモードではコールバック内で I/O しない）
+                    cap.xruns += 1
+                    if not quiet:
+                        print(f"[WARN] {cap.label}: {status}", file=sys.stderr)
+                # float32(-1..1) を 16bit に揃える必要は soundfile 側で subtype 指定済みなので不要
+                try:
+                    q_frames.put_nowait((cap, indata.copy()))
+                    cap.blocks += 1
+                except queue.Full:
+                    # 取りこぼし防止。件数のみ記録。
+                    cap.dropped += 1
+                if cap.profiler is not None:
+                    cap.profiler.record(t0)
 
-    def audio_callback(indata, frames, time, status):
-        if status:
-            # xruns など
-            print(f"[WARN] {status}", file=sys.stderr)
-        # float32(-1..1) を 16bit に揃える必要は soundfile 側で subtype 指定済みなので不要
-        try:
-            q_frames.put_nowait(indata.copy())
-        except queue.Full:
-            # 取りこぼし防止。最小限のログ。
-            pass
-
-    stream = sd.InputStream(
-        device=args.device,
-        channels=args.channels,
-        samplerate=args.samplerate,
-        blocksize=args.blocksize,
-        latency=args.latency,
-        dtype="float32",
-        callback=audio_callback,
-    )
+            cap.stream = open_input_stream(cap, args, audio_callback)
+    except BaseException:
+        # N 台目のストリームを開けなかった場合も、開いたストリームと書き込み中のファイルを閉じる
+        writer_pool.close()
+        close_captures(captures)
+        encoder.join()
+        raise
 
-    print("[INFO] 録音開始。終了するには Ctrl+C")
+    retention_mgr = start_retention(args, captures)
+    gc_ctl = GCController(args.gc_interval, args.gc_full_interval) if args.realtime else None
+    if gc_ctl is not None:
+        gc_ctl.start()
+
+    print(f"[INFO] 録音開始（{len(captures)} デバイス）。終了するには Ctrl+C")
     try:
-        with stream:
+        with contextlib.ExitStack() as stack:
+            for cap in captures:
+                stack.enter_context(cap.stream)
+            last_report = time.monotonic()
             while not STOP_FLAG:
-                try:
-                    frames = q_frames.get(timeout=0.5)
-                    writer.write(frames)
-                except queue.Empty:
-                    continue
+                time.sleep(0.5)
+                if gc_ctl is not None:
+                    gc_ctl.tick()
+                if args.stats_interval > 0 and time.monotonic() - last_report >= args.stats_interval:
+                    last_report = time.monotonic()
+                    for cap in captures:
+                        print(f"[STAT] {cap.stats_line()}")
     finally:
-        writer.close()
-        print("[INFO] 正常終了")
+        writer_pool.close()
+        for cap in captures:
+            cap.writer.close()
+        encoder.join()
+        if retention_mgr is not None:
+            retention_mgr.stop()
+        if gc_ctl is not None:
+            gc_ctl.stop()
+        print_report(captures, gc_ctl)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,374 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+録音ディレクトリの保持期間・容量管理とコンパクション
+- 容量 / 経過日数の上限を超えた古いファイルを削除
+- 古い小さなセグメント（yyyyMMddHHmmss.wav / .mp3）を日毎のファイル yyyyMMdd.day.wav / .mp3 に連結し、
+  （WAV の日ファイルは 4 GiB を超えられるよう RF64 形式で書く）
+  各セグメントの位置を yyyyMMdd.day.wav.json / .mp3.json（オフセットインデックス）に記録
+- 必要に応じて連結時に低ビットレートの MP3 へ変換
+- I/O はトークンバケットで帯域制限し、録音中の書き込みを妨げない
+recorder.py から --max-bytes などを指定してバックグラウンド実行するか、単体で実行する
+（VADAudioRecorder の recordings ディレクトリにも使用可能）。
+"""
+
+import argparse
+import datetime as dt
+import json
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+
+import soundfile as sf
+
+SEGMENT_RE = re.compile(r"^(\d{14})\.(wav|mp3)$")  # 書き込み中の .part 付きファイルは一致しない
+DAY_RE = re.compile(r"^(\d{8})\.day\.(wav|mp3)$")
+CHUNK_BYTES = 1 << 20
+CHUNK_FRAMES = 1 << 16
+RIFF_LIMIT = 1 << 32  # RIFF WAV のサイズ上限（4 GiB）
+PART_SUFFIX = ".part"  # recorder.py が閉じるまでファイル名に付ける接尾辞
+
+
+def parse_size(value: str | None) -> int | None:
+    """'500M' / '20G' 形式のサイズをバイト数に変換"""
+    if not value:
+        return None
+    units = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30, "T": 1 << 40}
+    value = value.strip().upper().rstrip("B")
+    if value and value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
+
+
+class RateLimiter:
+    """
+    トークンバケットによる I/O 帯域制限。待機は stop イベントで中断できる。
+    """
+    def __init__(self, bytes_per_sec: int | None, stop: threading.Event):
+        self.rate = bytes_per_sec
+        self.stop = stop
+        self.allowance = float(bytes_per_sec or 0)
+        self.last = time.monotonic()
+
+    def consume(self, n: int):
+        if not self.rate:
+            return
+        now = time.monotonic()
+        self.allowance = min(self.rate, self.allowance + (now - self.last) * self.rate)
+        self.last = now
+        self.allowance -= n
+        if self.allowance < 0:
+            self.stop.wait(-self.allowance / self.rate)
+
+
+class RetentionManager:
+    """
+    録音ディレクトリを定期的に整理するバックグラウンドマネージャ。
+    録音中・事前オープン中のファイルは recorder.py が .part 付きの名前で書くため対象にならない。
+    加えて、直近 protect_s 秒以内に更新されたファイル（エンコード中の MP3 など）にも触れない。
+    """
+    def __init__(self, dirs: list[str], max_bytes: int | None = None, max_age_days: float | None = None,
+                 compact_after_s: float | None = None, compact_max_bytes: int = 64 << 20,
+                 transcode_bitrate: str | None = None, io_rate: int | None = None,
+                 interval_s: float = 600, protect_s: float = 300):
+        self.dirs = dirs
+        self.max_bytes = max_bytes
+        self.max_age_days = max_age_days
+        self.compact_after_s = compact_after_s
+        self.compact_max_bytes = compact_max_bytes
+        self.transcode_bitrate = transcode_bitrate
+        self.interval_s = interval_s
+        self.protect_s = protect_s
+
+        self.stop_event = threading.Event()
+        self.limiter = RateLimiter(io_rate, self.stop_event)
+        self.thread = None  # type: threading.Thread | None
+
+    # ---- バックグラウンド実行 ----
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run_forever, daemon=True, name="retention")
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def run_forever(self):
+        while not self.stop_event.is_set():
+            self.run_once()
+            self.stop_event.wait(self.interval_s)
+
+    def run_once(self):
+        for d in self.dirs:
+            try:
+                if self.compact_after_s is not None:
+                    self.compact(d)
+                self.enforce_quota(d)
+            except Exception as e:
+                print(f"[WARN] 保持管理で例外 ({d}): {e}", file=sys.stderr)
+
+    # ---- コンパクション ----
+
+    def _compactable(self, d: str) -> list[tuple[str, str, str]]:
+        """(セグメント名, 日付, 拡張子) を古い順に返す"""
+        now = time.time()
+        out = []
+        for name in sorted(os.listdir(d)):
+            m = SEGMENT_RE.match(name)
+            if not m:
+                continue
+            st = os.stat(os.path.join(d, name))
+            if now - st.st_mtime < max(self.compact_after_s, self.protect_s):
+                continue
+            if st.st_size > self.compact_max_bytes:
+                continue
+            out.append((name, m.group(1)[:8], m.group(2)))
+        return out
+
+    def compact(self, d: str):
+        refused = set()
+        for name, day, ext in self._compactable(d):
+            if self.stop_event.is_set():
+                return
+            day_ext = "mp3" if self.transcode_bitrate else ext
+            day_path = os.path.join(d, f"{day}.day.{day_ext}")
+            index_path = day_path + ".json"
+            if day_path in refused:
+                continue
+            if os.path.exists(day_path) != os.path.exists(index_path):
+                # インデックスがないと確定済みの長さが分からず、追記時の切り詰めで日ファイルを壊すため連結しない
+                refused.add(day_path)
+                missing = index_path if os.path.exists(day_path) else day_path
+                print(f"[WARN] {os.path.basename(missing)} がないため {day} のコンパクションをスキップ", file=sys.stderr)
+                continue
+            index = self._load_index(index_path, day_ext)
+
+            seg_path = os.path.join(d, name)
+            stem = os.path.splitext(name)[0]
+            if self.transcode_bitrate and ext == "wav" and os.path.exists(os.path.join(d, stem + ".mp3")):
+                # --keep-wav の WAV は MP3 側を変換するので重複させない
+                continue
+            if any(e["name"] == name for e in index["segments"]):
+                # 前回インデックス更新後に削除できなかったもの
+                self._remove_segment(d, stem, seg_path)
+                continue
+
+            try:
+                if day_ext == "wav":
+                    entry = self._append_wav(day_path, seg_path, index)
+                else:
+                    entry = self._append_mp3(day_path, seg_path, index)
+            except (RuntimeError, sf.LibsndfileError, subprocess.CalledProcessError, FileNotFoundError) as e:
+                print(f"[WARN] コンパクションをスキップ: {seg_path}: {e}", file=sys.stderr)
+                continue
+            if entry is None:
+                print(f"[WARN] 日ファイルと形式が異なるか RIFF の 4 GiB 上限を超えるため連結しません: {seg_path}", file=sys.stderr)
+                continue
+
+            entry["name"] = name
+            entry["start"] = dt.datetime.strptime(stem, "%Y%m%d%H%M%S").isoformat()
+            sidecar = os.path.join(d, stem + ".json")
+            if os.path.exists(sidecar):
+                with open(sidecar, encoding="utf-8") as f:
+                    entry["meta"] = json.load(f)
+            index["segments"].append(entry)
+            self._save_index(index_path, index)
+            self._remove_segment(d, stem, seg_path)
+            print(f"[INFO] コンパクション: {name} → {os.path.basename(day_path)}")
+
+    @staticmethod
+    def _load_index(path: str, fmt: str) -> dict:
+        """インデックスを読み込む。存在しなければ新しい日ファイル用の空インデックス"""
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        return {"format": fmt, "committed": 0, "segments": []}
+
+    @staticmethod
+    def _save_index(path: str, index: dict):
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(index, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, path)
+
+    @staticmethod
+    def _remove_segment(d: str, stem: str, seg_path: str):
+        os.remove(seg_path)
+        sidecar = os.path.join(d, stem + ".json")
+        # 同名の WAV/MP3 が残っている場合はサイドカーを残す
+        if os.path.exists(sidecar) and not any(
+                os.path.exists(os.path.join(d, f"{stem}.{e}")) for e in ("wav", "mp3")):
+            os.remove(sidecar)
+
+    def _append_wav(self, day_path: str, seg_path: str, index: dict) -> dict | None:
+        """セグメントの PCM を日ファイル末尾に追記。offset / frames はサンプル（フレーム）単位"""
+        with sf.SoundFile(seg_path) as src:
+            if os.path.exists(day_path):
+                dst = sf.SoundFile(day_path, mode="r+")
+                if (dst.samplerate, dst.channels, dst.subtype) != (src.samplerate, src.channels, src.subtype):
+                    dst.close()
+                    return None
+                # RF64 以前に作った RIFF の日ファイルは 4 GiB を超えると壊れるため追記しない
+                if dst.format != "RF64" and os.path.getsize(day_path) + os.path.getsize(seg_path) >= RIFF_LIMIT:
+                    dst.close()
+                    return None
+                # 前回中断した追記分を捨てる
+                if dst.frames != index["committed"]:
+                    dst.truncate(index["committed"])
+                dst.seek(0, sf.SEEK_END)
+            else:
+                dst = sf.SoundFile(day_path, mode="w", samplerate=src.samplerate,
+                                   channels=src.channels, subtype=src.subtype, format="RF64")
+                index.update(samplerate=src.samplerate, channels=src.channels, subtype=src.subtype)
+            dtype = "int16" if src.subtype == "PCM_16" else "float32"
+            frame_bytes = src.channels * (2 if dtype == "int16" else 4)
+            offset = index["committed"]
+            with dst:
+                while True:
+                    block = src.read(CHUNK_FRAMES, dtype=dtype)
+                    if not len(block):
+                        break
+                    # 読み込み + 書き込み分を帯域制限に計上
+                    self.limiter.consume(2 * len(block) * frame_bytes)
+                    dst.write(block)
+            frames = src.frames
+        index["committed"] = offset + frames
+        return {"offset": offset, "frames": frames}
+
+    def _append_mp3(self, day_path: str, seg_path: str, index: dict) -> dict:
+        """MP3 のバイト列を日ファイル末尾に連結。offset / bytes はバイト単位"""
+        src_path = seg_path
+        tmp_path = None
+        if self.transcode_bitrate:
+            tmp_path = seg_path + ".transcode.mp3"
+            self.limiter.consume(os.path.getsize(seg_path))
+            subprocess.run(
+                ["ffmpeg", "-y", "-hide_banner", "-loglevel", "error", "-i", seg_path,
+                 "-codec:a", "libmp3lame", "-b:a", self.transcode_bitrate, tmp_path],
+                check=True, preexec_fn=lambda: os.nice(19) if hasattr(os, "nice") else None,
+            )
+            src_path = tmp_path
+
+        try:
+            mode = "r+b" if os.path.exists(day_path) else "wb"
+            offset = index["committed"]
+            with open(src_path, "rb") as src, open(day_path, mode) as dst:
+                dst.truncate(offset)
+                dst.seek(offset)
+                while True:
+                    chunk = src.read(CHUNK_BYTES)
+                    if not chunk:
+                        break
+                    self.limiter.consume(2 * len(chunk))
+                    dst.write(chunk)
+                size = dst.tell() - offset
+        finally:
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        index["committed"] = offset + size
+        return {"offset": offset, "bytes": size}
+
+    # ---- 容量・経過日数の上限 ----
+
+    def _entries(self, d: str) -> list[tuple[dt.datetime, list[str], int]]:
+        """(時刻, 関連ファイル群, 合計サイズ) を古い順に返す。保護期間内のものは含めない"""
+        now = time.time()
+        entries = []
+        for name in os.listdir(d):
+            m_seg = SEGMENT_RE.match(name)
+            m_day = DAY_RE.match(name)
+            path = os.path.join(d, name)
+            if m_seg:
+                ts = dt.datetime.strptime(m_seg.group(1), "%Y%m%d%H%M%S")
+                paths = [path]
+                sidecar = os.path.join(d, m_seg.group(1) + ".json")
+                if os.path.exists(sidecar):
+                    paths.append(sidecar)
+            elif m_day:
+                # 日ファイルはその日の終わりを時刻とする
+                ts = dt.datetime.strptime(m_day.group(1), "%Y%m%d") + dt.timedelta(days=1)
+                paths = [path, path + ".json"]
+            else:
+                continue
+            paths = [p for p in paths if os.path.exists(p)]
+            if any(now - os.stat(p).st_mtime < self.protect_s for p in paths):
+                continue
+            entries.append((ts, paths, sum(os.path.getsize(p) for p in paths)))
+        entries.sort(key=lambda e: e[0])
+        return entries
+
+    def _total_bytes(self, d: str) -> int:
+        return sum(os.path.getsize(os.path.join(d, n)) for n in os.listdir(d)
+                   if SEGMENT_RE.match(n) or DAY_RE.match(n) or n.endswith(".json"))
+
+    def enforce_quota(self, d: str):
+        if self.max_bytes is None and self.max_age_days is None:
+            return
+        total = self._total_bytes(d)
+        cutoff = dt.datetime.now() - dt.timedelta(days=self.max_age_days) if self.max_age_days else None
+        for ts, paths, size in self._entries(d):
+            too_old = cutoff is not None and ts < cutoff
+            over = self.max_bytes is not None and total > self.max_bytes
+            if not (too_old or over):
+                break
+            for p in paths:
+                os.remove(p)
+            total -= size
+            print(f"[INFO] 保持上限により削除: {', '.join(os.path.basename(p) for p in paths)}")
+
+
+def add_retention_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--max-bytes", type=str, default=None, help="ディレクトリ毎の容量上限（例: 500M, 20G）")
+    parser.add_argument("--max-age-days", type=float, default=None, help="保持日数の上限")
+    parser.add_argument("--compact-after-hours", type=float, default=None,
+                        help="この時間より古いセグメントを日ファイルへ連結（未指定で連結しない）")
+    parser.add_argument("--compact-max-mb", type=float, default=64, help="連結対象とするセグメントの最大サイズ（MB, 既定: 64）")
+    parser.add_argument("--transcode-bitrate", type=str, default=None, help="連結時に指定ビットレートの MP3 へ変換（例: 64k）")
+    parser.add_argument("--io-rate-mb", type=float, default=None, help="保持管理の I/O 帯域上限（MB/s）")
+    parser.add_argument("--retention-interval", type=float, default=600, help="保持管理の実行間隔（秒, 既定: 600）")
+
+
+def manager_from_args(dirs: list[str], args) -> RetentionManager | None:
+    """保持管理の引数が 1 つも指定されていなければ None"""
+    if args.max_bytes is None and args.max_age_days is None and args.compact_after_hours is None:
+        return None
+    return RetentionManager(
+        dirs,
+        max_bytes=parse_size(args.max_bytes),
+        max_age_days=args.max_age_days,
+        compact_after_s=args.compact_after_hours * 3600 if args.compact_after_hours is not None else None,
+        compact_max_bytes=int(args.compact_max_mb * (1 << 20)),
+        transcode_bitrate=args.transcode_bitrate,
+        io_rate=int(args.io_rate_mb * (1 << 20)) if args.io_rate_mb else None,
+        interval_s=args.retention_interval,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="録音ディレクトリの保持期間・容量管理とコンパクション")
+    parser.add_argument("dirs", nargs="+", help="対象ディレクトリ")
+    parser.add_argument("--once", action="store_true", help="1 回だけ実行して終了")
+    add_retention_arguments(parser)
+    args = parser.parse_args()
+
+    manager = manager_from_args(args.dirs, args)
+    if manager is None:
+        print("[ERROR] --max-bytes / --max-age-days / --compact-after-hours のいずれかを指定してください。", file=sys.stderr)
+        sys.exit(1)
+    if args.once:
+        manager.run_once()
+        return
+    try:
+        manager.run_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
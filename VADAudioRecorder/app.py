@@ -1,4 +1,5 @@
-import collections, datetime, os, subprocess
+import argparse, collections, contextlib, datetime, io, os, subprocess, sys, threading, time
+import numpy as np
 import pyaudio, webrtcvad
 
 # ====== Configuration ======
@@ -15,6 +16,11 @@ MIN_SEG_S   = 1.0            # Minimum recording duration in seconds
 MAX_SEG_S   = 300            # Maximum recording duration in seconds
 OUT_DIR     = "recordings"   # Output directory for recordings
 MP3_BITRATE = "128k"         # MP3 encoding bitrate
+GATE_ENABLED = False         # Default of --energy-gate: skip the VAD for frames the gate rules out (changes segmentation)
+GATE_MARGIN_DB = 6.0         # Frames within this many dB of the noise floor are treated as silence
+GATE_RISE = 0.002            # Per-frame rate at which the noise floor follows louder noise (falls immediately)
+CAPTURE_MODE = "read"        # "read": blocking stream.read, "callback": stream callback into a ring
+RING_FRAMES = 100            # Frames buffered by the callback ring (3 s at 30 ms) before overflowing
 
 # ====== Calculated Constants ======
 FRAME_SAMPLES = SAMPLE_RATE * FRAME_MS // 1000
@@ -23,25 +29,39 @@ PRE_FRAMES  = int(PRE_ROLL_S * 1000 / FRAME_MS)
 HANG_FRAMES = int(POST_ROLL_S * 1000 / FRAME_MS)
 MIN_FRAMES  = int(MIN_SEG_S * 1000 / FRAME_MS)
 MAX_FRAMES  = int(MAX_SEG_S * 1000 / FRAME_MS)
+GATE_RATIO  = 10 ** (GATE_MARGIN_DB / 10)
 
-def get_filepath(timestamp):
+def get_filepath(timestamp, out_dir=OUT_DIR):
     """Generate a filepath from timestamp in YYYYMMDDHHMMSS format"""
     ts = timestamp.strftime("%Y%m%d%H%M%S")
-    path = os.path.join(OUT_DIR, f"{ts}.mp3")
+    path = os.path.join(out_dir, f"{ts}.mp3")
     return path
+
+def mp3_command(path):
+    """ffmpeg command that encodes raw PCM from stdin to an MP3 file"""
+    return ["ffmpeg", "-f", "s16le", "-ar", str(SAMPLE_RATE), "-ac", str(CHANNELS),
+            "-i", "pipe:0", "-acodec", "libmp3lame", "-b:a", MP3_BITRATE, "-y", path]
     
+def warn_ffmpeg_missing(path):
+    """Warning for a segment that could not be encoded because ffmpeg is not installed"""
+    print(f"[WARN] ffmpeg not found, {path} not saved. Install it (e.g. brew install ffmpeg).", file=sys.stderr)
+
 def save_as_mp3(path, raw_pcm: bytes):
-    """Convert raw PCM data to MP3 using ffmpeg and save to file"""
-    cmd = ["ffmpeg", "-f", "s16le", "-ar", str(SAMPLE_RATE), "-ac", str(CHANNELS),
-           "-i", "pipe:0", "-acodec", "libmp3lame", "-b:a", MP3_BITRATE, "-y", path]
-    proc = subprocess.Popen(cmd, stdin=subprocess.PIPE,
-                          stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    """Convert raw PCM data to MP3 using ffmpeg and save to file (returns False if ffmpeg is missing)"""
+    cmd = mp3_command(path)
+    try:
+        proc = subprocess.Popen(cmd, stdin=subprocess.PIPE,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    except FileNotFoundError:
+        warn_ffmpeg_missing(path)
+        return False
     try:
         proc.stdin.write(raw_pcm)
         proc.stdin.close()
         proc.wait()
     except BrokenPipeError:
         pass
+    return True
 
 def reset_state():
     """Initialize or reset the recording state"""
@@ -54,14 +74,86 @@ def reset_state():
         'recent_flags': collections.deque(maxlen=START_N)   # Recent voice activity flags
     }
 
-def initialize_audio_stream():
-    """Initialize PyAudio stream for audio input"""
+def reset_gate():
+    """Initialize the per-stream energy gate (kept across segments, unlike the recording state)"""
+    return {
+        'floor': None,        # Noise floor (mean square), learned from non-speech frames only
+        'frames': 0,          # Frames seen by the gate
+        'skipped': 0,         # Frames ruled out without calling the VAD
+    }
+
+def frame_energy(data):
+    """Mean square of a 16-bit PCM frame"""
+    x = np.frombuffer(data, dtype=np.int16).astype(np.float32)
+    return float(np.dot(x, x)) / len(x)
+
+def update_noise_floor(gate, energy):
+    """Track the floor: drop to quieter frames at once, follow louder noise slowly"""
+    if gate['floor'] is None or energy < gate['floor']:
+        gate['floor'] = energy
+    else:
+        gate['floor'] += GATE_RISE * (energy - gate['floor'])
+
+def gated_is_speech(data, vad, gate):
+    """Cheap energy check first; consult the VAD only when speech can't be ruled out"""
+    gate['frames'] += 1
+    energy = frame_energy(data)
+    if energy < 1.0:
+        gate['skipped'] += 1  # Digital silence (RMS below 1 LSB)
+        return False
+    if gate['floor'] is not None and energy <= gate['floor'] * GATE_RATIO:
+        gate['skipped'] += 1
+        update_noise_floor(gate, energy)
+        return False
+    is_voiced = vad.is_speech(data, SAMPLE_RATE)
+    if not is_voiced:
+        update_noise_floor(gate, energy)
+    return is_voiced
+
+def gate_stats(gate):
+    """One-line summary of the gate's skip rate"""
+    rate = gate['skipped'] / gate['frames'] if gate['frames'] else 0.0
+    return f"gate skipped {gate['skipped']}/{gate['frames']} frames ({rate:.1%})"
+
+class FrameRing:
+    """Bounded frame buffer between the PyAudio callback thread and the processing loop"""
+    def __init__(self, capacity=RING_FRAMES):
+        self.capacity = capacity
+        self.frames = collections.deque()
+        self.cond = threading.Condition()
+        self.overflows = 0        # Frames dropped because the ring was full
+        self.input_overflows = 0  # Callbacks flagged paInputOverflow by PortAudio
+
+    def callback(self, in_data, frame_count, time_info, status):
+        """PyAudio stream callback: never blocks, counts what it has to drop"""
+        with self.cond:
+            if status & pyaudio.paInputOverflow:
+                self.input_overflows += 1
+            if len(self.frames) >= self.capacity:
+                self.overflows += 1
+            else:
+                self.frames.append(in_data)
+                self.cond.notify()
+        return (None, pyaudio.paContinue)
+
+    def drain(self, timeout=0.5):
+        """Wait for at least one frame, then take everything buffered as one batch"""
+        with self.cond:
+            if not self.frames:
+                self.cond.wait(timeout)
+            batch = list(self.frames)
+            self.frames.clear()
+        return batch
+
+def initialize_audio_stream(ring=None):
+    """Initialize PyAudio stream for audio input (callback mode when a FrameRing is given)"""
     p = pyaudio.PyAudio()
     stream = p.open(format=p.get_format_from_width(SAMPLE_WIDTH),
                     channels=CHANNELS,
                     rate=SAMPLE_RATE,
                     input=True,
-                    frames_per_buffer=FRAME_SAMPLES)
+                    frames_per_buffer=FRAME_SAMPLES,
+                    stream_callback=ring.callback if ring is not None else None)
     return p, stream
 
 def start_recording(state):
@@ -80,13 +172,20 @@ def save_recording(state):
     """Save the recorded audio if it meets minimum duration"""
     if len(state['seg_frames']) >= MIN_FRAMES:
         outpath = get_filepath(state['seg_start_ts'])
-        save_as_mp3(outpath, b"".join(state['seg_frames']))
-        print("Recording stopped. Saved:", outpath)
+        if save_as_mp3(outpath, b"".join(state['seg_frames'])):
+            print("Recording stopped. Saved:", outpath)
+
+def process_audio_frame(data, vad, state, save=save_recording, gate=None):
+    """Process a single audio frame and update recording state
 
-def process_audio_frame(data, vad, state):
-    """Process a single audio frame and update recording state"""
+    `save` is called with the state when a segment ends (default: blocking MP3 save).
+    `gate` (from reset_gate) enables the energy gate in front of the VAD.
+    """
     # Check if frame contains speech
-    is_voiced = vad.is_speech(data, SAMPLE_RATE)
+    if gate is not None:
+        is_voiced = gated_is_speech(data, vad, gate)
+    else:
+        is_voiced = vad.is_speech(data, SAMPLE_RATE)
     state['recent_flags'].append(1 if is_voiced else 0)
     
     if not state['collecting']:
@@ -101,36 +200,107 @@ def process_audio_frame(data, vad, state):
         
         # Check if recording should stop
         if should_stop_recording(state):
-            save_recording(state)
+            save(state)
             return True  # Signal to reset state
     return False  # Continue with current state
 
+def process_audio_batch(frames, vad, state, save=save_recording, gate=None):
+    """Run process_audio_frame over a batch of frames and return the (possibly reset) state"""
+    for data in frames:
+        if len(data) != FRAME_BYTES:
+            continue
+        if process_audio_frame(data, vad, state, save=save, gate=gate):
+            state = reset_state()
+    return state
+
+def run_read_loop(stream, vad, state, save=save_recording, gate=None, until=None):
+    """Blocking capture: one stream.read and one state machine call per frame"""
+    frames = 0
+    while until is None or time.monotonic() < until:
+        # Read audio frame
+        data = stream.read(FRAME_SAMPLES, exception_on_overflow=False)
+        if len(data) != FRAME_BYTES:
+            continue
+        frames += 1
+
+        # Process the audio frame
+        if process_audio_frame(data, vad, state, save=save, gate=gate):
+            state = reset_state()
+    return frames
+
+def run_callback_loop(ring, vad, state, save=save_recording, gate=None, until=None):
+    """Callback capture: drain the ring in batches so processing stalls don't delay capture"""
+    frames = 0
+    while until is None or time.monotonic() < until:
+        batch = ring.drain()
+        frames += len(batch)
+        state = process_audio_batch(batch, vad, state, save=save, gate=gate)
+    return frames
+
+def benchmark(seconds, energy_gate=GATE_ENABLED):
+    """Capture with each mode for `seconds` and compare frame rate, CPU per frame and overflows"""
+    discard = lambda state: None  # Measure capture and detection only, nothing is encoded
+    print(f"{'mode':>8}  {'fps':>6}  {'cpu us/frame':>12}  {'overflows':>9}")
+    for mode in ("read", "callback"):
+        ring = FrameRing() if mode == "callback" else None
+        p, stream = initialize_audio_stream(ring)
+        vad = webrtcvad.Vad(VAD_MODE)
+        gate = reset_gate() if energy_gate else None
+        t0, cpu0 = time.monotonic(), time.process_time()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):  # Silence "Recording started."
+                if ring is None:
+                    frames = run_read_loop(stream, vad, reset_state(), discard, gate, until=t0 + seconds)
+                    overflows = "-"
+                else:
+                    frames = run_callback_loop(ring, vad, reset_state(), discard, gate, until=t0 + seconds)
+                    overflows = f"{ring.overflows}/{ring.input_overflows}"
+        finally:
+            stream.stop_stream()
+            stream.close()
+            p.terminate()
+        elapsed, cpu = time.monotonic() - t0, time.process_time() - cpu0
+        print(f"{mode:>8}  {frames / elapsed:6.1f}  {cpu * 1e6 / max(frames, 1):12.1f}  {overflows:>9}")
+
 def main():
+    parser = argparse.ArgumentParser(description="VAD audio recorder")
+    parser.add_argument("--capture", choices=["read", "callback"], default=CAPTURE_MODE,
+                        help="Blocking stream.read loop or stream callback feeding a bounded ring")
+    parser.add_argument("--benchmark", type=float, metavar="SECONDS",
+                        help="Compare both capture modes for SECONDS each and exit")
+    parser.add_argument("--energy-gate", action="store_true", default=GATE_ENABLED,
+                        help="Skip the VAD on frames the energy gate rules out (opt-in: changes segmentation, see README)")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark(args.benchmark, args.energy_gate)
+        return
+
     os.makedirs(OUT_DIR, exist_ok=True)
-    
+
     # Initialize audio stream and VAD
-    p, stream = initialize_audio_stream()
+    ring = FrameRing() if args.capture == "callback" else None
+    p, stream = initialize_audio_stream(ring)
     vad = webrtcvad.Vad(VAD_MODE)
     state = reset_state()
+    gate = reset_gate() if args.energy_gate else None
 
     print("Listening… Ctrl+C to stop.")
     try:
-        while True:
-            # Read audio frame
-            data = stream.read(FRAME_SAMPLES, exception_on_overflow=False)
-            if len(data) != FRAME_BYTES:
-                continue
-            
-            # Process the audio frame
-            if process_audio_frame(data, vad, state):
-                state = reset_state()
-                    
+        if ring is None:
+            run_read_loop(stream, vad, state, gate=gate)
+        else:
+            run_callback_loop(ring, vad, state, gate=gate)
     except KeyboardInterrupt:
         pass
     finally:
         stream.stop_stream()
         stream.close()
         p.terminate()
+        if gate is not None:
+            print(gate_stats(gate))
+        if ring is not None:
+            print(f"Ring overflows: {ring.overflows} frames dropped, {ring.input_overflows} input overflows")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
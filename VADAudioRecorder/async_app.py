@@ -0,0 +1,154 @@
+import argparse, asyncio, os, signal
+import pyaudio, webrtcvad
+
+from app import (SAMPLE_RATE, CHANNELS, SAMPLE_WIDTH, VAD_MODE, OUT_DIR, FRAME_SAMPLES, FRAME_BYTES,
+                 MIN_FRAMES, GATE_ENABLED, get_filepath, mp3_command, reset_state, reset_gate,
+                 gate_stats, process_audio_frame, warn_ffmpeg_missing)
+
+# asyncio engine for the VAD recorder:
+# - PyAudio's callback thread hands frames to the event loop through a thread-safe bridge
+# - each input stream runs the same state machine as app.py (process_audio_frame)
+# - finished segments are encoded with asyncio.create_subprocess_exec, so one loop
+#   supervises many streams and encoders without blocking reads or polling timeouts
+
+MAX_ENCODERS = 2             # Concurrent ffmpeg processes
+QUEUE_FRAMES = 100           # Frames buffered per stream (3 s at 30 ms) before dropping
+
+class FrameBridge:
+    """Thread-safe handoff from the PyAudio callback thread into an asyncio.Queue"""
+    def __init__(self, loop):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=QUEUE_FRAMES)
+        self.dropped = 0
+
+    def push(self, data):
+        """Called on the audio thread"""
+        try:
+            self.loop.call_soon_threadsafe(self._put, data)
+        except RuntimeError:
+            pass  # Loop already closed
+
+    def _put(self, data):
+        try:
+            self.queue.put_nowait(data)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+class AsyncEncoder:
+    """Runs ffmpeg encodes as subprocesses on the event loop, bounded by a semaphore"""
+    def __init__(self, max_procs=MAX_ENCODERS):
+        self.sem = asyncio.Semaphore(max_procs)
+        self.tasks = set()
+
+    def submit(self, path, raw_pcm: bytes):
+        task = asyncio.get_running_loop().create_task(self._encode(path, raw_pcm))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _encode(self, path, raw_pcm):
+        async with self.sem:
+            try:
+                proc = await asyncio.create_subprocess_exec(
+                    *mp3_command(path), stdin=asyncio.subprocess.PIPE,
+                    stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL)
+            except FileNotFoundError:
+                # join() gathers with return_exceptions=True, so report it here
+                warn_ffmpeg_missing(path)
+                return
+            try:
+                await proc.communicate(raw_pcm)
+            except BrokenPipeError:
+                pass
+        print("Saved:", path)
+
+    async def join(self):
+        while self.tasks:
+            await asyncio.gather(*list(self.tasks), return_exceptions=True)
+
+def open_callback_stream(p, device_index, bridge):
+    """Open a PyAudio input stream that pushes each frame into the bridge"""
+    def callback(in_data, frame_count, time_info, status):
+        bridge.push(in_data)
+        return (None, pyaudio.paContinue)
+
+    return p.open(format=p.get_format_from_width(SAMPLE_WIDTH),
+                  channels=CHANNELS,
+                  rate=SAMPLE_RATE,
+                  input=True,
+                  input_device_index=device_index,
+                  frames_per_buffer=FRAME_SAMPLES,
+                  stream_callback=callback)
+
+async def run_stream(p, device_index, out_dir, vad_mode, encoder, bridge, energy_gate=GATE_ENABLED):
+    """Drive the VAD state machine for one input stream until the bridge yields None"""
+    vad = webrtcvad.Vad(vad_mode)
+    state = reset_state()
+    gate = reset_gate() if energy_gate else None
+
+    def save(state):
+        # Same rule as save_recording, but the encode runs asynchronously
+        if len(state['seg_frames']) >= MIN_FRAMES:
+            outpath = get_filepath(state['seg_start_ts'], out_dir)
+            encoder.submit(outpath, b"".join(state['seg_frames']))
+            print("Recording stopped. Encoding:", outpath)
+
+    stream = open_callback_stream(p, device_index, bridge)
+    try:
+        while True:
+            data = await bridge.queue.get()
+            if data is None:
+                break
+            if len(data) != FRAME_BYTES:
+                continue
+            if process_audio_frame(data, vad, state, save=save, gate=gate):
+                state = reset_state()
+    finally:
+        stream.stop_stream()
+        stream.close()
+        if gate is not None:
+            print(f"Stream {device_index}: {gate_stats(gate)}")
+
+async def main_async(devices, out_dir, vad_mode, max_encoders, energy_gate=GATE_ENABLED):
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    p = pyaudio.PyAudio()
+    encoder = AsyncEncoder(max_encoders)
+    bridges, tasks = [], []
+    for device_index in devices:
+        # One sub-directory per device when supervising several streams
+        dev_dir = out_dir if len(devices) == 1 else os.path.join(out_dir, f"dev{device_index}")
+        os.makedirs(dev_dir, exist_ok=True)
+        bridge = FrameBridge(loop)
+        bridges.append(bridge)
+        tasks.append(loop.create_task(run_stream(p, device_index, dev_dir, vad_mode, encoder, bridge, energy_gate)))
+
+    print(f"Listening on {len(devices)} stream(s)… Ctrl+C to stop.")
+    try:
+        await stop.wait()
+    finally:
+        for bridge in bridges:
+            await bridge.queue.put(None)
+        await asyncio.gather(*tasks)
+        await encoder.join()
+        p.terminate()
+        for device_index, bridge in zip(devices, bridges):
+            print(f"Stream {device_index}: dropped {bridge.dropped} frames")
+
+def main():
+    parser = argparse.ArgumentParser(description="asyncio VAD recorder")
+    parser.add_argument("--device", type=int, action="append",
+                        help="PyAudio input device index (repeat for several streams; default device if omitted)")
+    parser.add_argument("--out-dir", default=OUT_DIR, help="Output directory")
+    parser.add_argument("--vad-mode", type=int, default=VAD_MODE, help="VAD aggressiveness 0-3")
+    parser.add_argument("--max-encoders", type=int, default=MAX_ENCODERS, help="Concurrent ffmpeg processes")
+    parser.add_argument("--energy-gate", action="store_true", default=GATE_ENABLED,
+                        help="Skip the VAD on frames the energy gate rules out (opt-in: changes segmentation, see README)")
+    args = parser.parse_args()
+
+    asyncio.run(main_async(args.device or [None], args.out_dir, args.vad_mode, args.max_encoders, args.energy_gate))
+
+if __name__ == "__main__":
+    main()
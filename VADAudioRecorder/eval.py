@@ -0,0 +1,203 @@
+import argparse, collections, concurrent.futures, contextlib, csv, io, itertools, os, sys, time, wave
+import webrtcvad
+
+import app
+
+# Offline parameter sweep for the VAD recorder:
+# - replays a labeled corpus through app.process_audio_frame (the exact live state machine)
+# - each parameter set runs in a worker process, which patches app's module constants
+# - segments are "stored" by the same MIN_FRAMES rule as save_recording, nothing is encoded
+#
+# Corpus layout: <dir>/<name>.wav (16 kHz mono 16-bit) with <dir>/<name>.txt speech labels,
+# one "start<TAB>end[<TAB>label]" line per interval in seconds (Audacity label export format).
+
+PARAM_NAMES = ("vad_mode", "start_k", "start_n", "pre_roll_s", "post_roll_s", "gate")
+METRIC_NAMES = ("precision", "recall", "clipped_rate", "speech_coverage", "stored_ratio", "segments",
+                "skip_rate", "cpu_s_per_audio_h")
+
+_corpus = None  # [(name, frames, speech_intervals)], loaded once per worker
+
+def load_labels(path):
+    """Read speech intervals (start, end) in seconds from an Audacity-style label file"""
+    intervals = []
+    with open(path) as f:
+        for line in f:
+            fields = line.split()
+            if len(fields) < 2 or fields[0].startswith("#"):
+                continue
+            start, end = float(fields[0]), float(fields[1])
+            if end > start:
+                intervals.append((start, end))
+    return sorted(intervals)
+
+def load_wav_frames(path):
+    """Split a 16 kHz mono 16-bit WAV into FRAME_BYTES frames (a trailing partial frame is dropped)"""
+    with wave.open(path, "rb") as wf:
+        if (wf.getframerate(), wf.getnchannels(), wf.getsampwidth()) != (app.SAMPLE_RATE, app.CHANNELS, app.SAMPLE_WIDTH):
+            raise ValueError(f"{path}: expected {app.SAMPLE_RATE} Hz, {app.CHANNELS} channel(s), "
+                             f"{app.SAMPLE_WIDTH * 8}-bit PCM")
+        pcm = wf.readframes(wf.getnframes())
+    n = len(pcm) // app.FRAME_BYTES
+    return [pcm[i * app.FRAME_BYTES:(i + 1) * app.FRAME_BYTES] for i in range(n)]
+
+def load_corpus(corpus_dir):
+    """Load every <name>.wav that has a matching <name>.txt label file"""
+    items = []
+    for fname in sorted(os.listdir(corpus_dir)):
+        name, ext = os.path.splitext(fname)
+        labels = os.path.join(corpus_dir, name + ".txt")
+        if ext.lower() != ".wav" or not os.path.exists(labels):
+            continue
+        items.append((name, load_wav_frames(os.path.join(corpus_dir, fname)), load_labels(labels)))
+    return items
+
+def _init_worker(corpus_dir):
+    global _corpus
+    _corpus = load_corpus(corpus_dir)
+
+def apply_params(params):
+    """Patch the constants that app's state machine reads at call time"""
+    app.VAD_MODE = params["vad_mode"]
+    app.START_K = params["start_k"]
+    app.START_N = params["start_n"]
+    app.PRE_ROLL_S = params["pre_roll_s"]
+    app.POST_ROLL_S = params["post_roll_s"]
+    app.PRE_FRAMES = int(app.PRE_ROLL_S * 1000 / app.FRAME_MS)
+    app.HANG_FRAMES = int(app.POST_ROLL_S * 1000 / app.FRAME_MS)
+
+def replay(frames, vad, gate=None):
+    """Run the state machine over one file; return stored segments as (start, end) seconds"""
+    frame_s = app.FRAME_MS / 1000
+    segments = []
+    index = 0
+
+    def save(state):
+        # Same rule as save_recording; the segment ends with the current frame
+        n = len(state['seg_frames'])
+        if n >= app.MIN_FRAMES:
+            segments.append(((index + 1 - n) * frame_s, (index + 1) * frame_s))
+
+    state = app.reset_state()
+    with contextlib.redirect_stdout(io.StringIO()):  # Silence "Recording started."
+        for index, data in enumerate(frames):
+            if app.process_audio_frame(data, vad, state, save=save, gate=gate):
+                state = app.reset_state()
+        if state['collecting']:
+            save(state)  # Segment still open at end of file, as if the recorder were stopped
+    return segments
+
+def overlap(a, b):
+    return max(0.0, min(a[1], b[1]) - max(a[0], b[0]))
+
+def score(segments, speech):
+    """Per-file counts for segment precision/recall and clipped speech"""
+    hits = sum(1 for s in segments if any(overlap(s, sp) > 0 for sp in speech))
+    found = 0
+    clipped = 0
+    covered = 0.0
+    for sp in speech:
+        c = sum(overlap(s, sp) for s in segments)  # Stored segments never overlap each other
+        covered += c
+        if c > 0:
+            found += 1
+        if c < (sp[1] - sp[0]) - 1e-6:
+            clipped += 1
+    return {
+        "segments": len(segments), "hits": hits, "speech": len(speech), "found": found,
+        "clipped": clipped, "speech_s": sum(e - s for s, e in speech), "covered_s": covered,
+        "stored_s": sum(e - s for s, e in segments),
+    }
+
+def evaluate(params):
+    """Replay the whole corpus with one parameter set (runs in a worker process)"""
+    apply_params(params)
+    totals = collections.Counter()
+    audio_s = 0.0
+    cpu0 = time.process_time()
+    for _, frames, speech in _corpus:
+        vad = webrtcvad.Vad(params["vad_mode"])
+        gate = app.reset_gate() if params["gate"] else None
+        for key, value in score(replay(frames, vad, gate), speech).items():
+            totals[key] += value
+        if gate is not None:
+            totals["skipped"] += gate['skipped']
+        totals["frames"] += len(frames)
+        audio_s += len(frames) * app.FRAME_MS / 1000
+    cpu_s = time.process_time() - cpu0
+
+    return {
+        **params,
+        "precision": totals["hits"] / totals["segments"] if totals["segments"] else 1.0,
+        "recall": totals["found"] / totals["speech"] if totals["speech"] else 1.0,
+        "clipped_rate": totals["clipped"] / totals["speech"] if totals["speech"] else 0.0,
+        "speech_coverage": totals["covered_s"] / totals["speech_s"] if totals["speech_s"] else 1.0,
+        "stored_ratio": totals["stored_s"] / audio_s if audio_s else 0.0,
+        "segments": totals["segments"],
+        "skip_rate": totals["skipped"] / totals["frames"] if totals["frames"] else 0.0,
+        "cpu_s_per_audio_h": cpu_s / (audio_s / 3600) if audio_s else 0.0,
+    }
+
+def parameter_grid(args):
+    """Cartesian product of the swept values, skipping sets where START_K > START_N"""
+    for values in itertools.product(args.vad_mode, args.start_k, args.start_n, args.pre_roll, args.post_roll, args.gate):
+        params = dict(zip(PARAM_NAMES, values))
+        if params["start_k"] <= params["start_n"]:
+            yield params
+
+COLUMNS = [("vad_mode", "mode", "{}"), ("start_k", "K", "{}"), ("start_n", "N", "{}"),
+           ("pre_roll_s", "pre", "{:.1f}"), ("post_roll_s", "post", "{:.1f}"),
+           ("precision", "prec", "{:.3f}"), ("recall", "recall", "{:.3f}"),
+           ("clipped_rate", "clipped", "{:.3f}"), ("speech_coverage", "cover", "{:.3f}"),
+           ("stored_ratio", "stored", "{:.3f}"), ("segments", "segs", "{}"),
+           ("gate", "gate", "{}"), ("skip_rate", "skipped", "{:.3f}"),
+           ("cpu_s_per_audio_h", "cpu s/h", "{:.1f}")]
+
+def print_table(rows):
+    cells = [[fmt.format(row[key]) for key, _, fmt in COLUMNS] for row in rows]
+    widths = [max([len(title)] + [len(c[i]) for c in cells]) for i, (_, title, _) in enumerate(COLUMNS)]
+    print("  ".join(title.rjust(w) for (_, title, _), w in zip(COLUMNS, widths)))
+    for c in cells:
+        print("  ".join(v.rjust(w) for v, w in zip(c, widths)))
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep VAD recorder parameters over a labeled corpus")
+    parser.add_argument("corpus", help="Directory of <name>.wav files with <name>.txt speech labels")
+    parser.add_argument("--vad-mode", type=int, nargs="+", default=[app.VAD_MODE], help="VAD aggressiveness values")
+    parser.add_argument("--start-k", type=int, nargs="+", default=[app.START_K], help="START_K values")
+    parser.add_argument("--start-n", type=int, nargs="+", default=[app.START_N], help="START_N values")
+    parser.add_argument("--pre-roll", type=float, nargs="+", default=[app.PRE_ROLL_S], help="PRE_ROLL_S values")
+    parser.add_argument("--post-roll", type=float, nargs="+", default=[app.POST_ROLL_S], help="POST_ROLL_S values")
+    parser.add_argument("--gate", type=int, nargs="+", choices=[0, 1], default=[int(app.GATE_ENABLED)],
+                        help="Energy gate off/on (0 1 compares both)")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(), help="Worker processes")
+    parser.add_argument("--sort", choices=[key for key, _, _ in COLUMNS], help="Sort results by this column")
+    parser.add_argument("--csv", help="Also write the results to this CSV file")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    if not corpus:
+        sys.exit(f"No labeled WAV files in {args.corpus}")
+    audio_h = sum(len(frames) for _, frames, _ in corpus) * app.FRAME_MS / 1000 / 3600
+    grid = list(parameter_grid(args))
+    if not grid:
+        sys.exit("No parameter sets to evaluate (every --start-k is greater than every --start-n)")
+    print(f"Corpus: {len(corpus)} file(s), {audio_h:.2f} h audio; {len(grid)} parameter set(s), {args.jobs} worker(s)")
+    del corpus
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=args.jobs, initializer=_init_worker,
+                                                initargs=(args.corpus,)) as pool:
+        rows = list(pool.map(evaluate, grid))
+
+    if args.sort:
+        rows.sort(key=lambda row: row[args.sort], reverse=args.sort in ("precision", "recall", "speech_coverage"))
+    print_table(rows)
+
+    if args.csv:
+        with open(args.csv, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=PARAM_NAMES + METRIC_NAMES)
+            writer.writeheader()
+            writer.writerows(rows)
+        print("Wrote", args.csv)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,340 @@
+import argparse, collections, json, os, socket, stat, sys, threading, time, wave
+import webrtcvad
+
+import app
+
+# Live segment publishing for the VAD recorder:
+# - runs the same capture loop and state machine as app.py
+# - while a segment is being recorded, its PCM is published every CHUNK_MS to subscribers
+#   on a Unix socket, so downstream consumers get audio while the person is still speaking
+# - each subscriber has a bounded queue and its own sender thread; a slow subscriber loses
+#   chunks (or is disconnected) without stalling capture or the other subscribers
+#
+# Wire format: one JSON header line per event, followed by `bytes` bytes of s16le PCM.
+#   {"type": "hello", "sample_rate", "channels", "sample_width", "format", "chunk_ms"}
+#   {"type": "segment-start", "seg", "start_ts", "late"}
+#   {"type": "chunk", "seg", "seq", "offset_ms", "ts", "bytes", "dropped"}
+#   {"type": "segment-end", "seg", "frames", "stored", "path"}
+
+def default_socket_path():
+    """$VADRECORDER_SOCKET, else the per-user $XDG_RUNTIME_DIR, else a per-user name in /tmp"""
+    if os.environ.get("VADRECORDER_SOCKET"):
+        return os.environ["VADRECORDER_SOCKET"]
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir and os.path.isdir(runtime_dir):
+        return os.path.join(runtime_dir, "vadrecorder.sock")
+    return f"/tmp/vadrecorder-{os.getuid()}.sock"
+
+SOCKET_PATH = default_socket_path()
+CHUNK_MS = 300               # Publish interval while a segment is open
+QUEUE_EVENTS = 64            # Events buffered per subscriber before chunks are dropped
+SLOW_POLICY = "drop"         # "drop": drop oldest chunks, "disconnect": close the subscriber
+
+def encode_event(header, payload=b""):
+    header = dict(header, bytes=len(payload))
+    return json.dumps(header).encode() + b"\n" + payload
+
+class Subscriber:
+    """One connected client: a bounded event queue drained by a sender thread"""
+    def __init__(self, conn, policy):
+        self.conn = conn
+        self.policy = policy
+        self.events = collections.deque()
+        self.cond = threading.Condition()
+        self.closed = False
+        self.catch_up = False   # Joined mid-segment; the next chunk carries the whole segment so far
+        self.dropped = 0        # Chunks dropped since the last delivered chunk
+        self.dropped_total = 0
+        self.thread = threading.Thread(target=self._send_loop, daemon=True)
+        self.thread.start()
+
+    def push(self, header, payload=b""):
+        """Called on the capture thread; never blocks on the socket"""
+        with self.cond:
+            if self.closed:
+                return
+            if len(self.events) >= QUEUE_EVENTS:
+                if self.policy == "disconnect" or not self._drop_oldest_chunk():
+                    self._close_locked()
+                    return
+            self.events.append((header, payload))
+            self.cond.notify()
+
+    def _drop_oldest_chunk(self):
+        # Segment boundaries are always delivered; only chunks are dropped
+        for i, (header, _) in enumerate(self.events):
+            if header['type'] == "chunk":
+                del self.events[i]
+                self.dropped += 1
+                self.dropped_total += 1
+                return True
+        return False
+
+    def _send_loop(self):
+        while True:
+            with self.cond:
+                while not self.events and not self.closed:
+                    self.cond.wait()
+                if self.closed:
+                    return
+                header, payload = self.events.popleft()
+                if header['type'] == "chunk":
+                    header = dict(header, dropped=self.dropped)
+                    self.dropped = 0
+            try:
+                self.conn.sendall(encode_event(header, payload))
+            except OSError:
+                self.close()
+                return
+
+    def _close_locked(self):
+        self.closed = True
+        self.cond.notify()
+        try:
+            self.conn.close()
+        except OSError:
+            pass
+
+    def close(self):
+        with self.cond:
+            self._close_locked()
+
+def remove_stale_socket(path):
+    """Remove a socket left behind by a publisher that is no longer running.
+    Raises RuntimeError if the path is not a socket or a publisher still answers on it."""
+    try:
+        mode = os.lstat(path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise RuntimeError(f"{path} exists and is not a socket")
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except (ConnectionRefusedError, FileNotFoundError):
+        os.remove(path)
+        return
+    finally:
+        probe.close()
+    raise RuntimeError(f"A publisher is already listening on {path}")
+
+class SegmentPublisher:
+    """Accepts subscribers on a Unix socket and fans segment events out to them"""
+    def __init__(self, path=SOCKET_PATH, chunk_ms=CHUNK_MS, policy=SLOW_POLICY):
+        self.path = path
+        self.chunk_frames = max(1, chunk_ms // app.FRAME_MS)
+        self.policy = policy
+        self.subscribers = []
+        self.lock = threading.Lock()
+        self.seg = 0
+        self.seq = 0
+        self.sent = 0           # Frames of the open segment already published
+        self.open = False
+        self.start_ts = None
+
+        remove_stale_socket(path)
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        # Owner-only: subscribers receive the raw microphone audio
+        umask = os.umask(0o177)
+        try:
+            self.server.bind(path)
+        finally:
+            os.umask(umask)
+        os.chmod(path, 0o600)
+        self.server.listen()
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+
+    def _accept_loop(self):
+        while True:
+            try:
+                conn, _ = self.server.accept()
+            except OSError:
+                return  # Server socket closed
+            sub = Subscriber(conn, self.policy)
+            sub.push({'type': "hello", 'sample_rate': app.SAMPLE_RATE, 'channels': app.CHANNELS,
+                      'sample_width': app.SAMPLE_WIDTH, 'format': "s16le", 'chunk_ms': self.chunk_frames * app.FRAME_MS})
+            with self.lock:
+                if self.open:
+                    sub.push(self._start_header(late=True))
+                    sub.catch_up = True
+                self.subscribers.append(sub)
+
+    def _start_header(self, late=False):
+        return {'type': "segment-start", 'seg': self.seg, 'start_ts': self.start_ts.isoformat(), 'late': late}
+
+    def _broadcast(self, header, payload=b""):
+        # Called with self.lock held
+        self.subscribers = [s for s in self.subscribers if not s.closed]
+        for sub in self.subscribers:
+            sub.push(header, payload)
+
+    def progress(self, state):
+        """Call after every frame: publishes segment-start and due chunks"""
+        if not state['collecting']:
+            return
+        with self.lock:
+            if not self.open:
+                self.open = True
+                self.seg += 1
+                self.seq = 0
+                self.sent = 0
+                self.start_ts = state['seg_start_ts']
+                self._broadcast(self._start_header())
+            if len(state['seg_frames']) - self.sent >= self.chunk_frames:
+                self._publish_chunk(state['seg_frames'])
+
+    def _publish_chunk(self, seg_frames):
+        # Called with self.lock held
+        header = {'type': "chunk", 'seg': self.seg, 'seq': self.seq,
+                  'offset_ms': self.sent * app.FRAME_MS, 'ts': time.time()}
+        payload = b"".join(seg_frames[self.sent:])
+        self.subscribers = [s for s in self.subscribers if not s.closed]
+        for sub in self.subscribers:
+            if sub.catch_up:
+                sub.catch_up = False
+                sub.push(dict(header, offset_ms=0), b"".join(seg_frames))
+            elif payload:
+                sub.push(header, payload)
+        self.seq += 1
+        self.sent = len(seg_frames)
+
+    def finish(self, state, path=None):
+        """Call from the save callback: flushes the tail and publishes segment-end"""
+        with self.lock:
+            if not self.open:
+                return
+            if len(state['seg_frames']) > self.sent or any(s.catch_up for s in self.subscribers):
+                self._publish_chunk(state['seg_frames'])
+            self._broadcast({'type': "segment-end", 'seg': self.seg, 'frames': len(state['seg_frames']),
+                             'stored': path is not None, 'path': path})
+            self.open = False
+
+    def close(self, drain_s=1.0):
+        """Stop accepting, give subscribers a moment to receive queued events, then disconnect"""
+        self.server.close()
+        deadline = time.monotonic() + drain_s
+        while any(s.events and not s.closed for s in self.subscribers) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        with self.lock:
+            for sub in self.subscribers:
+                sub.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+def publish(args):
+    """Capture loop of app.main with live publishing"""
+    os.makedirs(args.out_dir, exist_ok=True)
+    try:
+        pub = SegmentPublisher(args.socket, args.chunk_ms, args.slow_policy)
+    except RuntimeError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    p, stream = app.initialize_audio_stream()
+    vad = webrtcvad.Vad(args.vad_mode)
+    state = app.reset_state()
+    gate = app.reset_gate() if args.energy_gate else None
+
+    def save(state):
+        path = None
+        if not args.no_save and len(state['seg_frames']) >= app.MIN_FRAMES:
+            path = app.get_filepath(state['seg_start_ts'], args.out_dir)
+        # segment-end goes out before the (blocking) encode
+        pub.finish(state, path)
+        if path is not None:
+            if app.save_as_mp3(path, b"".join(state['seg_frames'])):
+                print("Recording stopped. Saved:", path)
+
+    print(f"Publishing on {args.socket}… Ctrl+C to stop.")
+    try:
+        while True:
+            data = stream.read(app.FRAME_SAMPLES, exception_on_overflow=False)
+            if len(data) != app.FRAME_BYTES:
+                continue
+            if app.process_audio_frame(data, vad, state, save=save, gate=gate):
+                state = app.reset_state()
+            else:
+                pub.progress(state)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if state['collecting']:
+            pub.finish(state)
+        stream.stop_stream()
+        stream.close()
+        p.terminate()
+        pub.close()
+        for sub in pub.subscribers:
+            if sub.dropped_total:
+                print(f"Subscriber dropped {sub.dropped_total} chunks")
+
+def read_event(f):
+    """Read one event from a subscriber connection; returns (header, payload) or None at EOF"""
+    line = f.readline()
+    if not line:
+        return None
+    header = json.loads(line)
+    payload = f.read(header['bytes']) if header['bytes'] else b""
+    return header, payload
+
+def subscribe(args):
+    """Example subscriber: prints events and latency, optionally writes each segment to a WAV"""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(args.socket)
+    f = sock.makefile("rb")
+    wf = None
+    hello = {}
+    try:
+        while (event := read_event(f)) is not None:
+            header, payload = event
+            kind = header['type']
+            if kind == "hello":
+                hello = header
+            elif kind == "segment-start":
+                print(f"segment {header['seg']} started at {header['start_ts']}" + (" (joined late)" if header['late'] else ""))
+                if args.out_dir:
+                    os.makedirs(args.out_dir, exist_ok=True)
+                    wf = wave.open(os.path.join(args.out_dir, f"live{header['seg']:05d}.wav"), "wb")
+                    wf.setnchannels(hello['channels'])
+                    wf.setsampwidth(hello['sample_width'])
+                    wf.setframerate(hello['sample_rate'])
+            elif kind == "chunk":
+                latency_ms = (time.time() - header['ts']) * 1000
+                print(f"  chunk {header['seq']} @{header['offset_ms']} ms, {len(payload)} bytes, "
+                      f"latency {latency_ms:.1f} ms" + (f", {header['dropped']} dropped" if header['dropped'] else ""))
+                if wf is not None:
+                    wf.writeframes(payload)
+            elif kind == "segment-end":
+                print(f"segment {header['seg']} ended: {header['frames']} frames, stored={header['path']}")
+                if wf is not None:
+                    wf.close()
+                    wf = None
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if wf is not None:
+            wf.close()
+        sock.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="VAD recorder with live segment publishing")
+    parser.add_argument("--socket", default=SOCKET_PATH, help="Unix socket path")
+    parser.add_argument("--subscribe", action="store_true", help="Connect to a running publisher instead")
+    parser.add_argument("--out-dir", default=None,
+                        help=f"Publisher: MP3 output directory (default {app.OUT_DIR}); subscriber: write segments as WAV here")
+    parser.add_argument("--chunk-ms", type=int, default=CHUNK_MS, help="Chunk interval while speaking")
+    parser.add_argument("--slow-policy", choices=["drop", "disconnect"], default=SLOW_POLICY,
+                        help="What to do when a subscriber's queue is full")
+    parser.add_argument("--vad-mode", type=int, default=app.VAD_MODE, help="VAD aggressiveness 0-3")
+    parser.add_argument("--no-save", action="store_true", help="Publish only, don't write MP3 files")
+    parser.add_argument("--energy-gate", action="store_true", default=app.GATE_ENABLED,
+                        help="Skip the VAD on frames the energy gate rules out (opt-in: changes segmentation, see README)")
+    args = parser.parse_args()
+
+    if args.subscribe:
+        subscribe(args)
+    else:
+        args.out_dir = args.out_dir or app.OUT_DIR
+        publish(args)
+
+if __name__ == "__main__":
+    main()